@@ -2,25 +2,43 @@ import json
 import os
 import hashlib
 from passlib.hash import bcrypt
+from config import Config
+from config_store import JsonFileStore
 
 JSON_FILE = "kode.json"
 
+def validate_codes(entries):
+    """kode.json: [{"name": str, "code": str, "mode": str (optional)}, ...]"""
+    if not isinstance(entries, list):
+        raise ValueError("codes must be a list")
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not isinstance(entry.get("code"), str):
+            raise ValueError(f"entry {i} needs a code")
+        if "mode" in entry and not isinstance(entry["mode"], str):
+            raise ValueError(f"entry {i}: mode must be a string")
+
+def index_codes(entries):
+    """code -> entry (the first entry wins when a code is listed twice)"""
+    index = {}
+    for entry in entries:
+        index.setdefault(entry["code"], entry)
+    return index
+
+# Loaded once, reloaded when kode.json changes
+_codes = JsonFileStore(
+    JSON_FILE,
+    validate=validate_codes,
+    build_index=index_codes,
+    default=[],
+    check_interval=Config.CONFIG_RELOAD_SECONDS
+)
+
 def load_codes():
     """Load codes from JSON file"""
-    if not os.path.exists(JSON_FILE):
-        return []
-    
-    with open(JSON_FILE, "r") as f:
-        return json.load(f)
+    return _codes.get()
 
 def get_code(code: str):
-    entries = load_codes()
-    
-    for entry in entries:
-        if entry["code"] == code:
-            return entry
-    
-    return False
+    return _codes.index().get(code, False)
 
 def authenticate(username: str, code: str) -> bool:
     """Verify code"""
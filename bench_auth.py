@@ -0,0 +1,72 @@
+"""Login cost against the number of access codes: reading kode.json on every login vs the in-memory index.
+
+Writes generated code files to a temporary directory, so the real kode.json is not touched:
+
+    python bench_auth.py --sizes 100 1000 10000 50000 --logins 200
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+from auth import validate_codes, index_codes
+from config_store import JsonFileStore
+
+
+def write_codes(path, count):
+    entries = [{"name": f"skupina{i}", "code": f"koda-{i:06d}", "mode": "pro1"} for i in range(count)]
+    with open(path, "w") as f:
+        json.dump(entries, f)
+    return [entry["code"] for entry in entries]
+
+
+def old_login(path, code):
+    """The previous auth_callback: authenticate() and get_code() both re-read and scan the file"""
+    def get_code(code):
+        with open(path, "r") as f:
+            entries = json.load(f)
+        for entry in entries:
+            if entry["code"] == code:
+                return entry
+        return False
+
+    if get_code(code) != False:
+        return get_code(code).get("mode", "pro1")
+    return None
+
+
+def measure(login, codes, logins, seed=1):
+    rng = random.Random(seed)
+    sample = [rng.choice(codes) for _ in range(logins)]
+    start = time.perf_counter()
+    for code in sample:
+        login(code)
+    return (time.perf_counter() - start) / logins * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login cost vs number of access codes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'codes':>8} {'file scan ms':>13} {'index ms':>10} {'index+stat ms':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path = os.path.join(directory, f"kode_{size}.json")
+            codes = write_codes(path, size)
+
+            cached = JsonFileStore(path, validate=validate_codes, build_index=index_codes, default=[])
+            checked = JsonFileStore(path, validate=validate_codes, build_index=index_codes, default=[], check_interval=0)
+            cached.index()
+            checked.index()
+
+            old_ms = measure(lambda code: old_login(path, code), codes, args.logins)
+            new_ms = measure(lambda code: cached.index().get(code, False), codes, args.logins)
+            stat_ms = measure(lambda code: checked.index().get(code, False), codes, args.logins)
+            print(f"{size:>8} {old_ms:>13.3f} {new_ms:>10.4f} {stat_ms:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
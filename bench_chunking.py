@@ -0,0 +1,92 @@
+"""Index size and retrieval quality of the chunking strategies (recursive vs structured).
+
+Without --recall only the chunks are compared (no models needed): vector count, chunk length,
+estimated vector / payload size and chunks that cut through a code block. With --recall every
+strategy is loaded into an in-memory Qdrant with the real embedding model and the labelled
+questions are run against it, with and without parent-document retrieval:
+
+    python bench_chunking.py --recall --k 3
+"""
+import json
+import tempfile
+import argparse
+from config import Config
+from chunking import STRATEGIES, split_document, chunking_stats
+from bench_retrieval import load_questions, first_hit
+
+DEFAULT_CORPORA = ["programiranje=docs/programiranje1.json", "vss=docs/vss.json"]
+
+
+def load_corpora(specs):
+    corpora = {}
+    for spec in specs:
+        collection, path = spec.split("=", 1)
+        with open(path, "r", encoding="utf-8") as f:
+            corpora[collection] = json.load(f)
+    return corpora
+
+
+def print_sizes(corpora, dimension):
+    print(f"{'strategy':<11} {'collection':<14} {'vectors':>8} {'avg chars':>10} {'vectors MB':>11} "
+          f"{'payload MB':>11} {'cut code':>9}")
+    for strategy in STRATEGIES:
+        for collection, texts in corpora.items():
+            docs = [doc for text in texts for doc in split_document(text, strategy, Config.CHUNK_MAX_CHARS)]
+            stats = chunking_stats(docs, dimension)
+            print(f"{strategy:<11} {collection:<14} {stats['vectors']:>8} {stats['avg_chars']:>10} "
+                  f"{stats['vector_mb']:>11.3f} {stats['payload_mb']:>11.3f} {stats['broken_code_blocks']:>9}")
+
+
+def print_recall(corpora, questions, k):
+    # In-memory Qdrant, away from the real versions file and BM25 indexes
+    workdir = tempfile.mkdtemp(prefix="klepetalnik-chunking-")
+    Config.RAG_VERSIONS_FILE = f"{workdir}/rag_versions.json"
+    Config.RAG_INDEX_DIR = f"{workdir}/rag_index"
+    Config.RAG_CACHE = False
+    from rag import RAG
+    from hybrid_retrieval import DEFAULT_RETRIEVAL
+
+    print(f"\n{len(questions)} questions, k={k}")
+    print(f"{'strategy':<22} {'recall@k':>9} {'MRR':>6} {'context chars':>14}")
+    for strategy in STRATEGIES:
+        Config.CHUNKING = strategy
+        rag = RAG(qdrant_url=":memory:", embedding_model=Config.EMBEDDING_MODEL, llama_model=Config.DEFAULT_LLAMA_MODEL)
+        for collection, texts in corpora.items():
+            rag.dodaj(texts, collection)
+
+        configurations = [(strategy, None)]
+        if strategy == "structured":
+            configurations.append((f"{strategy} + parents", dict(DEFAULT_RETRIEVAL, parents=True)))
+        for name, retrieval in configurations:
+            found = 0
+            reciprocal_ranks = 0.0
+            context_chars = 0
+            for question in questions:
+                docs = rag.retrieve(question["collection"], question["question"], k=k, retrieval=retrieval)
+                context_chars += sum(len(doc.page_content) for doc in docs)
+                rank = first_hit(docs, question["expected"])
+                if rank:
+                    found += 1
+                    reciprocal_ranks += 1 / rank
+            print(f"{name:<22} {found / len(questions):>9.2f} {reciprocal_ranks / len(questions):>6.2f} "
+                  f"{context_chars / len(questions):>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunking strategies")
+    parser.add_argument("--corpus", action="append", metavar="COLLECTION=FILE", help="Default: the course material in docs/")
+    parser.add_argument("--questions", default="docs/eval_questions.jsonl")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dimension", type=int, default=384, help="Vector size for the size estimate")
+    parser.add_argument("--recall", action="store_true", help="Also embed the chunks and measure recall (needs the embedding model)")
+    args = parser.parse_args()
+
+    corpora = load_corpora(args.corpus or DEFAULT_CORPORA)
+    print_sizes(corpora, args.dimension)
+    if args.recall:
+        questions = [question for question in load_questions(args.questions) if question["collection"] in corpora]
+        print_recall(corpora, questions, args.k)
+
+
+if __name__ == "__main__":
+    main()
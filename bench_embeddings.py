@@ -0,0 +1,115 @@
+"""Cold start, memory and throughput of the embedding backends (torch, onnx, int8).
+
+Every backend is measured in a fresh process, so the cold start includes importing torch or
+onnxruntime. The vectors are compared with the torch backend: same dimension and a cosine
+similarity close to 1 mean existing collections keep working without a rebuild.
+
+    python bench_embeddings.py --backends torch onnx int8 --queries 200
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+from config import Config
+from metrics import rss_mb
+
+SAMPLE_TEXTS = [
+    "Kako napišem zanko for v Pythonu?",
+    "Kaj je rekurzija in kdaj jo uporabimo?",
+    "def vsota(seznam):\n    return sum(seznam)",
+    "Naloga: napiši funkcijo, ki vrne največji element seznama.",
+    "Razlika med seznamom in terko",
+]
+
+
+def load_queries(path, count):
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                queries.append(json.loads(line)["question"])
+    # Repeat the question set up to the requested count
+    return [queries[i % len(queries)] for i in range(count)]
+
+
+def measure(backend, model, queries, batch_size):
+    """Runs in the child process, returns the measurements as a dict"""
+    start = time.perf_counter()
+    from embedding_backends import load_embeddings
+    embeddings = load_embeddings(model, backend)
+    embeddings.embed_query("warmup")
+    cold_start = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        embeddings.embed_query(query)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        embeddings.embed_documents(queries[i:i + batch_size])
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "cold_start_seconds": cold_start,
+        "rss_mb": rss_mb(),
+        "queries_per_second": len(queries) / single_seconds,
+        "batched_per_second": len(queries) / batch_seconds,
+        "vectors": embeddings.embed_documents(SAMPLE_TEXTS),
+    }
+
+
+def cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = sum(x * x for x in a) ** 0.5
+    norm_b = sum(y * y for y in b) ** 0.5
+    return dot / (norm_a * norm_b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "int8"])
+    parser.add_argument("--model", default=Config.EMBEDDING_MODEL)
+    parser.add_argument("--questions", default="docs/eval_questions.jsonl", help="Queries to embed")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=Config.EMBED_BATCH_SIZE)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    queries = load_queries(args.questions, args.queries)
+    if args.child:
+        print(json.dumps(measure(args.child, args.model, queries, args.batch_size)))
+        return
+
+    results = {}
+    for backend in args.backends:
+        command = [
+            sys.executable, __file__, "--child", backend, "--model", args.model, "--questions", args.questions,
+            "--queries", str(args.queries), "--batch-size", str(args.batch_size)
+        ]
+        child = subprocess.run(command, capture_output=True, text=True)
+        if child.returncode != 0:
+            print(f"{backend}: failed\n{child.stderr.strip().splitlines()[-1] if child.stderr.strip() else ''}")
+            continue
+        results[backend] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    print(f"{args.model}, {args.queries} queries, batch size {args.batch_size}")
+    print(f"{'backend':<8} {'cold s':>7} {'RSS MB':>7} {'q/s':>8} {'batch q/s':>10} {'dim':>5} {'cos vs torch':>13}")
+    reference = results.get("torch")
+    for backend, result in results.items():
+        vectors = result["vectors"]
+        similarity = "-"
+        if reference is not None and backend != "torch":
+            if len(vectors[0]) != len(reference["vectors"][0]):
+                similarity = "dim differs"
+            else:
+                similarity = f"{min(cosine(a, b) for a, b in zip(vectors, reference['vectors'])):.4f}"
+        rss = "-" if result["rss_mb"] is None else f"{result['rss_mb']:.0f}"
+        print(f"{backend:<8} {result['cold_start_seconds']:>7.2f} {rss:>7} "
+              f"{result['queries_per_second']:>8.1f} {result['batched_per_second']:>10.1f} "
+              f"{len(vectors[0]):>5} {similarity:>13}")
+
+
+if __name__ == "__main__":
+    main()
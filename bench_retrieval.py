@@ -0,0 +1,101 @@
+"""Recall and latency of dense, hybrid (BM25 + dense) and reranked retrieval on a labelled question set.
+
+Every line of the question file is {"question": ..., "collection": ..., "expected": [...]}; a question
+counts as found when one of the retrieved chunks contains one of the expected strings. The questions
+are not part of the corpus. Needs Qdrant, the collections and their BM25 indexes (update_rag.py):
+
+    python bench_retrieval.py docs/eval_questions.jsonl --k 3 --reranker
+"""
+import json
+import time
+import argparse
+from config import Config
+from hybrid_retrieval import DEFAULT_RETRIEVAL
+
+
+def load_questions(path, collection=None):
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                question = json.loads(line)
+                if collection is None or question["collection"] == collection:
+                    questions.append(question)
+    return questions
+
+
+def first_hit(docs, expected):
+    """1-based rank of the first chunk containing an expected string (0 when none does)"""
+    expected = [text.lower() for text in expected]
+    for rank, doc in enumerate(docs, start=1):
+        content = doc.page_content.lower()
+        if any(text in content for text in expected):
+            return rank
+    return 0
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run(rag, questions, name, retrieval, k, repeat):
+    latencies = []
+    found = 0
+    reciprocal_ranks = 0.0
+    for question in questions:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            docs = rag.retrieve(question["collection"], question["question"], k=k, retrieval=retrieval)
+            latencies.append((time.perf_counter() - start) * 1000)
+        rank = first_hit(docs, question["expected"])
+        if rank:
+            found += 1
+            reciprocal_ranks += 1 / rank
+
+    print(f"{name:<16} {found / len(questions):>9.2f} {reciprocal_ranks / len(questions):>6.2f} "
+          f"{percentile(latencies, 0.5):>8.1f} {percentile(latencies, 0.95):>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval recall@k and latency per retrieval mode")
+    parser.add_argument("questions", nargs="?", default="docs/eval_questions.jsonl")
+    parser.add_argument("--collection", help="Only questions for this collection")
+    parser.add_argument("--k", type=int, default=DEFAULT_RETRIEVAL["k"])
+    parser.add_argument("--candidates", type=int, default=DEFAULT_RETRIEVAL["candidates"])
+    parser.add_argument("--sparse-weight", type=float, default=DEFAULT_RETRIEVAL["sparse_weight"])
+    parser.add_argument("--reranker", nargs="?", const=Config.RERANKER_MODEL, help="Also measure hybrid + cross-encoder")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per question")
+    args = parser.parse_args()
+
+    # Measure the retrievers, not the retrieval cache
+    Config.RAG_CACHE = False
+    from rag import get_rag
+
+    questions = load_questions(args.questions, args.collection)
+    if not questions:
+        print("No questions to run")
+        return
+
+    rag = get_rag(Config.QDRANT_URL, Config.EMBEDDING_MODEL, Config.DEFAULT_LLAMA_MODEL)
+    retrieval = dict(DEFAULT_RETRIEVAL, candidates=args.candidates, sparse_weight=args.sparse_weight)
+    configurations = [
+        ("dense", None),
+        ("hybrid", dict(retrieval, mode="hybrid")),
+    ]
+    if args.reranker:
+        configurations.append(("hybrid+rerank", dict(retrieval, mode="hybrid", reranker=args.reranker)))
+
+    # Load the models and indexes before timing anything
+    for _, configuration in configurations:
+        for collection in {question["collection"] for question in questions}:
+            rag.retrieve(collection, "warmup", k=args.k, retrieval=configuration)
+
+    print(f"{len(questions)} questions, k={args.k}")
+    print(f"{'mode':<16} {'recall@k':>9} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, configuration in configurations:
+        run(rag, questions, name, configuration, args.k, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
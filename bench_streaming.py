@@ -0,0 +1,118 @@
+"""Counts websocket messages per answer for the old per-token loop and the buffered streaming loop.
+
+Uses a simulated token stream (thinking + answer, like deepseek-r1) and a fake clock,
+so it runs instantly and does not need Chainlit or Ollama:
+
+    python bench_streaming.py --think-tokens 400 --answer-tokens 250 --rate 25
+"""
+import random
+import asyncio
+import argparse
+from config import Config
+from streaming import ThinkTagParser, BufferedStreamer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingTarget:
+    """Stands in for cl.Message / cl.Step - every call is one websocket message"""
+
+    def __init__(self):
+        self.messages = 0
+        self.content = ""
+
+    async def stream_token(self, text):
+        self.messages += 1
+        self.content += text
+
+    async def update(self):
+        self.messages += 1
+
+
+def make_stream(think_tokens, answer_tokens, split_tags, seed=1):
+    rng = random.Random(seed)
+    words = ["zanka", " for", " tabela", " int", " i", " ++", " število", " vsota", ";", "\n"]
+    chunks = ["<th", "ink>"] if split_tags else ["<think>"]
+    chunks += [rng.choice(words) for _ in range(think_tokens)]
+    chunks += ["</", "think>"] if split_tags else ["</think>"]
+    chunks += [rng.choice(words) for _ in range(answer_tokens)]
+    return chunks
+
+
+async def per_token_loop(chunks):
+    """The loop on_message used before: exact tag match, stream_token + update per thinking token"""
+    step, answer = CountingTarget(), CountingTarget()
+    thinking = False
+    for content in chunks:
+        if content == "<think>":
+            thinking = True
+            continue
+        elif content == "</think>":
+            thinking = False
+            continue
+        if thinking:
+            await step.stream_token(content)
+            await step.update()
+        else:
+            await answer.stream_token(content)
+    await answer.update()
+    await step.update()
+    return step, answer
+
+
+async def buffered_loop(chunks, rate, interval, max_tokens):
+    clock = FakeClock()
+    step, answer = CountingTarget(), CountingTarget()
+    parser = ThinkTagParser()
+    thinking_stream = BufferedStreamer(step, interval, max_tokens, on_flush=step.update, clock=clock)
+    answer_stream = BufferedStreamer(answer, interval, max_tokens, clock=clock)
+
+    async def handle(segments):
+        for is_thinking, text in segments:
+            if is_thinking:
+                await thinking_stream.add(text)
+            else:
+                await thinking_stream.flush()
+                await answer_stream.add(text)
+
+    for content in chunks:
+        clock.now += 1 / rate
+        await handle(parser.feed(content))
+    await handle(parser.flush())
+    await thinking_stream.flush()
+    await answer_stream.flush()
+    await answer.update()
+    await step.update()
+    return step, answer
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Websocket messages per answer: per-token vs buffered streaming")
+    parser.add_argument("--think-tokens", type=int, default=400)
+    parser.add_argument("--answer-tokens", type=int, default=250)
+    parser.add_argument("--rate", type=float, default=25, help="Generated tokens per second")
+    parser.add_argument("--flush-ms", type=float, default=Config.STREAM_FLUSH_MS)
+    parser.add_argument("--flush-tokens", type=int, default=Config.STREAM_FLUSH_TOKENS)
+    args = parser.parse_args()
+
+    for split_tags in (False, True):
+        chunks = make_stream(args.think_tokens, args.answer_tokens, split_tags)
+        old_step, old_answer = await per_token_loop(chunks)
+        new_step, new_answer = await buffered_loop(chunks, args.rate, args.flush_ms / 1000, args.flush_tokens)
+
+        label = "tags split across chunks" if split_tags else "tags in their own chunks"
+        print(f"\n{label}:")
+        print(f"  per-token: {old_step.messages + old_answer.messages} messages "
+              f"(thinking leaked into answer: {'<th' in old_answer.content or 'ink>' in old_answer.content})")
+        print(f"  buffered:  {new_step.messages + new_answer.messages} messages "
+              f"(thinking leaked into answer: {'<th' in new_answer.content or 'ink>' in new_answer.content})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+"""Query latency, startup time and result agreement of the vector backends (qdrant, qdrant-local, embedded).
+
+The course material is loaded into Qdrant - the server at --qdrant-url (its existing collections are used
+unless --corpus is given) or, by default, an in-memory instance - and exported to the embedded NumPy index
+the way update_rag.py does it. With --qdrant-path it is also loaded into an on-disk local Qdrant. Every
+labelled question is embedded once; the backends then answer the same query vectors, so the timings are
+search only. Startup is the time from opening the backend to the first answer:
+
+    python bench_vector_backends.py --qdrant-path /tmp/qdrant-bench --k 5 --repeat 20
+    python bench_vector_backends.py --qdrant-url http://localhost:6333 --corpus programiranje=docs/programiranje1.json
+"""
+import json
+import time
+import tempfile
+import argparse
+from config import Config
+from bench_retrieval import load_questions, percentile
+
+DEFAULT_CORPORA = ["programiranje=docs/programiranje1.json", "vss=docs/vss.json"]
+
+
+def load_corpora(rag, specs):
+    collections = []
+    for spec in specs:
+        collection, path = spec.split("=", 1)
+        with open(path, "r", encoding="utf-8") as f:
+            rag.dodaj(json.load(f), collection)
+        collections.append(collection)
+    return collections
+
+
+def qdrant_backend(client):
+    # The local client does not follow aliases in queries, resolve them once like RAG does
+    aliases = {alias.alias_name: alias.collection_name for alias in client.get_aliases().aliases}
+
+    def search(collection, embedding, k):
+        points = client.query_points(
+            collection_name=aliases.get(collection, collection), query=embedding, limit=k, with_payload=False
+        ).points
+        return [str(point.id) for point in points]
+    return search
+
+
+def embedded_backend(collections):
+    from rag import vector_index_path
+    from vector_index import VectorIndex
+    indexes = {collection: VectorIndex.load(vector_index_path(collection)) for collection in collections}
+
+    def search(collection, embedding, k):
+        return [doc.metadata["_id"] for doc, _ in indexes[collection].search(embedding, k)]
+    return search
+
+
+def measure(name, open_backend, queries, k, repeat, reference):
+    start = time.perf_counter()
+    search = open_backend()
+    first = queries[0]
+    search(first[0], first[1], k)
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    results = []
+    for _ in range(repeat):
+        for collection, embedding in queries:
+            query_start = time.perf_counter()
+            ids = search(collection, embedding, k)
+            latencies.append((time.perf_counter() - query_start) * 1000)
+            if len(results) < len(queries):
+                results.append(ids)
+
+    same = overlap = 0.0
+    if reference is not None:
+        for ids, expected in zip(results, reference):
+            same += ids == expected
+            overlap += len(set(ids) & set(expected)) / max(1, len(expected))
+    return {
+        "backend": name,
+        "startup_ms": round(startup_ms, 1),
+        "p50_ms": round(percentile(latencies, 0.5), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "same_top_k": round(same / len(results), 3) if reference is not None else None,
+        "overlap": round(overlap / len(results), 3) if reference is not None else None,
+    }, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector search backends")
+    parser.add_argument("--qdrant-url", default=":memory:", help="Qdrant server to compare (default: in-memory instance)")
+    parser.add_argument("--qdrant-path", help="Also load the corpus into an on-disk local Qdrant in this directory")
+    parser.add_argument("--corpus", action="append", metavar="COLLECTION=FILE", help="Default: the course material in docs/")
+    parser.add_argument("--questions", default="docs/eval_questions.jsonl")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=10, help="Times every question is searched")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # The exported index, versions file and BM25 files go to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="klepetalnik-vectors-")
+    Config.RAG_VERSIONS_FILE = f"{workdir}/rag_versions.json"
+    Config.RAG_INDEX_DIR = f"{workdir}/rag_index"
+    Config.RAG_CACHE = False
+    Config.VECTOR_BACKEND = "qdrant"
+    from rag import RAG
+    from qdrant_client import QdrantClient
+
+    rag = RAG(qdrant_url=args.qdrant_url, embedding_model=Config.EMBEDDING_MODEL, llama_model=Config.DEFAULT_LLAMA_MODEL)
+    if args.qdrant_url == ":memory:" or args.corpus:
+        collections = load_corpora(rag, args.corpus or DEFAULT_CORPORA)
+    else:
+        collections = sorted({question["collection"] for question in load_questions(args.questions)})
+    for collection in collections:
+        rag.build_vector_index(collection)
+
+    questions = [question for question in load_questions(args.questions) if question["collection"] in collections]
+    queries = [(question["collection"], rag.embeddings.embed_query(question["question"])) for question in questions]
+    print(f"{len(queries)} questions x {args.repeat}, k={args.k}, collections: {', '.join(collections)}")
+
+    backends = []
+    if args.qdrant_url == ":memory:":
+        # Nothing to connect to, the startup time is only the first query
+        backends.append(("qdrant (in-memory)", lambda: qdrant_backend(rag.client)))
+    else:
+        backends.append(("qdrant", lambda: qdrant_backend(QdrantClient(url=args.qdrant_url))))
+    if args.qdrant_path:
+        Config.VECTOR_BACKEND = "qdrant-local"
+        Config.QDRANT_PATH = args.qdrant_path
+        local = RAG(qdrant_url=Config.QDRANT_URL, embedding_model=Config.EMBEDDING_MODEL, llama_model=Config.DEFAULT_LLAMA_MODEL)
+        load_corpora(local, args.corpus or DEFAULT_CORPORA)
+        local.client.close()  # Only one client may hold the directory
+        backends.append(("qdrant-local", lambda: qdrant_backend(QdrantClient(path=args.qdrant_path))))
+    backends.append(("embedded", lambda: embedded_backend(collections)))
+
+    rows = []
+    reference = None
+    for name, open_backend in backends:
+        row, results = measure(name, open_backend, queries, args.k, args.repeat, reference)
+        if reference is None:
+            reference = results
+        rows.append(row)
+
+    print(f"{'backend':<20} {'startup ms':>11} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'same top-k':>11} {'overlap':>8}")
+    for row in rows:
+        print(f"{row['backend']:<20} {row['startup_ms']:>11} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['mean_ms']:>8} "
+              f"{str(row['same_top_k'] if row['same_top_k'] is not None else '-'):>11} "
+              f"{str(row['overlap'] if row['overlap'] is not None else '-'):>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
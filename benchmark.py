@@ -0,0 +1,338 @@
+"""Replays recorded questions and conversations through the chat pipeline and reports where time goes.
+
+Each line of the input file is one question or one conversation:
+
+    {"question": "Kako preverim praštevilo?", "expected": ["JePrastevilo"]}
+    {"collection": "vss", "conversation": [{"question": "Kdaj so uradne ure?", "expected": ["Uradne ure"]}, "In ob petkih?"]}
+
+"expected" lists strings a relevant chunk contains ("expected_ids" lists chunk ids); both are used for
+recall@k. Retrieval, history compression and prompt assembly are the same objects on_message uses
+(pipeline.ChatPipeline), answers go through the model scheduler like in the app.
+
+    # Deterministic, no Ollama or Qdrant server: mock LLM + in-memory collections
+    python benchmark.py docs/eval_questions.jsonl --mock --corpus programiranje=docs/programiranje1.json --corpus vss=docs/vss.json --users 8
+
+    # Against the real Ollama and Qdrant
+    python benchmark.py conversations.jsonl --mode pro1 --users 4 --json results.json
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+from typing import Any, AsyncIterator, Dict, List, Optional
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import Field
+from config import Config
+from streaming import ThinkTagParser
+from bench_retrieval import first_hit, percentile
+
+MOCK_WORDS = ["zanka", " for", " tabela", " int", " metoda", " vrne", " število", " vsota", " pogoj", " če", ".", "\n"]
+
+
+class MockLLM(LLM):
+    """Deterministic stand-in for Ollama: the answer depends only on the prompt, timing is simulated"""
+
+    model: str = "mock"
+    answer_tokens: int = 120
+    thinking_tokens: int = 0
+    token_seconds: float = 0.02
+    prefill_seconds_per_1k: float = 0.2
+    # Like Ollama's prompt cache: the longest prefix shared with one of the last N prompts is not evaluated again
+    prefix_cache_slots: int = 0
+    cached_prompts: List[str] = Field(default_factory=list)
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def _tokens(self, prompt: str) -> List[str]:
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        tokens = []
+        if self.thinking_tokens:
+            tokens += ["<think>"] + [rng.choice(MOCK_WORDS) for _ in range(self.thinking_tokens)] + ["</think>"]
+        batched = prompt.count("### Conversation ")
+        if batched and "Summary 1: ..." in prompt:
+            # Batched summaries (summarizer.batch_prompt): one numbered answer per conversation
+            for i in range(batched):
+                tokens += [f"\nSummary {i+1}: "] + [rng.choice(MOCK_WORDS).strip() or "." for _ in range(self.answer_tokens)]
+            return tokens
+        tokens += [rng.choice(MOCK_WORDS) for _ in range(self.answer_tokens)]
+        return tokens
+
+    def _prefill(self, prompt: str) -> float:
+        cached = 0
+        if self.prefix_cache_slots:
+            best = max(self.cached_prompts, key=lambda old: len(os.path.commonprefix([old, prompt])), default=None)
+            if best is not None:
+                cached = len(os.path.commonprefix([best, prompt]))
+                self.cached_prompts.remove(best)  # The slot now holds the new prompt
+            self.cached_prompts.append(prompt)
+            del self.cached_prompts[:-self.prefix_cache_slots]
+        return (len(prompt) - cached) / 3.5 / 1000 * self.prefill_seconds_per_1k
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs: Any) -> str:
+        self.calls += 1
+        tokens = self._tokens(prompt)
+        time.sleep(self._prefill(prompt) + self.token_seconds * len(tokens))
+        return "".join(tokens)
+
+    async def _acall(self, prompt: str, stop=None, run_manager=None, **kwargs: Any) -> str:
+        self.calls += 1
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self._prefill(prompt) + self.token_seconds * len(tokens))
+        return "".join(tokens)
+
+    async def _astream(self, prompt: str, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        self.calls += 1
+        await asyncio.sleep(self._prefill(prompt))
+        for token in self._tokens(prompt):
+            await asyncio.sleep(self.token_seconds)
+            chunk = GenerationChunk(text=token)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def load_conversations(path: str) -> List[Dict]:
+    conversations = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            turns = item.get("conversation", [item])
+            conversations.append({
+                "collection": item.get("collection"),
+                "turns": [turn if isinstance(turn, dict) else {"question": turn} for turn in turns],
+            })
+    return conversations
+
+
+def is_hit(docs, turn) -> Optional[bool]:
+    """Whether a labelled chunk was retrieved (None for unlabelled turns)"""
+    if turn.get("expected_ids"):
+        return any(str(doc.metadata.get("_id")) in turn["expected_ids"] for doc in docs)
+    if turn.get("expected"):
+        return first_hit(docs, turn["expected"]) > 0
+    return None
+
+
+async def simulate_user(user_id, conversations, rag, settings, model, compression_model, results):
+    from pipeline import ChatPipeline, COMPRESSION_MODEL
+    from scheduler import get_scheduler, INTERACTIVE
+
+    scheduler = get_scheduler(getattr(model, "model", "mock"))
+    compression_scheduler = get_scheduler(COMPRESSION_MODEL)
+
+    for conversation in conversations:
+        pipeline = ChatPipeline(settings, model, compression_model, compression_scheduler, user_id)
+        if conversation["collection"]:
+            pipeline.collection_name = conversation["collection"]
+
+        for turn in conversation["turns"]:
+            question = turn["question"]
+            start = time.perf_counter()
+            docs = await pipeline.retrieve(rag, question)
+            retrieval_seconds = time.perf_counter() - start
+
+            inputs, token_usage = pipeline.build_inputs(question, docs)
+
+            answer = ""
+            first_token = None
+            parser = ThinkTagParser()
+            async with scheduler.slot(user_id, INTERACTIVE):
+                generation_start = time.perf_counter()
+                async for chunk in pipeline.runnable.astream(inputs):
+                    if first_token is None:
+                        first_token = time.perf_counter() - generation_start
+                    answer += "".join(text for is_thinking, text in parser.feed(chunk) if not is_thinking)
+                answer += "".join(text for is_thinking, text in parser.flush() if not is_thinking)
+
+            await pipeline.history_compressor.add_exchange(question, answer)
+            results["turns"].append({
+                "retrieval_ms": retrieval_seconds * 1000,
+                "ttft_ms": first_token * 1000 if first_token is not None else None,
+                "response_ms": (time.perf_counter() - start) * 1000,
+                "prompt_tokens": token_usage["total"],
+                "hit": is_hit(docs, turn),
+            })
+
+        await pipeline.history_compressor.wait_for_compression()
+        stats = pipeline.history_compressor.get_stats()
+        results["compressions"] += stats["compressions"]
+        results["compression_failures"] += stats["compression_failures"]
+        for tier, tier_stats in stats["tiers"].items():
+            totals = results["tiers"].setdefault(tier, {"runs": 0, "ms": 0.0, "input_chars": 0})
+            totals["runs"] += tier_stats["runs"]
+            totals["ms"] += (tier_stats["avg_ms"] or 0) * tier_stats["runs"]
+            totals["input_chars"] += tier_stats["input_chars"]
+
+
+def summarize(results, wall_seconds, users, k):
+    turns = results["turns"]
+
+    def stats(key):
+        values = [turn[key] for turn in turns if turn[key] is not None]
+        if not values:
+            return None
+        return {
+            "p50": round(percentile(values, 0.5), 1),
+            "p95": round(percentile(values, 0.95), 1),
+            "mean": round(sum(values) / len(values), 1),
+        }
+
+    labelled = [turn["hit"] for turn in turns if turn["hit"] is not None]
+    return {
+        "users": users,
+        "turns": len(turns),
+        "wall_seconds": round(wall_seconds, 2),
+        "turns_per_second": round(len(turns) / wall_seconds, 2) if wall_seconds else None,
+        "retrieval_ms": stats("retrieval_ms"),
+        f"recall@{k}": round(sum(labelled) / len(labelled), 3) if labelled else None,
+        "labelled_turns": len(labelled),
+        "prompt_tokens": stats("prompt_tokens"),
+        "ttft_ms": stats("ttft_ms"),
+        "response_ms": stats("response_ms"),
+        "compressions": results["compressions"],
+        "compressions_per_turn": round(results["compressions"] / len(turns), 3) if turns else 0,
+        "compression_failures": results["compression_failures"],
+        "compression_tiers": {
+            tier: {
+                "runs": totals["runs"],
+                "avg_ms": round(totals["ms"] / totals["runs"], 2) if totals["runs"] else None,
+                "input_chars": totals["input_chars"],
+            }
+            for tier, totals in results.get("tiers", {}).items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay questions/conversations through the chat pipeline")
+    parser.add_argument("questions", nargs="?", default="docs/eval_questions.jsonl", help="JSONL with questions or conversations")
+    parser.add_argument("--mode", default="pro1", help="Mode from nastavitve.json")
+    parser.add_argument("--users", type=int, default=1, help="Concurrent simulated users")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the file this many times")
+    parser.add_argument("--k", type=int, help="Override the retrieval k of the mode")
+    parser.add_argument("--retrieval-mode", choices=["dense", "hybrid"], help="Override the retrieval mode")
+    parser.add_argument("--prompt-layout", choices=["prefix_cache", "classic"], help="Override the prompt layout")
+    parser.add_argument("--summary-llm-every", type=int, help="Override how often the LLM summarizes (0 = extractive only)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the retrieval cache")
+    parser.add_argument("--model-concurrency", type=int, help="Generations per model and on the server at once (OLLAMA_CONCURRENCY)")
+    parser.add_argument("--corpus", action="append", default=[], metavar="COLLECTION=FILE",
+                        help="Load a JSON array of texts into an in-memory Qdrant collection (repeatable)")
+    parser.add_argument("--mock", action="store_true", help="Use a deterministic mock LLM instead of Ollama")
+    parser.add_argument("--mock-token-ms", type=float, default=20, help="Mock generation time per token")
+    parser.add_argument("--mock-prefill-ms", type=float, default=200, help="Mock prompt processing time per 1000 tokens")
+    parser.add_argument("--mock-answer-tokens", type=int, default=120)
+    parser.add_argument("--mock-prefix-cache", type=int, default=0, metavar="SLOTS",
+                        help="Simulate Ollama's prompt cache with this many slots (0 = every prompt is evaluated in full)")
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        Config.RAG_CACHE = False
+    if args.model_concurrency:
+        Config.OLLAMA_CONCURRENCY = args.model_concurrency
+        Config.OLLAMA_SERVER_CONCURRENCY = args.model_concurrency
+    if args.corpus:
+        # Keep the in-memory run away from the real versions file and BM25 indexes
+        workdir = tempfile.mkdtemp(prefix="klepetalnik-bench-")
+        Config.QDRANT_URL = ":memory:"
+        Config.RAG_VERSIONS_FILE = f"{workdir}/rag_versions.json"
+        Config.RAG_INDEX_DIR = f"{workdir}/rag_index"
+
+    from rag import get_rag
+    from config_store import get_settings
+    from pipeline import get_model, get_compression_model
+    from context_builder import prompt_layout
+
+    settings = dict(get_settings(args.mode))
+    if args.k or args.retrieval_mode:
+        settings["retrieval"] = dict(settings.get("retrieval") or {})
+        if args.k:
+            settings["retrieval"]["k"] = args.k
+        if args.retrieval_mode:
+            settings["retrieval"]["mode"] = args.retrieval_mode
+    if args.prompt_layout:
+        settings["prompt_layout"] = args.prompt_layout
+    if args.summary_llm_every is not None:
+        settings["summary_llm_every"] = args.summary_llm_every
+
+    if args.mock:
+        model = MockLLM(
+            model=settings.get("model", Config.DEFAULT_LLAMA_MODEL),
+            answer_tokens=args.mock_answer_tokens,
+            thinking_tokens=args.mock_answer_tokens if settings.get("thinking") else 0,
+            token_seconds=args.mock_token_ms / 1000,
+            prefill_seconds_per_1k=args.mock_prefill_ms / 1000,
+            prefix_cache_slots=args.mock_prefix_cache
+        )
+        compression_model = MockLLM(
+            model="mock-compression",
+            answer_tokens=40,
+            token_seconds=args.mock_token_ms / 1000,
+            prefill_seconds_per_1k=args.mock_prefill_ms / 1000
+        )
+    else:
+        model = get_model(settings)
+        compression_model = get_compression_model()
+
+    rag = get_rag(Config.QDRANT_URL, Config.EMBEDDING_MODEL, settings.get("model", Config.DEFAULT_LLAMA_MODEL))
+    for corpus in args.corpus:
+        collection, path = corpus.split("=", 1)
+        with open(path, "r", encoding="utf-8") as f:
+            rag.dodaj(json.load(f), collection)
+        rag.build_sparse_index(collection)
+
+    conversations = load_conversations(args.questions) * args.repeat
+    assigned = [conversations[i::args.users] for i in range(args.users)]
+    results = {"turns": [], "compressions": 0, "compression_failures": 0, "tiers": {}}
+
+    async def run():
+        # Load the tokenizer before the clock starts
+        from pipeline import ChatPipeline
+        await asyncio.to_thread(ChatPipeline(settings, model, compression_model).context_assembler.counter.load)
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            simulate_user(f"BENCH{i}", user_conversations, rag, settings, model, compression_model, results)
+            for i, user_conversations in enumerate(assigned) if user_conversations
+        ])
+        return time.perf_counter() - start
+
+    wall_seconds = asyncio.run(run())
+    k = settings.get("retrieval", {}).get("k", 3)
+    summary = summarize(results, wall_seconds, args.users, k)
+    summary["prompt_layout"] = prompt_layout(settings)
+
+    print(f"\n{summary['turns']} turns, {args.users} users, {summary['wall_seconds']}s "
+          f"({summary['turns_per_second']} turns/s, {summary['prompt_layout']} layout){' [mock LLM]' if args.mock else ''}")
+    for key in ("retrieval_ms", "prompt_tokens", "ttft_ms", "response_ms"):
+        if summary[key]:
+            print(f"  {key:<15} p50 {summary[key]['p50']:>9}  p95 {summary[key]['p95']:>9}  mean {summary[key]['mean']:>9}")
+    if summary[f"recall@{k}"] is not None:
+        print(f"  recall@{k:<8} {summary[f'recall@{k}']} ({summary['labelled_turns']} labelled turns)")
+    print(f"  compressions    {summary['compressions']} ({summary['compressions_per_turn']} per turn, "
+          f"{summary['compression_failures']} failed)")
+    for tier, tier_stats in summary["compression_tiers"].items():
+        if tier_stats["runs"]:
+            print(f"    {tier:<13} {tier_stats['runs']} runs, {tier_stats['avg_ms']} ms avg, {tier_stats['input_chars']} chars in")
+    from summarizer import summarizer_stats
+    for stats in summarizer_stats():
+        if stats["requests"]:
+            print(f"  summarizer      {stats['requests']} requests in {stats['llm_calls']} LLM calls "
+                  f"(avg batch {stats['avg_batch']}, {stats['single_fallbacks']} unbatched)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import re
+import hashlib
+from typing import Dict, List
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# recursive: fixed 250 character windows with 50 characters of overlap (the original splitter)
+# structured: title, task/solution sections and whole code blocks
+STRATEGIES = ("recursive", "structured")
+
+# "Naloga:", "Rešitev:", "Naloga 2: Tabele (2 točki)", "Časovna zahtevnost: O(log n)", ...
+_HEADING = re.compile(r"^([A-ZČŠŽ][\w ČŠŽčšž\-]{0,40}?)(?: \d+)?(?: \([^)]*\))?:(?:\s|$)")
+# A new task always starts a new chunk, so tasks from one text are never mixed
+_TASK_HEADINGS = ("Naloga", "Task")
+
+
+def _brace_depth(text: str) -> int:
+    return text.count("{") - text.count("}")
+
+
+def _blocks(body: str) -> List[str]:
+    """Paragraphs separated by blank lines, joined again where a code block continues ({ still open)"""
+    blocks = []
+    current = []
+    depth = 0
+    for paragraph in re.split(r"\n\s*\n", body):
+        if not paragraph.strip():
+            continue
+        current.append(paragraph)
+        depth += _brace_depth(paragraph)
+        if depth <= 0:
+            blocks.append("\n\n".join(current))
+            current = []
+            depth = 0
+    if current:
+        blocks.append("\n\n".join(current))
+    return blocks
+
+
+def _heading(block: str) -> str:
+    match = _HEADING.match(block)
+    if match is None or re.search(r"[{}();=\"]", match.group(1)):
+        return ""
+    return match.group(1).strip()
+
+
+def _split_long(block: str, max_chars: int) -> List[str]:
+    """Split an oversized block on lines, preferably where no code block is open"""
+    parts = []
+    current = []
+    size = 0
+    depth = 0
+    for line in block.split("\n"):
+        if current and size + len(line) > max_chars and (depth <= 0 or size + len(line) > 2 * max_chars):
+            parts.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+        depth += _brace_depth(line)
+        if depth < 0:
+            depth = 0
+    if current:
+        parts.append("\n".join(current))
+    return parts
+
+
+def parent_id(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def split_structured(text: str, max_chars: int = 600) -> List[Document]:
+    """
+    Split a text on its structure instead of a fixed window.
+
+    The first line is the title when a blank line follows it. The rest is cut into blocks
+    (paragraphs, code blocks kept whole) and sections (a block starting with "Heading:").
+    Sections are packed into chunks of up to max_chars; a task ("Naloga") always starts a
+    new chunk, so a task stays together with its solution whenever they fit. Every chunk
+    starts with the title and carries the full text as "parent" for parent-document retrieval.
+    """
+    text = text.strip()
+    title = ""
+    body = text
+    first_line, _, rest = text.partition("\n")
+    if rest.startswith("\n") and len(first_line) <= 150:
+        title, body = first_line.strip(), rest.strip()
+
+    sections = []  # [heading, [blocks]]
+    for block in _blocks(body):
+        heading = _heading(block)
+        if heading or not sections:
+            sections.append([heading, []])
+        sections[-1][1].append(block)
+
+    budget = max(100, max_chars - len(title))
+    pieces = []  # (section heading, text, starts a task)
+    for heading, blocks in sections:
+        starts_task = heading.startswith(_TASK_HEADINGS)
+        for block in blocks:
+            for part in _split_long(block, budget) if len(block) > budget else [block]:
+                pieces.append((heading, part, starts_task))
+                starts_task = False
+
+    chunks = []  # [section, [texts], size]
+    for heading, part, starts_task in pieces:
+        if chunks and not starts_task and chunks[-1][2] + len(part) <= budget:
+            chunks[-1][1].append(part)
+            chunks[-1][2] += len(part) + 2
+        else:
+            chunks.append([heading, [part], len(part)])
+
+    metadata = {"parent_id": parent_id(text), "title": title, "parent": text}
+    if not chunks:
+        return [Document(page_content=text, metadata=dict(metadata, section="", chunk=0))]
+    return [
+        Document(
+            page_content="\n\n".join(([title] if title else []) + parts),
+            metadata=dict(metadata, section=heading, chunk=number)
+        )
+        for number, (heading, parts, _) in enumerate(chunks)
+    ]
+
+
+def split_recursive(text: str) -> List[Document]:
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=250, chunk_overlap=50)
+    return [Document(page_content=chunk) for chunk in text_splitter.split_text(text)]
+
+
+def split_document(text: str, strategy: str = "structured", max_chars: int = 600) -> List[Document]:
+    """Chunk Documents of one text with the given strategy"""
+    if strategy == "structured":
+        return split_structured(text, max_chars)
+    if strategy == "recursive":
+        return split_recursive(text)
+    raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of: {', '.join(STRATEGIES)}")
+
+
+def chunking_stats(documents: List[Document], dimension: int = 384) -> Dict:
+    """Vector count and estimated index size of a set of chunks"""
+    sizes = [len(doc.page_content) for doc in documents]
+    return {
+        "vectors": len(documents),
+        "avg_chars": round(sum(sizes) / len(sizes)) if sizes else 0,
+        "max_chars": max(sizes, default=0),
+        # float32 vectors, without Qdrant's HNSW graph
+        "vector_mb": round(len(documents) * dimension * 4 / (1024 * 1024), 3),
+        "payload_mb": round(sum(len(doc.page_content.encode("utf-8")) + sum(
+            len(str(value).encode("utf-8")) for value in doc.metadata.values()
+        ) for doc in documents) / (1024 * 1024), 3),
+        # Chunks that cut through a code block ({ and } do not match)
+        "broken_code_blocks": sum(1 for doc in documents if _brace_depth(doc.page_content) != 0),
+    }
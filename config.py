@@ -1,12 +1,98 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class Config:
     QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+    # Where chunks are searched: "qdrant" (server at QDRANT_URL), "qdrant-local" (on-disk Qdrant in QDRANT_PATH,
+    # no server) or "embedded" (NumPy index in RAG_INDEX_DIR exported by update_rag.py from QDRANT_PATH)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+    QDRANT_PATH = os.getenv("QDRANT_PATH", "qdrant_data")
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    # torch, onnx (fastembed) or int8 (quantized torch) - all produce vectors of the same size
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+    # structured (tasks, solutions and code blocks kept whole) or recursive (fixed 250 character windows)
+    CHUNKING = os.getenv("CHUNKING", "structured")
+    CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "600"))
     #DEFAULT_LLAMA_MODEL = os.getenv("DEFAULT_LLAMA_MODEL", "deepseek-r1:32b")
     DEFAULT_LLAMA_MODEL = os.getenv("DEFAULT_LLAMA_MODEL", "gemma3:27b")
     DEFAULT_COLLECTION_NAME = os.getenv("DEFAULT_COLLECTION_NAME", "test_collection_1")
-
+    # Context window assumed for modes without num_ctx (Ollama's default)
+    DEFAULT_NUM_CTX = int(os.getenv("DEFAULT_NUM_CTX", "2048"))
+    # Load the shared embedding model when the server starts instead of on the first chat
+    RAG_WARMUP = os.getenv("RAG_WARMUP", "1") == "1"
+    # Collection versions written by update_rag.py, used to invalidate cached retrievers
+    RAG_VERSIONS_FILE = os.getenv("RAG_VERSIONS_FILE", "rag_versions.json")
+    # Versioned collections (name_v1, name_v2, ...) kept after a blue/green rebuild, including the live one
+    RAG_KEEP_VERSIONS = int(os.getenv("RAG_KEEP_VERSIONS", "2"))
+    # Threads used for blocking retrieval calls made from the async chat handlers
+    RAG_RETRIEVAL_WORKERS = int(os.getenv("RAG_RETRIEVAL_WORKERS", "8"))
+    # Micro-batching of query embeddings that arrive at about the same time
+    EMBED_BATCHING = os.getenv("EMBED_BATCHING", "1") == "1"
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "16"))
+    EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+    EMBED_QUEUE_SIZE = int(os.getenv("EMBED_QUEUE_SIZE", "256"))
+    # Retrieval result cache: exact match on normalized question + optional similarity level
+    RAG_CACHE = os.getenv("RAG_CACHE", "1") == "1"
+    RAG_CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", "512"))
+    RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "600"))
+    RAG_SEMANTIC_CACHE = os.getenv("RAG_SEMANTIC_CACHE", "0") == "1"
+    RAG_SEMANTIC_CACHE_SIZE = int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "256"))
+    RAG_SEMANTIC_CACHE_TTL = float(os.getenv("RAG_SEMANTIC_CACHE_TTL", "600"))
+    RAG_SEMANTIC_THRESHOLD = float(os.getenv("RAG_SEMANTIC_THRESHOLD", "0.95"))
+    RAG_CACHE_LOG_EVERY = int(os.getenv("RAG_CACHE_LOG_EVERY", "100"))
+    # Streamed tokens are sent to the browser every STREAM_FLUSH_MS or every STREAM_FLUSH_TOKENS tokens
+    STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "50"))
+    STREAM_FLUSH_TOKENS = int(os.getenv("STREAM_FLUSH_TOKENS", "32"))
+    # Structured (JSON lines) log written by a background thread
+    LOG_FILE = os.getenv("LOG_FILE", "debugx.log")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+    LOG_ROTATE_SECONDS = float(os.getenv("LOG_ROTATE_SECONDS", str(24 * 3600)))
+    LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+    LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+    LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "0.5"))
+    # Generations sent to Ollama at the same time, per model (JSON, e.g. {"gemma3:27b": 1}) and for other models
+    MODEL_CONCURRENCY = json.loads(os.getenv("MODEL_CONCURRENCY", "{}"))
+    OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "2"))
+    # Generations of all models together; summaries only start while no answer is running or waiting
+    OLLAMA_SERVER_CONCURRENCY = int(os.getenv("OLLAMA_SERVER_CONCURRENCY", os.getenv("OLLAMA_CONCURRENCY", "2")))
+    OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    # How long Ollama keeps a model loaded after the last request ("-1" forever)
+    OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "1h")
+    # Load the models of all modes (and their system prompts) when the server starts
+    OLLAMA_PRELOAD = os.getenv("OLLAMA_PRELOAD", "1") == "1"
+    # prefix_cache (static system message, summary in the last turn) or classic; a mode can set "prompt_layout"
+    PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "prefix_cache")
+    # Requests waiting for one model before new ones are turned away
+    SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "40"))
+    # Answers cached for modes with "response_cache": true in nastavitve.json
+    RESPONSE_CACHE_FILE = os.getenv("RESPONSE_CACHE_FILE", "response_cache.sqlite3")
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+    # How often nastavitve.json and kode.json are checked for changes (seconds)
+    CONFIG_RELOAD_SECONDS = float(os.getenv("CONFIG_RELOAD_SECONDS", "1"))
+    # BM25 indexes for hybrid retrieval (built by update_rag.py) and the optional cross-encoder reranker
+    RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", "rag_index")
+    RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+    # Conversation history saved across restarts ("sqlite" or "none")
+    SESSION_STORE = os.getenv("SESSION_STORE", "sqlite")
+    SESSION_DB = os.getenv("SESSION_DB", "sessions.sqlite3")
+    SESSION_FLUSH_SECONDS = float(os.getenv("SESSION_FLUSH_SECONDS", "1"))
+    # Sessions without messages for this long (or above the limit) are only kept on disk
+    SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "900"))
+    SESSION_MAX_LOADED = int(os.getenv("SESSION_MAX_LOADED", "500"))
+    # Older conversations are not restored, the next chat starts fresh
+    SESSION_RESTORE_SECONDS = float(os.getenv("SESSION_RESTORE_SECONDS", str(12 * 3600)))
+    # History summaries: extractive (CPU) by default, an LLM rewrite every SUMMARY_LLM_EVERY-th compression
+    # (0 = never, 1 = always); a mode can set "summary_llm_every"
+    SUMMARY_LLM_EVERY = int(os.getenv("SUMMARY_LLM_EVERY", "3"))
+    SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "1200"))
+    # Seconds an LLM summary may take, waiting for a background slot included, before the extractive tier is used
+    SUMMARY_LLM_TIMEOUT = float(os.getenv("SUMMARY_LLM_TIMEOUT", "60"))
+    # LLM summaries of different sessions are sent to the compression model together
+    SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "4"))
+    SUMMARY_BATCH_WAIT_MS = float(os.getenv("SUMMARY_BATCH_WAIT_MS", "300"))
+    SUMMARY_BATCH_MAX_CHARS = int(os.getenv("SUMMARY_BATCH_MAX_CHARS", "9000"))
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+from config import Config
+from logger import log_event
+
+SETTINGS_FILE = "nastavitve.json"
+
+_NUMBER_SETTINGS = ("temperature", "top_p", "top_k", "repeat_penalty", "num_ctx", "answer_reserve", "max_raw_history",
+                    "summary_llm_every")
+
+
+class JsonFileStore:
+    def __init__(self,
+                 path: str,
+                 validate: Optional[Callable[[Any], None]] = None,
+                 build_index: Optional[Callable[[Any], Any]] = None,
+                 default: Any = None,
+                 check_interval: float = 1.0
+                 ):
+        """
+        JSON file kept in memory and reloaded when it changes on disk.
+
+        The file's mtime and size are checked at most every check_interval seconds.
+        A file that fails to parse or validate is logged and ignored - the previously
+        loaded data stays in use, so a half-saved edit cannot lock everybody out.
+
+        Args:
+            path: JSON file
+            validate: Raises ValueError when the data is not valid
+            build_index: Builds the lookup structure (e.g. a dict) from the data
+            default: Data used while the file does not exist
+            check_interval: Minimum seconds between mtime checks (0 checks on every access)
+        """
+        self.path = path
+        self.validate = validate
+        self.build_index = build_index
+        self.default = default
+        self.check_interval = check_interval
+
+        self.reloads = 0
+        self.failed_reloads = 0
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked_at = None
+        self._data = default
+        self._index = build_index(default) if build_index and default is not None else None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        stamp = self._stat()
+        if stamp == self._stamp:
+            return
+
+        if stamp is None:
+            data = self.default
+        else:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if self.validate is not None:
+                    self.validate(data)
+            except (OSError, ValueError) as e:
+                self.failed_reloads += 1
+                self._stamp = stamp  # Do not retry until the file changes again
+                log_event("config_reload_failed", level=logging.ERROR, stage="config", file=self.path, error=str(e))
+                return
+
+        self._data = data
+        self._index = self.build_index(data) if self.build_index and data is not None else None
+        self._stamp = stamp
+        self.reloads += 1
+        if self.reloads > 1:
+            log_event("config_reloaded", stage="config", file=self.path)
+
+    def get(self) -> Any:
+        """Current file contents"""
+        with self._lock:
+            self._refresh()
+            return self._data
+
+    def index(self) -> Any:
+        """Current lookup structure built by build_index"""
+        with self._lock:
+            self._refresh()
+            return self._index
+
+    def get_stats(self) -> Dict:
+        return {"file": self.path, "reloads": self.reloads, "failed_reloads": self.failed_reloads}
+
+
+def validate_settings(data) -> None:
+    """nastavitve.json: {mode: {"prompt": str, "model": str, ...}}"""
+    if not isinstance(data, dict):
+        raise ValueError("settings must be an object of modes")
+    for mode, settings in data.items():
+        if not isinstance(settings, dict):
+            raise ValueError(f"mode {mode!r} must be an object")
+        if not isinstance(settings.get("prompt"), str):
+            raise ValueError(f"mode {mode!r} needs a prompt")
+        if "model" in settings and not isinstance(settings["model"], str):
+            raise ValueError(f"mode {mode!r}: model must be a string")
+        if settings.get("prompt_layout") not in (None, "prefix_cache", "classic"):
+            raise ValueError(f"mode {mode!r}: prompt_layout must be prefix_cache or classic")
+        retrieval = settings.get("retrieval")
+        if retrieval is not None:
+            if not isinstance(retrieval, dict):
+                raise ValueError(f"mode {mode!r}: retrieval must be an object")
+            if retrieval.get("mode", "dense") not in ("dense", "hybrid"):
+                raise ValueError(f"mode {mode!r}: retrieval mode must be dense or hybrid")
+        for key in _NUMBER_SETTINGS:
+            value = settings.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"mode {mode!r}: {key} must be a number or null")
+
+
+_settings = JsonFileStore(SETTINGS_FILE, validate=validate_settings, check_interval=Config.CONFIG_RELOAD_SECONDS)
+
+
+def get_settings(mode: str) -> Dict:
+    """Settings of a mode from nastavitve.json (KeyError for unknown modes)"""
+    data = _settings.get()
+    if data is None:
+        raise KeyError(mode)
+    return data[mode]
+
+
+def all_settings() -> Dict:
+    """Settings of all modes from nastavitve.json"""
+    return _settings.get() or {}
@@ -0,0 +1,249 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import AIMessage, BaseMessage
+from config import Config
+from logger import log_event
+
+SYSTEM_SUFFIX = (
+    "\n\nConversation Context - what we have talked about before:\n{conversation_context}\n\n"
+    "Trenutno vprašanje uporabnika je zadnje sporočilo v pogovoru! Odgovori na to vprašanje."
+)
+
+# prefix_cache: the system message is the same for every turn and session of a mode, the summary
+# moves into the last human turn, so Ollama can reuse the evaluated system prompt (and history)
+# classic: the summary is part of the system message, which changes after every compression
+PROMPT_LAYOUTS = ("prefix_cache", "classic")
+
+STATIC_SYSTEM_SUFFIX = (
+    "\n\nTrenutno vprašanje uporabnika je zadnje sporočilo v pogovoru! Odgovori na to vprašanje."
+)
+
+SUMMARY_HEADER = "Conversation Context - what we have talked about before:\n"
+
+RAG_PREAMBLE = (
+    "Please use the following context to answer the question. If the context is not relevant, use your own knowledge. "
+    "Context is automatically added - do not mention the context in the answer, it would confuse the user."
+)
+
+# Hugging Face tokenizers that match the Ollama model families we use
+TOKENIZERS = {
+    "deepseek-r1": "deepseek-ai/DeepSeek-R1-Distill-Qwen-32B",
+    "gemma3": "unsloth/gemma-3-27b-it",
+    "llama3.1": "unsloth/Meta-Llama-3.1-8B-Instruct",
+    "mistral": "mistralai/Mistral-7B-Instruct-v0.3",
+    "mistral-small3.2": "unsloth/Mistral-Small-3.2-24B-Instruct-2506",
+}
+
+# Role markers and separators the chat template adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def prompt_layout(settings: Dict) -> str:
+    """Prompt layout of a mode ("prompt_layout" in nastavitve.json, default Config.PROMPT_LAYOUT)"""
+    layout = settings.get("prompt_layout") or Config.PROMPT_LAYOUT
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt layout '{layout}', expected one of: {', '.join(PROMPT_LAYOUTS)}")
+    return layout
+
+
+def system_message(settings: Dict) -> str:
+    """System message template of a mode"""
+    if prompt_layout(settings) == "prefix_cache":
+        return settings.get("prompt", "") + STATIC_SYSTEM_SUFFIX
+    return settings.get("prompt", "") + SYSTEM_SUFFIX
+
+
+def build_prompt(settings: Dict) -> ChatPromptTemplate:
+    """Chat prompt for a mode: system prompt (with the summary in the classic layout), history, then the question"""
+    return ChatPromptTemplate.from_messages([
+        ("system", system_message(settings)),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{question}"),
+    ])
+
+
+def static_prefix(settings: Dict) -> str:
+    """Start of every prompt of a mode as sent to Ollama, used to warm up its prompt cache"""
+    return build_prompt(settings).format(question="", history=[], conversation_context="")
+
+
+def format_question(question: str, context: str, summary: str = "") -> str:
+    """Question with the retrieved context (and in the prefix_cache layout the summary) in front of it"""
+    parts = []
+    if summary:
+        parts.append(f"{SUMMARY_HEADER}{summary}")
+    if context:
+        parts.append(f"{RAG_PREAMBLE}\n\nContext:\n{context}")
+    if not parts:
+        return question
+    return "\n\n".join(parts + [f"Question: {question}"])
+
+
+class TokenCounter:
+    def __init__(self, model: str, tokenizer_name: Optional[str] = None):
+        """
+        Counts tokens with the tokenizer of the configured model.
+
+        The tokenizer is taken from the mode setting "tokenizer" or looked up by the
+        Ollama model family. If it can't be loaded (no transformers, no network) the
+        count falls back to an estimate of 3.5 characters per token.
+        """
+        family = model.split(":")[0]
+        self.tokenizer_name = tokenizer_name or TOKENIZERS.get(model) or TOKENIZERS.get(family)
+        self._tokenizer = None
+        self._loaded = False
+
+    def load(self) -> None:
+        """Load the tokenizer (slow the first time - call it from a thread)"""
+        if self._loaded:
+            return
+        if self.tokenizer_name:
+            with _tokenizers_lock:
+                if self.tokenizer_name not in _tokenizers:
+                    try:
+                        from transformers import AutoTokenizer
+                        _tokenizers[self.tokenizer_name] = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                    except Exception as e:
+                        log_event("tokenizer_unavailable", level=logging.WARNING, stage="prompt",
+                                  tokenizer=self.tokenizer_name, error=str(e))
+                        _tokenizers[self.tokenizer_name] = None
+                self._tokenizer = _tokenizers[self.tokenizer_name]
+        self._loaded = True
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        self.load()
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return int(len(text) / 3.5) + 1
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        self.load()
+        if self._tokenizer is not None:
+            ids = self._tokenizer.encode(text, add_special_tokens=False)
+            if len(ids) <= max_tokens:
+                return text
+            return self._tokenizer.decode(ids[:max_tokens]) + "..."
+        max_chars = int(max_tokens * 3.5)
+        return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+
+class ContextAssembler:
+    def __init__(self,
+                 settings: Dict,
+                 num_ctx: int = 2048,
+                 answer_reserve: int = 512,
+                 max_answer_tokens: int = 256,
+                 min_section_tokens: int = 32
+                 ):
+        """
+        Fits the prompt into the model context window.
+
+        Sections are added in priority order - system prompt, question, RAG chunks,
+        recent turns (newest first), summary - until the budget is used up. Budget is
+        num_ctx minus the tokens reserved for the answer.
+
+        Args:
+            settings: Mode settings from nastavitve.json
+            num_ctx: Context window of the model
+            answer_reserve: Tokens left free for the answer
+            max_answer_tokens: Older answers in history are cut to this length
+            min_section_tokens: Do not add truncated sections shorter than this
+        """
+        self.counter = TokenCounter(settings.get("model", ""), settings.get("tokenizer"))
+        self.layout = prompt_layout(settings)
+        if self.layout == "prefix_cache":
+            # The summary header is sent in the question, counted here like in the classic layout
+            self.system_prompt = settings.get("prompt", "") + STATIC_SYSTEM_SUFFIX + SUMMARY_HEADER
+        else:
+            self.system_prompt = settings.get("prompt", "") + SYSTEM_SUFFIX.replace("{conversation_context}", "")
+        self.budget = num_ctx - answer_reserve
+        self.max_answer_tokens = max_answer_tokens
+        self.min_section_tokens = min_section_tokens
+
+    def assemble(self, question: str, docs: List, history: List[BaseMessage], summary: str) -> Tuple[Dict, Dict]:
+        """Return prompt inputs (question, history, conversation_context) and per-section token usage"""
+        count = self.counter.count
+        usage = {"system": count(self.system_prompt) + MESSAGE_OVERHEAD_TOKENS}
+        usage["question"] = count(question) + MESSAGE_OVERHEAD_TOKENS
+        remaining = self.budget - usage["system"] - usage["question"]
+
+        # RAG chunks, in retrieval order
+        context_parts = []
+        usage["rag"] = 0
+        usage["rag_dropped"] = 0
+        if docs:
+            preamble = count(format_question("", "x")) - 1
+            if remaining - preamble >= self.min_section_tokens:
+                remaining -= preamble
+                usage["rag"] += preamble
+                for doc in docs:
+                    part = f"{len(context_parts) + 1}. {doc.page_content}"
+                    tokens = count(part) + 1
+                    if tokens > remaining:
+                        if remaining < self.min_section_tokens:
+                            usage["rag_dropped"] += 1
+                            continue
+                        part = self.counter.truncate(part, remaining - 1)
+                        tokens = count(part) + 1
+                    context_parts.append(part)
+                    remaining -= tokens
+                    usage["rag"] += tokens
+            else:
+                usage["rag_dropped"] = len(docs)
+
+        # Recent turns, newest pair first; long answers are shortened. Stops at the first pair
+        # that does not fit, so the kept turns are the most recent ones without gaps
+        kept = []
+        usage["history"] = 0
+        usage["history_dropped"] = 0
+        pairs = [history[i:i + 2] for i in range(0, len(history), 2)]
+        for position, pair in enumerate(reversed(pairs)):
+            if remaining < self.min_section_tokens:
+                usage["history_dropped"] = len(pairs) - position
+                break
+            shortened = []
+            for message in pair:
+                content = message.content
+                if isinstance(message, AIMessage):
+                    content = self.counter.truncate(content, self.max_answer_tokens)
+                shortened.append(type(message)(content=content))
+            tokens = sum(count(m.content) + MESSAGE_OVERHEAD_TOKENS for m in shortened)
+            if tokens > remaining:
+                usage["history_dropped"] = len(pairs) - position
+                break
+            kept = shortened + kept
+            remaining -= tokens
+            usage["history"] += tokens
+
+        # Summary last, it only gets what is left
+        usage["summary"] = count(summary)
+        if usage["summary"] > remaining:
+            summary = self.counter.truncate(summary, remaining) if remaining >= self.min_section_tokens else ""
+            usage["summary"] = count(summary)
+        remaining -= usage["summary"]
+
+        usage["total"] = self.budget - remaining
+        usage["budget"] = self.budget
+        usage["exact"] = self.counter.exact
+
+        context = "\n".join(context_parts).strip()
+        inputs = {
+            "question": format_question(question, context, summary if self.layout == "prefix_cache" else ""),
+            "history": kept,
+            "conversation_context": summary,
+        }
+        return inputs, usage
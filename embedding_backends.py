@@ -0,0 +1,62 @@
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+# torch: sentence-transformers in PyTorch (reference)
+# onnx: fastembed ONNX runtime, no torch import at all
+# int8: sentence-transformers with dynamically quantized (int8) linear layers
+BACKENDS = ("torch", "onnx", "int8")
+
+
+class FastEmbedEmbeddings(Embeddings):
+    def __init__(self, model_name: str, threads: int = None):
+        """
+        fastembed (ONNX runtime) model behind the langchain Embeddings interface.
+
+        Args:
+            model_name: Model name, must be one of fastembed's supported models
+            threads: ONNX runtime threads (None lets onnxruntime decide)
+        """
+        from fastembed import TextEmbedding
+
+        supported = {model["model"] for model in TextEmbedding.list_supported_models()}
+        if model_name not in supported:
+            raise ValueError(f"Embedding model '{model_name}' is not supported by fastembed, use EMBEDDING_BACKEND=torch")
+        self.model = TextEmbedding(model_name=model_name, threads=threads)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self.model.embed(list(texts))]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _load_torch(model_name: str) -> Embeddings:
+    # Imported here - importing torch alone takes seconds and hundreds of MB
+    from langchain_huggingface import HuggingFaceEmbeddings
+    #return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': 'cpu'})
+    return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={})
+
+
+def _load_int8(model_name: str) -> Embeddings:
+    import torch
+
+    embeddings = _load_torch(model_name)
+    # Weights of the linear layers (most of the compute) become int8, activations are quantized on the fly
+    torch.quantization.quantize_dynamic(embeddings._client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return embeddings
+
+
+def load_embeddings(model_name: str, backend: str = "torch") -> Embeddings:
+    """Load the embedding model with the given backend, only importing what that backend needs"""
+    if backend == "torch":
+        return _load_torch(model_name)
+    if backend == "onnx":
+        return FastEmbedEmbeddings(model_name)
+    if backend == "int8":
+        return _load_int8(model_name)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+
+
+def embedding_dimension(embeddings: Embeddings) -> int:
+    """Vector size produced by the model"""
+    return len(embeddings.embed_query("dimension"))
@@ -0,0 +1,174 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import List, Dict
+from langchain_core.embeddings import Embeddings
+from metrics import EMBEDDING_BATCH_SIZE
+from logger import log_event
+
+
+class BatchingEmbeddings(Embeddings):
+    def __init__(self,
+                 embeddings: Embeddings,
+                 max_batch_size: int = 16,
+                 max_wait_ms: float = 5,
+                 max_queue_size: int = 256
+                 ):
+        """
+        Coalesces concurrent embed_query calls into one embed_documents batch.
+
+        Questions that arrive within max_wait_ms of each other are embedded together,
+        which is much cheaper on CPU than embedding them one by one. For models without
+        a query instruction (like all-MiniLM-L6-v2) embed_query and embed_documents
+        return the same vectors, so batching does not change retrieval results.
+
+        Args:
+            embeddings: The wrapped embedding model
+            max_batch_size: Maximum number of queries embedded in one batch
+            max_wait_ms: How long to wait for more queries after the first one arrives
+            max_queue_size: Maximum number of waiting queries (callers block when full)
+        """
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "queries": 0,
+            "max_batch_size_seen": 0,
+            "total_batch_seconds": 0.0,
+            "max_batch_seconds": 0.0,
+            "last_batch_seconds": 0.0,
+            "max_queue_depth": 0,
+            "errors": 0,
+        }
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Documents already come in batches (ingestion), pass them straight through
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        future = Future()
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((text, future))
+        except queue.Full:
+            # Queue is full - wait for room without blocking the event loop
+            await asyncio.to_thread(self._queue.put, (text, future))
+        self._record_queue_depth()
+        return await asyncio.wrap_future(future)
+
+    def _submit(self, text: str) -> Future:
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        self._record_queue_depth()
+        return future
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _record_queue_depth(self) -> None:
+        depth = self._queue.qsize()
+        if depth > self._stats["max_queue_depth"]:
+            with self._stats_lock:
+                self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+
+            # Collect whatever else arrives within the wait window
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # This is the only worker - if it died, every later embed_query would wait forever
+                log_event("embedding_batch_failed", level=logging.ERROR, stage="embedding", batch=len(batch), error=str(e))
+                for _, future in batch:
+                    if not future.done():
+                        try:
+                            future.set_exception(e)
+                        except InvalidStateError:
+                            pass  # Cancelled in the meantime
+
+    def _run_batch(self, batch) -> None:
+        # Skip queries whose caller gave up (e.g. the student pressed stop) - their futures are cancelled
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        texts = [text for text, _ in batch]
+        start = time.perf_counter()
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - start
+        EMBEDDING_BATCH_SIZE.observe(len(batch))
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["queries"] += len(batch)
+            self._stats["max_batch_size_seen"] = max(self._stats["max_batch_size_seen"], len(batch))
+            self._stats["total_batch_seconds"] += elapsed
+            self._stats["max_batch_seconds"] = max(self._stats["max_batch_seconds"], elapsed)
+            self._stats["last_batch_seconds"] = elapsed
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def get_stats(self) -> Dict:
+        """Batching statistics and settings"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        batches = stats["batches"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": stats["max_queue_depth"],
+            "batches": batches,
+            "queries": stats["queries"],
+            "errors": stats["errors"],
+            "avg_batch_size": round(stats["queries"] / batches, 2) if batches else 0,
+            "max_batch_size_seen": stats["max_batch_size_seen"],
+            "avg_batch_ms": round(stats["total_batch_seconds"] / batches * 1000, 2) if batches else 0,
+            "max_batch_ms": round(stats["max_batch_seconds"] * 1000, 2),
+            "last_batch_ms": round(stats["last_batch_seconds"] * 1000, 2),
+        }
@@ -0,0 +1,230 @@
+"""Local stand-in for the Ollama HTTP API, for load tests without a GPU.
+
+Answers /api/generate and /api/chat with NDJSON token streams like Ollama: a simulated prompt
+evaluation time, then tokens at a fixed rate, optionally inside a <think> section. At most
+--parallel requests generate at once (OLLAMA_NUM_PARALLEL), the rest wait. The text only depends
+on the prompt, so runs are reproducible:
+
+    python fake_ollama.py --port 11435 --tokens-per-second 25 --think-tokens 80
+    OLLAMA_URL=http://localhost:11435 chainlit run klepetalnik.py
+"""
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+WORDS = ["zanka", " for", " tabela", " int", " metoda", " vrne", " število", " vsota", " pogoj", " če", ".", "\n"]
+
+
+class FakeOllama:
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 11435,
+                 tokens_per_second: float = 25.0,
+                 prefill_ms_per_1k: float = 200.0,
+                 answer_tokens: int = 120,
+                 think_tokens: int = 0,
+                 plain_models: Optional[List[str]] = None,
+                 parallel: int = 2
+                 ):
+        """
+        Simulated Ollama server.
+
+        Args:
+            host: Address to listen on
+            port: Port to listen on (0 picks a free one)
+            tokens_per_second: Generation speed of one request
+            prefill_ms_per_1k: Prompt evaluation time per 1000 prompt tokens (3.5 characters per token)
+            answer_tokens: Tokens per answer (num_predict in the request options wins when it is lower)
+            think_tokens: Tokens in a <think> section before the answer (0 = no thinking)
+            plain_models: Models that never think (e.g. the compression model)
+            parallel: Requests generated at once, like OLLAMA_NUM_PARALLEL
+        """
+        self.host = host
+        self.port = port
+        self.token_seconds = 1 / tokens_per_second
+        self.prefill_seconds_per_1k = prefill_ms_per_1k / 1000
+        self.answer_tokens = answer_tokens
+        self.think_tokens = think_tokens
+        self.plain_models = set(plain_models or [])
+        self.parallel = parallel
+
+        self._server = None
+        self._slots = None
+        self._stats = {"requests": 0, "tokens": 0, "active": 0, "max_active": 0, "waiting": 0, "max_waiting": 0}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._slots = asyncio.Semaphore(self.parallel)
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_in_thread(self) -> None:
+        """Run the server on its own event loop, so it does not compete with the code under test"""
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="fake-ollama", daemon=True).start()
+        started.wait()
+
+    def get_stats(self) -> Dict:
+        return dict(self._stats)
+
+    def _tokens(self, model: str, prompt: str, num_predict: Optional[int]) -> List[str]:
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        count = self.answer_tokens if not num_predict or num_predict < 0 else min(num_predict, self.answer_tokens)
+        tokens = []
+        if self.think_tokens and model not in self.plain_models and count > 1:
+            tokens += ["<think>"] + [rng.choice(WORDS) for _ in range(self.think_tokens)] + ["</think>"]
+        return tokens + [rng.choice(WORDS) for _ in range(count)]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            payload = json.loads(body) if body else {}
+
+            if path == "/api/version":
+                await self._send_json(writer, {"version": "0.0.0-fake"})
+            elif path in ("/api/tags", "/api/ps"):
+                await self._send_json(writer, {"models": []})
+            elif method == "POST" and path in ("/api/generate", "/api/chat"):
+                await self._generate(writer, path, payload)
+            else:
+                await self._send_json(writer, {"error": f"{method} {path} not found"}, status="404 Not Found")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer, data, status="200 OK") -> None:
+        body = json.dumps(data).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def _generate(self, writer, path: str, payload: Dict) -> None:
+        model = payload.get("model", "")
+        chat = path == "/api/chat"
+        if chat:
+            prompt = "\n".join(str(message.get("content", "")) for message in payload.get("messages", []))
+        else:
+            prompt = payload.get("prompt") or ""
+        stream = payload.get("stream", True)
+        tokens = self._tokens(model, prompt, (payload.get("options") or {}).get("num_predict"))
+
+        self._stats["requests"] += 1
+        self._stats["waiting"] += 1
+        self._stats["max_waiting"] = max(self._stats["max_waiting"], self._stats["waiting"])
+        async with self._slots:
+            self._stats["waiting"] -= 1
+            self._stats["active"] += 1
+            self._stats["max_active"] = max(self._stats["max_active"], self._stats["active"])
+            try:
+                start = time.perf_counter()
+                await asyncio.sleep(len(prompt) / 3.5 / 1000 * self.prefill_seconds_per_1k)
+                prompt_seconds = time.perf_counter() - start
+
+                def record(text, done=False):
+                    record = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+                    if chat:
+                        record["message"] = {"role": "assistant", "content": text}
+                    else:
+                        record["response"] = text
+                    if done:
+                        record.update({
+                            "done_reason": "stop",
+                            "total_duration": int((time.perf_counter() - start) * 1e9),
+                            "prompt_eval_count": int(len(prompt) / 3.5) + 1,
+                            "prompt_eval_duration": int(prompt_seconds * 1e9),
+                            "eval_count": len(tokens),
+                        })
+                    return record
+
+                if not stream:
+                    await asyncio.sleep(self.token_seconds * len(tokens))
+                    self._stats["tokens"] += len(tokens)
+                    await self._send_json(writer, record("".join(tokens), done=True))
+                    return
+
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                    b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+                )
+                for token in tokens:
+                    await asyncio.sleep(self.token_seconds)
+                    self._write_chunk(writer, record(token))
+                    await writer.drain()
+                    self._stats["tokens"] += 1
+                self._write_chunk(writer, record("", done=True))
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+            finally:
+                self._stats["active"] -= 1
+
+    @staticmethod
+    def _write_chunk(writer, record) -> None:
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=25)
+    parser.add_argument("--prefill-ms", type=float, default=200, help="Prompt evaluation time per 1000 tokens")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--think-tokens", type=int, default=0)
+    parser.add_argument("--plain-model", action="append", default=["llama3.1:8b"], help="Model that never thinks (repeatable)")
+    parser.add_argument("--parallel", type=int, default=2, help="Requests generated at once")
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        args.host, args.port, args.tokens_per_second, args.prefill_ms, args.answer_tokens,
+        args.think_tokens, args.plain_model, args.parallel
+    )
+
+    async def serve():
+        await server.start()
+        print(f"Fake Ollama listening on {server.url}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,31 +2,77 @@ import time
 from typing import List, Dict, Tuple
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 import asyncio
+import logging
+from logger import log_event
+from metrics import COMPRESSION_SECONDS
+from scheduler import BACKGROUND
+from summarizer import extractive_summary, summary_prompt
+
+TIERS = ("extractive", "llm")
 
 class SmartHistoryCompressor:
     def __init__(self,
                  compression_model,
                  max_raw_history: int = 6,
                  compression_threshold: int = 3,
-                 compression_batch_size: int = 3
+                 compression_batch_size: int = 3,
+                 max_retries: int = 2,
+                 retry_delay: float = 2.0,
+                 scheduler=None,
+                 user_id: str = "",
+                 on_change=None,
+                 summarizer=None,
+                 llm_every: int = 3,
+                 summary_max_chars: int = 1200,
+                 llm_timeout: float = 60
                  ):
         """
+        Compressions alternate between two tiers: a cheap extractive summary on the CPU
+        (question topics, key sentences and code of every exchange) and, every llm_every-th
+        compression, an LLM rewrite of the whole summary.
+
         Args:
             compression_model: The LLM model to use for compression
             max_raw_history: How many recent Q/A pairs to keep uncompressed
             compression_threshold: How many old exchanges to accumulate before compressing
             compression_batch_size: How many exchanges to compress at once
+            max_retries: How many times a failed compression is retried before waiting for the next exchange
+            retry_delay: Delay before the first retry (doubles with every retry)
+            scheduler: ModelScheduler of the compression model (summaries wait behind interactive answers)
+            user_id: User the compression requests are queued under
+            on_change: Called after every change of the history (e.g. to snapshot it)
+            summarizer: SharedSummarizer for the LLM tier (None sends requests to compression_model directly)
+            llm_every: Every how many compressions the LLM tier runs (0 = never, 1 = always)
+            summary_max_chars: Length limit of the extractive summary
+            llm_timeout: Seconds the LLM tier may take (slot wait included) before the extractive tier is used
         """
         self.max_raw_history = max_raw_history
         self.compression_threshold = compression_threshold
         self.compression_batch_size = compression_batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
         
         self.raw_history = []  # Recent uncompressed exchanges
         self.compressed_history = ""  # Single compressed summary that gets updated
         self.compression_model = compression_model
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.on_change = on_change
+        self.summarizer = summarizer
+        self.llm_every = llm_every
+        self.summary_max_chars = summary_max_chars
+        self.llm_timeout = llm_timeout
+
+        # Compression runs as a background task, at most one per session
+        self._compression_task = None
+        self._compression_lock = asyncio.Lock()
+        self.compressions = 0
+        self.compression_failures = 0
+        self.compressions_since_llm = 0
+        self.tier_stats = {tier: {"runs": 0, "seconds": 0.0, "input_chars": 0, "output_chars": 0} for tier in TIERS}
         
     async def add_exchange(self, question: str, answer: str) -> None:
-        """Add a new Q/A exchange"""
+        """Add a new Q/A exchange - compression (if needed) continues in the background"""
         # Add to raw history (most recent)
         self.raw_history.append({
             "question": question,
@@ -46,11 +92,36 @@ class SmartHistoryCompressor:
                 if not self.raw_history[i]['compressing']:  # Only mark if not already compressing
                     self.raw_history[i]['pending'] = True
         
-        # Check if we should compress pending exchanges
-        await self._check_compression()
-    
-    async def _check_compression(self) -> None:
-        """Compress pending exchanges if threshold is reached"""
+        self._changed()
+
+        # Check if we should compress pending exchanges, without making the caller wait for it
+        self._schedule_compression()
+
+    def _changed(self) -> None:
+        if self.on_change is not None:
+            self.on_change()
+
+    def _schedule_compression(self) -> None:
+        pending_count = len([ex for ex in self.raw_history if ex['pending'] and not ex['compressing']])
+        if pending_count < self.compression_threshold:
+            return
+        if self._compression_task is None or self._compression_task.done():
+            self._compression_task = asyncio.create_task(self._compression_loop())
+        # Otherwise the running task picks up the new pending exchanges when it finishes
+
+    async def _compression_loop(self) -> None:
+        """Compress until fewer than compression_threshold exchanges are pending"""
+        async with self._compression_lock:
+            while await self._check_compression():
+                pass
+
+    async def wait_for_compression(self) -> None:
+        """Wait until background compression (if any) has finished"""
+        while self._compression_task is not None and not self._compression_task.done():
+            await self._compression_task
+
+    async def _check_compression(self) -> bool:
+        """Compress pending exchanges if threshold is reached, returns True if something was compressed"""
         # Count how many entries are pending but not currently being compressed
         pending_count = len([ex for ex in self.raw_history if ex['pending'] and not ex['compressing']])
         
@@ -62,69 +133,102 @@ class SmartHistoryCompressor:
             for ex in pending_exchanges:
                 ex['compressing'] = True
             
-            try:
-                # Create new compressed summary by combining current compressed history with pending exchanges
-                new_compressed_summary = await self._create_compressed_summary(pending_exchanges)
-                self.compressed_history = new_compressed_summary
-                
-                # Now remove the compressed entries from raw_history
-                self.raw_history = [ex for ex in self.raw_history if not ex['compressing']]
-                
-                # Reset pending flags for remaining entries if needed
-                for ex in self.raw_history:
-                    ex['pending'] = False
+            new_compressed_summary = None
+            if self._llm_due():
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        # Create new compressed summary by combining current compressed history with pending exchanges
+                        new_compressed_summary = await asyncio.wait_for(
+                            self._run_tier("llm", pending_exchanges), timeout=self.llm_timeout
+                        )
+                        self.compressions_since_llm = 0
+                        break
+                    except asyncio.TimeoutError:
+                        # Background slots are only granted while no answer runs - under load that can take
+                        # arbitrarily long, and retrying would only wait again
+                        log_event(
+                            "compression_timeout", level=logging.WARNING, stage="compression",
+                            attempt=attempt + 1, timeout_seconds=self.llm_timeout
+                        )
+                        self.compression_failures += 1
+                        break
+                    except Exception as e:
+                        log_event(
+                            "compression_failed", level=logging.WARNING, stage="compression",
+                            attempt=attempt + 1, attempts=self.max_retries + 1, error=str(e)
+                        )
+                        if attempt == self.max_retries:
+                            # The extractive tier takes over, the LLM is tried again at the next compression
+                            self.compression_failures += 1
+                        else:
+                            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+            if new_compressed_summary is None:
+                new_compressed_summary = await self._run_tier("extractive", pending_exchanges)
+                self.compressions_since_llm += 1
+
+            self.compressed_history = new_compressed_summary
+            self.compressions += 1
                 
-                # Re-mark excess entries as pending if we're still over limit
-                if len(self.raw_history) > self.max_raw_history:
-                    excess_count = len(self.raw_history) - self.max_raw_history
-                    for i in range(excess_count):
-                        self.raw_history[i]['pending'] = True
-                        
-            except Exception as e:
-                # If compression fails, just clear the compressing entries and move on
-                print(f"Compression failed: {e}, clearing pending history")
-                self.raw_history = [ex for ex in self.raw_history if not ex['compressing']]
+            # Now remove the compressed entries from raw_history (exchanges added meanwhile stay)
+            self.raw_history = [ex for ex in self.raw_history if not ex['compressing']]
+            
+            # Reset pending flags for remaining entries if needed
+            for ex in self.raw_history:
+                ex['pending'] = False
+            
+            # Re-mark excess entries as pending if we're still over limit
+            if len(self.raw_history) > self.max_raw_history:
+                excess_count = len(self.raw_history) - self.max_raw_history
+                for i in range(excess_count):
+                    self.raw_history[i]['pending'] = True
+
+            self._changed()
+            return True
+
+        return False
+
+    def _llm_due(self) -> bool:
+        if self.llm_every <= 0 or (self.summarizer is None and self.compression_model is None):
+            return False
+        return self.compressions_since_llm + 1 >= self.llm_every
+
+    async def _run_tier(self, tier: str, exchanges: List[Dict]) -> str:
+        """New summary from one tier, with its time and size recorded"""
+        start = time.perf_counter()
+        if tier == "llm":
+            summary = await self._create_compressed_summary(exchanges)
+            model = getattr(self.compression_model, "model", "unknown")
+        else:
+            summary = extractive_summary(exchanges, self.compressed_history, self.summary_max_chars)
+            model = "extractive"
+        seconds = time.perf_counter() - start
+        COMPRESSION_SECONDS.observe(seconds, model=model, tier=tier)
+
+        stats = self.tier_stats[tier]
+        stats["runs"] += 1
+        stats["seconds"] += seconds
+        stats["input_chars"] += len(self.compressed_history) + sum(len(ex["question"]) + len(ex["answer"]) for ex in exchanges)
+        stats["output_chars"] += len(summary)
+        return summary
 
     async def _create_compressed_summary(self, exchanges: List[Dict]) -> str:
         """Use LLM to create intelligent summary of exchanges, including previous compressed history"""
         if not exchanges:
             return self.compressed_history  # Return existing summary if no new exchanges
+
+        # Shared summarizer: batched with the summaries of other sessions
+        if self.summarizer is not None:
+            return await self.summarizer.summarize(self.user_id, self.compressed_history, exchanges)
+
+        prompt = summary_prompt(self.compressed_history, exchanges)
         
-        # Prepare the conversation context from exchanges
-        conversation_text = ""
-        for i, ex in enumerate(exchanges):
-            conversation_text += f"Question {i+1}: {ex['question']}\n"
-            conversation_text += f"Answer {i+1}: {ex['answer'][:300]}{'...' if len(ex['answer']) > 300 else ''}\n\n"
-        
-        # Create prompt that includes previous compressed history for context
-        if self.compressed_history:
-            prompt = f"""
-            Previous conversation summary: {self.compressed_history}
-            
-            New exchanges to incorporate:
-            {conversation_text}
-            
-            Create a new comprehensive summary that:
-            1. Preserves the key information from the previous summary
-            2. Incorporates the new exchanges
-            3. Maintains continuity and context
-            4. Is concise but informative (2-4 sentences)
-            
-            Updated summary:
-            """
+        # Use async call to the compression model, with background priority when it is shared
+        if self.scheduler is not None:
+            async with self.scheduler.slot(self.user_id, BACKGROUND):
+                summary_response = await self.compression_model.ainvoke(prompt)
         else:
-            prompt = f"""
-            Create a concise summary (2-4 sentences) of these exchanges:
-            
-            {conversation_text}
-            
-            Focus on the main topic, questions, and key information discussed.
-            
-            Summary:
-            """
-        
-        # Use async call to the compression model
-        summary_response = await self.compression_model.ainvoke(prompt)
+            summary_response = await self.compression_model.ainvoke(prompt)
         return summary_response.strip()
     
     def get_conversation_context(self) -> str:
@@ -152,6 +256,40 @@ class SmartHistoryCompressor:
         
         return messages
     
+    def to_state(self) -> Dict:
+        """JSON-serializable snapshot of the summary and the uncompressed exchanges"""
+        return {
+            "compressed_history": self.compressed_history,
+            "raw_history": [
+                {
+                    "question": ex["question"],
+                    "answer": ex["answer"],
+                    "timestamp": ex["timestamp"],
+                    # Exchanges being compressed are not in the summary yet
+                    "pending": ex["pending"] or ex["compressing"]
+                }
+                for ex in self.raw_history
+            ],
+            "compressions": self.compressions,
+            "compressions_since_llm": self.compressions_since_llm
+        }
+
+    def load_state(self, state: Dict) -> None:
+        """Restore a snapshot from to_state - the summary is kept, only uncompressed exchanges may be compressed again"""
+        self.compressed_history = state.get("compressed_history", "")
+        self.raw_history = [dict(ex, compressing=False) for ex in state.get("raw_history", [])]
+        self.compressions = state.get("compressions", 0)
+        self.compressions_since_llm = state.get("compressions_since_llm", 0)
+        self._schedule_compression()
+
+    def unload(self) -> bool:
+        """Drop the history from memory (it must be saved elsewhere), False while a compression is running"""
+        if self._compression_task is not None and not self._compression_task.done():
+            return False
+        self.raw_history = []
+        self.compressed_history = ""
+        return True
+
     def get_stats(self) -> Dict:
         """Get compression statistics for debugging"""
         pending_count = len([ex for ex in self.raw_history if ex['pending']])
@@ -164,6 +302,18 @@ class SmartHistoryCompressor:
             "pending_compression": pending_count,
             "currently_compressing": compressing_count,
             "compressed_summary_exists": bool(self.compressed_history),
-            "compressed_summary_length": len(self.compressed_history) if self.compressed_history else 0
+            "compressed_summary_length": len(self.compressed_history) if self.compressed_history else 0,
+            "compression_running": self._compression_task is not None and not self._compression_task.done(),
+            "compressions": self.compressions,
+            "compression_failures": self.compression_failures,
+            "tiers": {
+                tier: {
+                    "runs": stats["runs"],
+                    "avg_ms": round(stats["seconds"] / stats["runs"] * 1000, 2) if stats["runs"] else None,
+                    "input_chars": stats["input_chars"],
+                    "output_chars": stats["output_chars"],
+                }
+                for tier, stats in self.tier_stats.items()
+            }
         }
     
\ No newline at end of file
@@ -0,0 +1,93 @@
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+from langchain.docstore.document import Document
+from config import Config
+
+DEFAULT_RETRIEVAL = {
+    "mode": "dense",       # "dense" (Qdrant only) or "hybrid" (Qdrant + BM25)
+    "k": 3,                # Chunks put into the prompt
+    "candidates": 20,      # Chunks taken from each retriever before fusion / reranking
+    "dense_weight": 1.0,
+    "sparse_weight": 1.0,
+    "rrf_k": 60,           # Reciprocal rank fusion constant
+    "reranker": None,      # true (Config.RERANKER_MODEL) or a cross-encoder model name
+    "parents": False,      # Return the full text (task + solution) a matching chunk was cut from
+}
+
+
+def retrieval_settings(settings: Dict) -> Dict:
+    """The "retrieval" block of a mode in nastavitve.json, with defaults filled in"""
+    retrieval = dict(DEFAULT_RETRIEVAL)
+    retrieval.update(settings.get("retrieval") or {})
+    if retrieval["reranker"] is True:
+        retrieval["reranker"] = Config.RERANKER_MODEL
+    elif not retrieval["reranker"]:
+        retrieval["reranker"] = None
+    return retrieval
+
+
+def retrieval_signature(retrieval: Dict) -> Tuple:
+    """Hashable description of the settings, so cached results of different settings do not mix"""
+    return tuple(retrieval[key] for key in sorted(DEFAULT_RETRIEVAL))
+
+
+def doc_key(doc: Document) -> str:
+    """Identity of a chunk: its Qdrant point id, or a hash of the text for documents without one"""
+    # Point ids are content hashes (rag.chunk_id), so they change whenever a chunk changes
+    point_id = doc.metadata.get("_id")
+    if point_id is not None:
+        return str(point_id)
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def rrf_fuse(rankings: Sequence[Tuple[List[Document], float]], rrf_k: int = 60) -> List[Document]:
+    """Weighted reciprocal rank fusion: score = sum(weight / (rrf_k + rank)) over the rankings"""
+    scores = {}
+    documents = {}
+    for docs, weight in rankings:
+        if not weight:
+            continue
+        for rank, doc in enumerate(docs, start=1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def rerank(reranker, query: str, docs: List[Document], k: int) -> List[Document]:
+    """Order docs by cross-encoder relevance to the query and keep the best k"""
+    if not docs:
+        return docs
+    scores = reranker.predict([(query, doc.page_content) for doc in docs])
+    ranked = sorted(zip(docs, scores), key=lambda item: float(item[1]), reverse=True)
+    return [doc for doc, _ in ranked[:k]]
+
+
+def load_reranker(model_name: str) -> Optional[object]:
+    """Cross-encoder on CPU, or None when sentence-transformers is not installed"""
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        return None
+    return CrossEncoder(model_name, device="cpu")
+
+
+def expand_parents(docs: List[Document], k: int) -> List[Document]:
+    """Replace chunks by the full text they were cut from, one per parent, and keep the best k"""
+    parents = []
+    seen = set()
+    for doc in docs:
+        key = doc.metadata.get("parent_id") or doc_key(doc)
+        if key in seen:
+            continue
+        seen.add(key)
+        parent = doc.metadata.get("parent")
+        if parent is None:
+            # Chunk from a collection built before structured chunking
+            parents.append(doc)
+        else:
+            metadata = {name: value for name, value in doc.metadata.items() if name != "parent"}
+            parents.append(Document(page_content=parent, metadata=metadata))
+        if len(parents) == k:
+            break
+    return parents
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+from langchain.docstore.document import Document
+from rag import split_text, document_id, bump_collection_version
+
+
+def _text_of(item) -> str:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict) and isinstance(item.get("text"), str):
+        return item["text"]
+    raise ValueError(f"Expected a string or an object with a 'text' field, got: {str(item)[:80]}")
+
+
+def _iter_json_array(path: Path, read_size: int = 1 << 20) -> Iterator:
+    """Yield elements of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError("JSON file should contain an array of texts!")
+        buffer = buffer[1:]
+        eof = False
+
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Element continues past the end of the buffer
+                if eof:
+                    raise
+                more = f.read(read_size)
+                eof = not more
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+            if len(buffer) < read_size and not eof:
+                more = f.read(read_size)
+                eof = not more
+                buffer += more
+
+
+def iter_texts(path) -> Iterator[str]:
+    """Lazily read texts from a .json array or a .jsonl file (one string or {"text": ...} per line)"""
+    path = Path(path)
+    if path.suffix.lower() == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield _text_of(json.loads(line))
+    else:
+        for item in _iter_json_array(path):
+            yield _text_of(item)
+
+
+def _chunk_texts(texts: List[str]) -> List[Tuple[str, Document]]:
+    """Worker: split texts into (id, chunk Document) pairs"""
+    return [(document_id(doc), doc) for text in texts for doc in split_text(text)]
+
+
+class _Checkpoint:
+    """Records how many input texts are fully uploaded, so a crashed run can resume"""
+
+    def __init__(self, path: Path, source: Path, collection_name: str):
+        self.path = path
+        self.identity = {
+            "source": str(source.resolve()),
+            "size": source.stat().st_size,
+            "mtime": source.stat().st_mtime,
+            "collection": collection_name,
+        }
+
+    def load(self) -> Dict:
+        if not self.path.exists():
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        # Only resume the same file into the same collection
+        if {key: state.get(key) for key in self.identity} != self.identity:
+            return {}
+        return state
+
+    def save(self, texts_done: int, chunks_done: int, target: str) -> None:
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**self.identity, "texts_done": texts_done, "chunks_done": chunks_done, "target": target}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+
+
+def ingest_stream(rag,
+                  path,
+                  collection_name: str,
+                  recreate: bool = False,
+                  embed_batch_size: int = 64,
+                  texts_per_task: int = 32,
+                  workers: int = 4,
+                  upload_concurrency: int = 4,
+                  checkpoint_path=None,
+                  progress_every: float = 5.0
+                  ) -> Dict:
+    """
+    Stream a large corpus into a collection with bounded memory.
+
+    Texts are read lazily, chunked in a process pool, embedded in fixed-size
+    batches and uploaded to Qdrant by a small thread pool while the next batch
+    is being embedded. Progress is written to a checkpoint file after each
+    uploaded batch; running the same command again after a crash skips the
+    texts that are already in the collection. Chunk ids are content hashes, so
+    re-uploading a partially written batch is harmless.
+
+    Args:
+        rag: RAG engine that provides the embeddings and the Qdrant client
+        path: .json (array) or .jsonl input file
+        collection_name: Target collection
+        recreate: Build a new collection version and swap the alias to it when done
+        embed_batch_size: Chunks per embedding call and per upload
+        texts_per_task: Texts sent to a chunking worker at once
+        workers: Chunking processes
+        upload_concurrency: Parallel uploads to Qdrant
+        checkpoint_path: Where to keep resume state (default: next to the input file)
+        progress_every: Seconds between progress lines
+    """
+    path = Path(path)
+    checkpoint = _Checkpoint(
+        Path(checkpoint_path) if checkpoint_path else path.with_name(f"{path.name}.{collection_name}.checkpoint.json"),
+        path,
+        collection_name
+    )
+    state = checkpoint.load()
+    texts_skipped = state.get("texts_done", 0)
+    chunks_done = state.get("chunks_done", 0)
+    if texts_skipped:
+        print(f"Resuming after {texts_skipped} texts ({chunks_done} chunks already uploaded)")
+
+    # Full rebuilds go into a new versioned collection that replaces the alias at the end
+    if not rag.client.collection_exists(rag.resolve_collection(collection_name)):
+        recreate = True
+    if texts_skipped and state.get("target"):
+        target = state["target"]
+    elif recreate:
+        target = rag.create_collection_version(collection_name)
+    else:
+        target = rag.resolve_collection(collection_name)
+    # A resumed full rebuild still has to be swapped in, even without recreate
+    swap = target != rag.resolve_collection(collection_name)
+
+    start = time.perf_counter()
+    last_progress = start
+    texts_read = texts_skipped
+    chunks_total = chunks_done
+    chunks_this_run = 0
+
+    chunk_tasks = deque()      # (future, index of the first text after this task)
+    uploads = deque()          # (future, texts fully covered once this upload is done, chunk count)
+    groups = deque()           # (cumulative chunk count, texts fully covered) for tasks waiting in the buffer
+    buffer_ids, buffer_docs = [], []
+    chunks_buffered = chunks_done
+
+    def report(final=False):
+        nonlocal last_progress
+        now = time.perf_counter()
+        if final or now - last_progress >= progress_every:
+            elapsed = now - start
+            rate = chunks_this_run / elapsed if elapsed else 0
+            print(f"Texts: {texts_read}, chunks uploaded: {chunks_total}, {rate:.1f} chunks/s")
+            last_progress = now
+
+    def finish_uploads(keep: int):
+        # Uploads complete in order, so the checkpoint always points at a contiguous prefix
+        nonlocal chunks_total, chunks_this_run
+        while len(uploads) > keep:
+            future, texts_done, count = uploads.popleft()
+            future.result()
+            chunks_total += count
+            chunks_this_run += count
+            checkpoint.save(texts_done, chunks_total, target)
+            report()
+
+    def flush(upload_pool, final=False):
+        nonlocal buffer_ids, buffer_docs
+        while len(buffer_ids) >= embed_batch_size or (final and buffer_ids):
+            ids, documents = buffer_ids[:embed_batch_size], buffer_docs[:embed_batch_size]
+            buffer_ids, buffer_docs = buffer_ids[embed_batch_size:], buffer_docs[embed_batch_size:]
+
+            batch_end = chunks_buffered - len(buffer_ids)
+            texts_done = None
+            while groups and groups[0][0] <= batch_end:
+                texts_done = groups.popleft()[1]
+            if texts_done is None:
+                texts_done = uploads[-1][1] if uploads else texts_skipped
+
+            vectors = rag.embeddings.embed_documents([doc.page_content for doc in documents])
+            uploads.append((upload_pool.submit(rag.upsert, target, ids, documents, vectors), texts_done, len(ids)))
+            finish_uploads(keep=upload_concurrency * 2)
+
+    def take_chunks(future, texts_end):
+        nonlocal chunks_buffered
+        pairs = future.result()
+        buffer_ids.extend(point_id for point_id, _ in pairs)
+        buffer_docs.extend(doc for _, doc in pairs)
+        chunks_buffered += len(pairs)
+        groups.append((chunks_buffered, texts_end))
+
+    with ProcessPoolExecutor(max_workers=workers) as chunk_pool, \
+            ThreadPoolExecutor(max_workers=upload_concurrency) as upload_pool:
+        group = []
+        texts = iter_texts(path)
+        for index, text in enumerate(texts):
+            if index < texts_skipped:
+                continue
+            group.append(text)
+            texts_read = index + 1
+            if len(group) < texts_per_task:
+                continue
+
+            chunk_tasks.append((chunk_pool.submit(_chunk_texts, group), texts_read))
+            group = []
+            # Keep a bounded number of chunking tasks in flight
+            while len(chunk_tasks) > workers * 2:
+                take_chunks(*chunk_tasks.popleft())
+                flush(upload_pool)
+
+        if group:
+            chunk_tasks.append((chunk_pool.submit(_chunk_texts, group), texts_read))
+        while chunk_tasks:
+            take_chunks(*chunk_tasks.popleft())
+            flush(upload_pool)
+
+        flush(upload_pool, final=True)
+        finish_uploads(keep=0)
+
+    if swap:
+        rag.swap_alias(collection_name, target)
+    else:
+        rag.invalidate(collection_name)
+        bump_collection_version(collection_name)
+    checkpoint.clear()
+    report(final=True)
+
+    seconds = time.perf_counter() - start
+    return {
+        "texts": texts_read - texts_skipped,
+        "chunks": chunks_this_run,
+        "seconds": round(seconds, 2),
+        "chunks_per_second": round(chunks_this_run / seconds, 1) if seconds else 0,
+    }
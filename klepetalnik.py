@@ -1,5 +1,7 @@
+import re
 import time
 import asyncio
+import threading
 from langchain_community.llms import Ollama
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.schema import StrOutputParser
@@ -7,226 +9,384 @@ from langchain.schema.runnable import Runnable, RunnablePassthrough, RunnableLam
 from langchain.schema.runnable.config import RunnableConfig
 import chainlit as cl
 from typing import Optional
-from auth import authenticate, get_code
+from auth import get_code
+from config_store import get_settings, all_settings
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.base import AsyncCallbackHandler
 import json
 from chainlit.config import config
-from rag import RAG
+from rag import get_rag, warmup, registry_stats
 from config import Config
-from history_compressor import SmartHistoryCompressor
+from pipeline import ChatPipeline, get_model, get_compression_model, preload_models, COMPRESSION_MODEL
+from logger import log_event, debug_enabled
+from streaming import ThinkTagParser, BufferedStreamer
+from response_cache import get_response_cache, make_key
+from scheduler import get_scheduler, scheduler_stats, QueueFullError, INTERACTIVE
+from session_store import get_session_manager, session_key
+from summarizer import summarizer_stats
+import logging
+from metrics import (
+    render_metrics, RETRIEVAL_SECONDS, PROMPT_TOKENS, TIME_TO_FIRST_TOKEN_SECONDS,
+    TOKENS_PER_SECOND, RESPONSE_SECONDS, MESSAGES_TOTAL, RESPONSE_CACHE_TOTAL
+)
+from chainlit.server import app
+from fastapi import Response
+
+if Config.RAG_WARMUP:
+    # Load the embedding model in the background so the server starts accepting logins right away
+    threading.Thread(target=warmup, args=(Config.EMBEDDING_MODEL,), daemon=True).start()
+
+if Config.OLLAMA_PRELOAD:
+    # Load the Ollama models and evaluate the system prompts before the first student asks
+    threading.Thread(target=preload_models, args=(all_settings(),), daemon=True).start()
+
+class CustomCallbackHandler(AsyncCallbackHandler):
+    """Measures time-to-first-token and generation speed of one answer"""
+
+    def __init__(self, mode: str, model: str, layout: str):
+        self.mode = mode
+        self.model = model
+        self.layout = layout
+        self.llm_start = None
+        self.first_token = None
+        self.tokens = 0
 
-class CustomCallbackHandler(BaseCallbackHandler):
     async def on_chain_start(self, serialized, inputs, **kwargs):
         pass
 
     async def on_llm_start(self, serialized, prompts, **kwargs):
-        pass
+        self.llm_start = time.perf_counter()
+
+    async def on_llm_new_token(self, token, **kwargs):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+            if self.llm_start is not None:
+                TIME_TO_FIRST_TOKEN_SECONDS.observe(
+                    self.first_token - self.llm_start, mode=self.mode, model=self.model, layout=self.layout
+                )
+        self.tokens += 1
+
+    async def on_llm_end(self, response, **kwargs):
+        if self.first_token is not None and self.tokens > 1:
+            generation_seconds = time.perf_counter() - self.first_token
+            if generation_seconds > 0:
+                TOKENS_PER_SECOND.observe((self.tokens - 1) / generation_seconds, mode=self.mode, model=self.model)
+
+    def timings(self):
+        return {
+            "ttft_ms": round((self.first_token - self.llm_start) * 1000) if self.first_token and self.llm_start else None,
+            "tokens": self.tokens,
+        }
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint, served by the Chainlit app"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Chainlit registers a catch-all route for its frontend first - move /metrics in front of it
+app.router.routes.insert(0, app.router.routes.pop())
 
 @cl.password_auth_callback
 def auth_callback(username: str, password: str):
-    if (authenticate(username, password)):
+    entry = get_code(password)  # One dict lookup, kode.json is kept in memory
+    if entry:
         return cl.User(
             identifier=username.upper(), 
             metadata={
                 "role": "admin", 
                 "provider": "credentials", 
-                "mode": get_code(password).get("mode", "pro1")
+                "mode": entry.get("mode", "pro1")
             }
         )
     else:
         return None
 
-def get_settings(mode: str):
-    with open("nastavitve.json", "r") as f:
-        return json.load(f)[mode]
-
 @cl.on_chat_start
 async def on_chat_start():
+    chat_start_time = time.time()
     user = cl.user_session.get("user")
     mode = user.metadata.get("mode", "default")  
     
     settings = get_settings(mode)
 
-    rag_collection_name = settings.get("rag_collection_name", Config.DEFAULT_COLLECTION_NAME)
-    cl.user_session.set("rag_collection_name", rag_collection_name)
+    cl.user_session.set("mode", mode)
+    cl.user_session.set("model_name", settings.get("model", Config.DEFAULT_LLAMA_MODEL))
 
-    rag = RAG(
+    # Shared engine - the embedding model is only loaded once per process.
+    # Run in a thread so a cold load does not block other sessions.
+    rag = await asyncio.to_thread(
+        get_rag,
         qdrant_url=Config.QDRANT_URL,
-        embedding_model=Config.EMBEDDING_MODEL, 
+        embedding_model=Config.EMBEDDING_MODEL,
         llama_model=settings.get("model", Config.DEFAULT_LLAMA_MODEL),
     )
     cl.user_session.set("rag", rag)
 
-    # Main model for responses
-    model = Ollama(
-        model=settings.get("model", Config.DEFAULT_LLAMA_MODEL),
-        temperature=settings.get("temperature", 0.3),
-        top_p=settings.get("top_p", 0.8),
-        top_k=settings.get("top_k", 50),
-        repeat_penalty=settings.get("repeat_penalty", 1.1),
-        num_ctx=settings.get("num_ctx", 2048),
-        timeout=120.0
-    )
+    # Ollama clients are shared by all sessions with the same settings
+    model = get_model(settings)
+    compression_model = get_compression_model()
 
-    # Separate model for compression (smaller & faster)
-    compression_model = Ollama(
-        model="llama3.1:8b",  # Smaller model for compression
-        temperature=0.1,      # Lower temperature for consistent summaries
-        top_p=0.9,
-        top_k=40,
-        repeat_penalty=1.0,
-        num_ctx=1024,         # Smaller context for summaries
-        timeout=30.0          # Shorter timeout for compression
+    # Retrieval settings, smart history compressor, prompt and token budget of this conversation
+    pipeline = ChatPipeline(
+        settings,
+        model,
+        compression_model,
+        compression_scheduler=get_scheduler(COMPRESSION_MODEL),
+        user_id=user.identifier
     )
+    await asyncio.to_thread(pipeline.context_assembler.counter.load)
+    cl.user_session.set("pipeline", pipeline)
+    cl.user_session.set("history_compressor", pipeline.history_compressor)
+
+    # History and summary are saved after every exchange and restored with the first message
+    # Keyed by the Chainlit thread, not just the name - anyone can log in with any name
+    session_manager = get_session_manager()
+    key = session_key(user.identifier, mode, cl.context.session.thread_id)
+    if session_manager is not None:
+        session_manager.attach(key, pipeline.history_compressor)
+    cl.user_session.set("session_key", key)
 
-    # Initialize smart history compressor
-    history_compressor = SmartHistoryCompressor(
-        compression_model=compression_model,
-        max_raw_history=settings.get("max_raw_history", 10),
-        compression_threshold=3,
-        compression_batch_size=3
-    )
-    cl.user_session.set("history_compressor", history_compressor)
-
-    prompt = ChatPromptTemplate.from_messages([
-        (
-            "system", 
-            settings.get("prompt", "") + 
-            "\n\nConversation Context - what we have talked about before:\n{conversation_context}\n\n" +
-            "Trenutno vprašanje uporabnika je zadnje sporočilo v pogovoru! Odgovori na to vprašanje."
-        ),
-        MessagesPlaceholder(variable_name="history"),
-        ("human", "{question}"),
-    ])
-    
-    runnable = prompt | model | StrOutputParser()
-    
     cl.user_session.set("thinking", settings.get("thinking", True))
-    cl.user_session.set("runnable", runnable)
+    # Answers to repeated questions are reused, but only where earlier turns cannot change the answer
+    cl.user_session.set("response_cache", settings.get("response_cache", False))
+    cl.user_session.set("response_cache_ignore_history", settings.get("response_cache_ignore_history", False))
     cl.user_session.set("model", model)
     cl.user_session.set("compression_model", compression_model)
 
+    log_event(
+        "chat_start",
+        user=user.identifier,
+        mode=mode,
+        stage="chat_start",
+        latency_ms=round((time.time() - chat_start_time) * 1000),
+        registry=registry_stats(),
+        schedulers=scheduler_stats(),
+        summarizers=summarizer_stats(),
+        sessions=session_manager.get_stats() if session_manager is not None else None
+    )
+
+@cl.on_chat_resume
+async def on_chat_resume(thread):
+    # Only called when a Chainlit data layer is configured - the history itself comes from the session store
+    await on_chat_start()
+
+@cl.on_chat_end
+async def on_chat_end():
+    session_manager = get_session_manager()
+    pipeline = cl.user_session.get("pipeline")
+    if session_manager is not None and pipeline is not None:
+        session_manager.release(cl.user_session.get("session_key"), pipeline.history_compressor)
+
+async def stream_cached_answer(answer: str) -> cl.Message:
+    """Send a cached answer word by word, the same way a generated one arrives"""
+    message = cl.Message(content="")
+    await message.send()
+    answer_stream = BufferedStreamer(message, Config.STREAM_FLUSH_MS / 1000, Config.STREAM_FLUSH_TOKENS)
+    for word in re.findall(r"\S+\s*|\s+", answer):
+        await answer_stream.add(word)
+        await asyncio.sleep(0)
+    await answer_stream.flush()
+    await message.update()
+    return message
+
 @cl.on_message
 async def on_message(message: cl.Message):
     start_time = time.time()
-    
-    with open("debugx.log", "a", encoding="utf-8") as file:
-        file.write(f"{cl.user_session.get('user').identifier}: {message.content}\n")
+    user_id = cl.user_session.get("user").identifier
+    mode = cl.user_session.get("mode")
+    model_name = cl.user_session.get("model_name")
 
-    runnable = cl.user_session.get("runnable")
-    thinking = cl.user_session.get("thinking")
+    log_event("message", user=user_id, mode=mode, stage="received", question=message.content)
+
+    pipeline = cl.user_session.get("pipeline")
+    runnable = pipeline.runnable
     rag = cl.user_session.get("rag")
-    rag_collection_name = cl.user_session.get("rag_collection_name")
-    history_compressor = cl.user_session.get("history_compressor")
+    retrieval = pipeline.retrieval
+    history_compressor = pipeline.history_compressor
+
+    # Restore the saved history after a restart or reconnect (no-op while the session is in memory)
+    session_manager = get_session_manager()
+    if session_manager is not None:
+        try:
+            await session_manager.activate(cl.user_session.get("session_key"), history_compressor)
+        except Exception as e:
+            log_event("session_restore_failed", level=logging.WARNING, user=user_id, mode=mode, stage="session", error=str(e))
 
     # Get RAG context
-    context = ""
+    docs = []
+    retrieval_start = time.time()
     try:
-        retriever = rag.get_retriever(rag_collection_name)
-        
-        # Get documents
-        docs = retriever.get_relevant_documents(message.content)
-        
-        # Combine documents
-        if docs:
-            context_parts = []
-            for i, doc in enumerate(docs, 1):
-                context_parts.append(f"{i}. {doc.page_content}")
-            context = "\n".join(context_parts).strip()
-            
-        with open("debugx.log", "a", encoding="utf-8") as file:
-            file.write(f"{cl.user_session.get('user').identifier}: RAG_CONTEXT - Found {len(docs)} documents\n")
+        # Embedding + search run off the event loop so other sessions keep streaming
+        docs = await pipeline.retrieve(rag, message.content)
+        RETRIEVAL_SECONDS.observe(time.time() - retrieval_start, mode=mode, model=model_name)
+        log_event(
+            "rag_context", user=user_id, mode=mode, stage="retrieval",
+            latency_ms=round((time.time() - retrieval_start) * 1000), documents=len(docs),
+            retrieval_mode=retrieval["mode"], reranker=retrieval["reranker"]
+        )
 
     except Exception as e:
-        with open("debugx.log", "a", encoding="utf-8") as file:
-            file.write(f"{cl.user_session.get('user').identifier}: RAG_FAILED - {e}\n")
+        log_event(
+            "rag_failed", level=logging.ERROR, user=user_id, mode=mode, stage="retrieval",
+            latency_ms=round((time.time() - retrieval_start) * 1000), error=str(e)
+        )
 
-    # Add context to question
-    if context:
-        enhanced_question = f"Please use the following context to answer the question. If the context is not relevant, use your own knowledge. Context is automatically added - do not mention the context in the answer, it would confuse the user.\n\nContext:\n{context}\n\nQuestion: {message.content}"
+    # Fill the token budget: system prompt, question, RAG chunks, recent turns, summary
+    inputs, token_usage = pipeline.build_inputs(message.content, docs)
 
-        with open("debugx.log", "a", encoding="utf-8") as file:
-            file.write(f"{cl.user_session.get('user').identifier}: ENHANCED_QUESTION - Using context\n")
-    else:
-        enhanced_question = message.content
-
-    conversation_context = history_compressor.get_conversation_context()
-    message_history = history_compressor.get_message_history()
-
-    # Log current conversation state for debugging
-    with open("debugx.log", "a", encoding="utf-8") as file:
-        stats = history_compressor.get_stats()
-        file.write(f"{cl.user_session.get('user').identifier}: CONV_STATS - {stats}\n")
-        file.write(f"{cl.user_session.get('user').identifier}: MESSAGE_HISTORY_COUNT - {len(message_history)} messages\n")
-        if history_compressor.raw_history:
-            for i, exchange in enumerate(history_compressor.raw_history):
-                status = "pending" if exchange['pending'] else "active"
-                file.write(f"{cl.user_session.get('user').identifier}: RAW_HISTORY_{i}_{status} - Q: {exchange['question'][:50]}...\n")
-        file.write(f"{cl.user_session.get('user').identifier}: CONTEXT - {conversation_context}\n")
-
-    inputs = {
-        "question": enhanced_question,
-        "history": message_history,
-        "conversation_context": conversation_context
-    }
+    PROMPT_TOKENS.observe(token_usage["total"], mode=mode, model=model_name)
+    log_event(
+        "prompt", user=user_id, mode=mode, stage="context",
+        tokens=token_usage, conversation=history_compressor.get_stats(), history_messages=len(inputs["history"])
+    )
+
+    # Verbose dump of the conversation state, only when LOG_LEVEL=DEBUG
+    if debug_enabled():
+        log_event(
+            "history_dump", level=logging.DEBUG, user=user_id, mode=mode, stage="context",
+            raw_history=[
+                {"status": "pending" if exchange['pending'] else "active", "question": exchange['question'][:50]}
+                for exchange in history_compressor.raw_history
+            ],
+            conversation_context=history_compressor.get_conversation_context()
+        )
+
+    # Repeated question without earlier turns - stream the stored answer instead of generating it again
+    cache_key = None
+    if cl.user_session.get("response_cache") and (
+        cl.user_session.get("response_cache_ignore_history")
+        or (not history_compressor.raw_history and not history_compressor.compressed_history)
+    ):
+        cache_key = make_key(mode, model_name, message.content, docs)
+        try:
+            cached_answer = await asyncio.to_thread(get_response_cache().get, cache_key)
+        except Exception as e:
+            cached_answer = None
+            log_event("response_cache_failed", level=logging.WARNING, user=user_id, mode=mode, stage="cache", error=str(e))
+
+        RESPONSE_CACHE_TOTAL.inc(mode=mode, result="hit" if cached_answer is not None else "miss")
+        if cached_answer is not None:
+            await stream_cached_answer(cached_answer)
+            await history_compressor.add_exchange(message.content, cached_answer)
+            RESPONSE_SECONDS.observe(time.time() - start_time, mode=mode, model=model_name)
+            MESSAGES_TOTAL.inc(mode=mode, model=model_name, status="cached")
+            log_event(
+                "response_cached", user=user_id, mode=mode, stage="response",
+                latency_ms=round((time.time() - start_time) * 1000), answer=cached_answer[:200]
+            )
+            return
 
     # Stream response
+    scheduler = get_scheduler(model_name)
+    queue_message = None
+
+    async def show_queue_position(position, wait_seconds):
+        nonlocal queue_message
+        content = f"V vrsti si na {position}. mestu, predviden čas čakanja je približno {max(1, round(wait_seconds))} s."
+        if queue_message is None:
+            queue_message = cl.Message(content=content)
+            await queue_message.send()
+        else:
+            queue_message.content = content
+            await queue_message.update()
+
     try:
-        stream = runnable.astream(
-            inputs,
-            config=RunnableConfig(callbacks=[CustomCallbackHandler()]),
-        )
+        # At most a few answers are generated at once, the rest wait in a fair queue
+        async with scheduler.slot(user_id, INTERACTIVE, on_wait=show_queue_position):
+            if queue_message is not None:
+                await queue_message.remove()
+
+            callback_handler = CustomCallbackHandler(mode, model_name, pipeline.layout)
+            stream = runnable.astream(
+                inputs,
+                config=RunnableConfig(callbacks=[callback_handler]),
+            )
 
-        thinking = False
-        thought_content = []
-        full_response = ""
-
-        async with cl.Step(name="Premišljujem", type="Iskrica") as thinking_step:
-            final_answer = cl.Message(content="")
-            await final_answer.send()
-
-            thinking_step.elements = []
-            thinking_step.name = f"Premišljujem"
-
-            async for chunk in stream:
-                # Handle both string output and dict output from different chain types
-                if isinstance(chunk, dict):
-                    # For retrieval chain, extract the answer
-                    content = chunk.get("answer", str(chunk))
-                else:
-                    content = chunk
-                
-                if content == "<think>":
-                    thinking = True
-                    continue
-                elif content == "</think>":
-                    thinking = False
-                    continue
-
-                if thinking:
-                    thought_content.append(content)
+            thought_content = []
+            full_response = ""
+
+            async with cl.Step(name="Premišljujem", type="Iskrica") as thinking_step:
+                final_answer = cl.Message(content="")
+                await final_answer.send()
+
+                thinking_step.elements = []
+                thinking_step.name = f"Premišljujem"
+
+                async def update_thinking_step():
                     thinking_step.name = f"Premišljujem: {len(thought_content)}"
-                    await thinking_step.stream_token(content)
                     await thinking_step.update()
-                else:
-                    full_response += content
-                    await final_answer.stream_token(content)
+
+                # Tokens are sent to the UI in batches instead of one websocket message per token
+                parser = ThinkTagParser()
+                thinking_stream = BufferedStreamer(
+                    thinking_step, Config.STREAM_FLUSH_MS / 1000, Config.STREAM_FLUSH_TOKENS, on_flush=update_thinking_step
+                )
+                answer_stream = BufferedStreamer(final_answer, Config.STREAM_FLUSH_MS / 1000, Config.STREAM_FLUSH_TOKENS)
+
+                async def handle(segments):
+                    nonlocal full_response
+                    for is_thinking, text in segments:
+                        if is_thinking:
+                            thought_content.append(text)
+                            await thinking_stream.add(text)
+                        else:
+                            # Thinking is over, show all of it before the answer continues
+                            await thinking_stream.flush()
+                            full_response += text
+                            await answer_stream.add(text)
+
+                async for chunk in stream:
+                    # Handle both string output and dict output from different chain types
+                    if isinstance(chunk, dict):
+                        # For retrieval chain, extract the answer
+                        content = chunk.get("answer", str(chunk))
+                    else:
+                        content = chunk
+
+                    await handle(parser.feed(content))
+
+                await handle(parser.flush())
+                await thinking_stream.flush()
+                await answer_stream.flush()
                     
-            await final_answer.update()
-            await thinking_step.update()
+                await final_answer.update()
+                await thinking_step.update()
 
-        # Update history compressor with new exchange (ASYNC CALL)
+        # Update history compressor with new exchange (returns right away, compression runs in the background)
         await history_compressor.add_exchange(message.content, final_answer.content)
+
+        if cache_key is not None and full_response.strip():
+            try:
+                await asyncio.to_thread(
+                    get_response_cache().put, cache_key, mode, model_name, message.content, final_answer.content
+                )
+            except Exception as e:
+                log_event("response_cache_failed", level=logging.WARNING, user=user_id, mode=mode, stage="cache", error=str(e))
         
-        # Log updated statistics
-        updated_stats = history_compressor.get_stats()
-        with open("debugx.log", "a", encoding="utf-8") as file:
-            file.write(f"{cl.user_session.get('user').identifier}: UPDATED_STATS - {updated_stats}\n")
-            file.write(f"{cl.user_session.get('user').identifier}: RESPONSE_SUCCESS - {full_response[:200]}...\n")
+        RESPONSE_SECONDS.observe(time.time() - start_time, mode=mode, model=model_name)
+        MESSAGES_TOTAL.inc(mode=mode, model=model_name, status="ok")
+        log_event(
+            "response_success", user=user_id, mode=mode, stage="response",
+            latency_ms=round((time.time() - start_time) * 1000), **callback_handler.timings(),
+            prompt_layout=pipeline.layout, conversation=history_compressor.get_stats(), answer=full_response[:200]
+        )
         
+    except QueueFullError as e:
+        await cl.Message(
+            content="Na odgovor trenutno čaka preveč vprašanj. Prosim, poskusi znova čez minuto ali dve."
+        ).send()
+        MESSAGES_TOTAL.inc(mode=mode, model=model_name, status="rejected")
+        log_event(
+            "queue_full", level=logging.WARNING, user=user_id, mode=mode, stage="queue",
+            latency_ms=round((time.time() - start_time) * 1000), error=str(e)
+        )
+
     except Exception as e:
         error_msg = f"Error processing your request: {str(e)}"
         await cl.Message(content=error_msg).send()
-        with open("debugx.log", "a", encoding="utf-8") as file:
-            file.write(f"{cl.user_session.get('user').identifier}: STREAM_ERROR - {e}\n")
+        MESSAGES_TOTAL.inc(mode=mode, model=model_name, status="error")
+        log_event(
+            "stream_error", level=logging.ERROR, user=user_id, mode=mode, stage="response",
+            latency_ms=round((time.time() - start_time) * 1000), error=str(e)
+        )
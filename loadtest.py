@@ -0,0 +1,257 @@
+"""Load test of the chat handlers: N simulated Chainlit sessions against a fake Ollama and an in-memory Qdrant.
+
+Every session logs in, runs on_chat_start and then sends M questions through on_message - the same
+handlers, history compressor, scheduler and streaming code the students use. Chainlit's session,
+messages and steps are replaced by in-process stand-ins that record when tokens arrive; Ollama is
+fake_ollama.py (started here on a free port unless --ollama-url is given) and Qdrant runs in memory,
+loaded from the course material. For each session count the report shows throughput, p50/p99 message
+latency and time to first token, event loop lag and memory:
+
+    python loadtest.py --sessions 1 8 32 --turns 5 --tokens-per-second 25 --think-tokens 40
+    python loadtest.py --sessions 16 --json loadtest.json
+"""
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import contextvars
+from config import Config
+from bench_retrieval import percentile
+from metrics import rss_mb
+
+_session = contextvars.ContextVar("loadtest_session")
+
+
+class SessionRecord:
+    """What one simulated browser tab saw"""
+
+    def __init__(self):
+        self.data = {}
+        self.thread_id = str(uuid.uuid4())
+        self.message_start = None
+        self.first_token = None
+        self.errors = 0
+        self.rejected = 0
+
+    def token(self):
+        if self.first_token is None and self.message_start is not None:
+            self.first_token = time.perf_counter()
+
+
+class FakeUserSession:
+    """cl.user_session: one dict per simulated session"""
+
+    def get(self, key, default=None):
+        return _session.get().data.get(key, default)
+
+    def set(self, key, value):
+        _session.get().data[key] = value
+
+
+class FakeContext:
+    """cl.context: only the thread id of the current session is used"""
+
+    class _Session:
+        @property
+        def thread_id(self):
+            return _session.get().thread_id
+
+    session = _Session()
+
+
+class FakeMessage:
+    """cl.Message: sending and streaming only record timings"""
+
+    def __init__(self, content="", **kwargs):
+        self.content = content
+
+    async def send(self):
+        record = _session.get()
+        if self.content.startswith("Error processing"):
+            record.errors += 1
+        elif self.content.startswith("Na odgovor trenutno čaka"):
+            record.rejected += 1
+        return self
+
+    async def update(self):
+        return True
+
+    async def remove(self):
+        return True
+
+    async def stream_token(self, token, is_sequence=False):
+        _session.get().token()
+        self.content = token if is_sequence else self.content + token
+
+
+class FakeStep(FakeMessage):
+    """cl.Step, used as an async context manager around the answer"""
+
+    def __init__(self, name="", type="", **kwargs):
+        super().__init__()
+        self.name = name
+        self.elements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+async def measure_loop_lag(samples, interval=0.01):
+    """How late the event loop wakes up a task that sleeps for interval seconds"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+
+async def run_session(app, cl, user_id, mode, questions, turns, offset, results):
+    record = SessionRecord()
+    _session.set(record)
+    record.data["user"] = cl.User(identifier=user_id, metadata={"role": "admin", "provider": "credentials", "mode": mode})
+    await app.on_chat_start()
+
+    for turn in range(turns):
+        question = questions[(offset + turn) % len(questions)]
+        record.message_start = time.perf_counter()
+        record.first_token = None
+        await app.on_message(FakeMessage(content=question))
+        end = time.perf_counter()
+        results["latency"].append(end - record.message_start)
+        if record.first_token is not None:
+            results["ttft"].append(record.first_token - record.message_start)
+
+    await app.on_chat_end()
+    results["errors"] += record.errors
+    results["rejected"] += record.rejected
+
+
+async def run_level(app, cl, sessions, turns, mode, questions):
+    results = {"latency": [], "ttft": [], "errors": 0, "rejected": 0}
+    lag = []
+    monitor = asyncio.create_task(measure_loop_lag(lag))
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        run_session(app, cl, f"LOAD{sessions}_{i}", mode, questions, turns, i, results)
+        for i in range(sessions)
+    ])
+    wall = time.perf_counter() - start
+    monitor.cancel()
+
+    def ms(values, fraction):
+        return round(percentile(values, fraction) * 1000, 1) if values else None
+
+    return {
+        "sessions": sessions,
+        "messages": len(results["latency"]),
+        "wall_seconds": round(wall, 2),
+        "messages_per_second": round(len(results["latency"]) / wall, 2) if wall else None,
+        "latency_p50_ms": ms(results["latency"], 0.5),
+        "latency_p99_ms": ms(results["latency"], 0.99),
+        "ttft_p50_ms": ms(results["ttft"], 0.5),
+        "ttft_p99_ms": ms(results["ttft"], 0.99),
+        "loop_lag_p99_ms": ms(lag, 0.99),
+        "loop_lag_max_ms": round(max(lag) * 1000, 1) if lag else None,
+        "rss_mb": round(rss_mb() or 0, 1),
+        "errors": results["errors"],
+        "rejected": results["rejected"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test on_chat_start/on_message with simulated sessions")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="Concurrent sessions, one run per value")
+    parser.add_argument("--turns", type=int, default=5, help="Messages per session")
+    parser.add_argument("--mode", default="pro1", help="Mode from nastavitve.json")
+    parser.add_argument("--questions", default="docs/eval_questions.jsonl")
+    parser.add_argument("--corpus", action="append", metavar="COLLECTION=FILE",
+                        help="Load into the in-memory Qdrant (default: the course material in docs/)")
+    parser.add_argument("--ollama-url", help="Use a running (fake) Ollama instead of starting one")
+    parser.add_argument("--tokens-per-second", type=float, default=25)
+    parser.add_argument("--prefill-ms", type=float, default=200, help="Prompt evaluation time per 1000 tokens")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--think-tokens", type=int, default=0)
+    parser.add_argument("--parallel", type=int, default=2, help="Requests the fake Ollama generates at once")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # Everything the handlers write goes to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="klepetalnik-loadtest-")
+    Config.QDRANT_URL = ":memory:"
+    Config.RAG_VERSIONS_FILE = f"{workdir}/rag_versions.json"
+    Config.RAG_INDEX_DIR = f"{workdir}/rag_index"
+    Config.RESPONSE_CACHE_FILE = f"{workdir}/response_cache.sqlite3"
+    Config.SESSION_DB = f"{workdir}/sessions.sqlite3"
+    Config.LOG_FILE = f"{workdir}/loadtest.log"
+    Config.RAG_WARMUP = False
+
+    fake = None
+    if args.ollama_url:
+        Config.OLLAMA_URL = args.ollama_url
+    else:
+        from fake_ollama import FakeOllama
+        from pipeline import COMPRESSION_MODEL
+        fake = FakeOllama(
+            port=0, tokens_per_second=args.tokens_per_second, prefill_ms_per_1k=args.prefill_ms,
+            answer_tokens=args.answer_tokens, think_tokens=args.think_tokens,
+            plain_models=[COMPRESSION_MODEL], parallel=args.parallel
+        )
+        fake.start_in_thread()
+        Config.OLLAMA_URL = fake.url
+
+    # Swap in the session stand-ins before the handlers are imported
+    import chainlit as cl
+    cl.user_session = FakeUserSession()
+    cl.context = FakeContext()
+    cl.Message = FakeMessage
+    cl.Step = FakeStep
+    import klepetalnik as app
+    from rag import get_rag
+    from config_store import get_settings
+
+    settings = get_settings(args.mode)
+    rag = get_rag(Config.QDRANT_URL, Config.EMBEDDING_MODEL, settings.get("model", Config.DEFAULT_LLAMA_MODEL))
+    for corpus in args.corpus or ["programiranje=docs/programiranje1.json", "vss=docs/vss.json"]:
+        collection, path = corpus.split("=", 1)
+        with open(path, "r", encoding="utf-8") as f:
+            rag.dodaj(json.load(f), collection)
+        rag.build_sparse_index(collection)
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = [json.loads(line)["question"] for line in f if line.strip()]
+
+    async def run():
+        levels = []
+        for sessions in args.sessions:
+            levels.append(await run_level(app, cl, sessions, args.turns, args.mode, questions))
+            print(f"{sessions} sessions done", file=sys.stderr)
+        return levels
+
+    baseline_rss = rss_mb() or 0
+    levels = asyncio.run(run())
+
+    print(f"\n{args.mode}, {args.turns} turns per session, baseline RSS {baseline_rss:.0f} MB"
+          f"{'' if fake is None else f', fake Ollama {args.tokens_per_second:g} tok/s x {args.parallel}'}")
+    print(f"{'sessions':>8} {'msg/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'ttft p50':>9} {'ttft p99':>9} "
+          f"{'lag p99':>8} {'lag max':>8} {'RSS MB':>7} {'errors':>7}")
+    for level in levels:
+        print(f"{level['sessions']:>8} {level['messages_per_second']:>7} {level['latency_p50_ms']:>8} "
+              f"{level['latency_p99_ms']:>8} {str(level['ttft_p50_ms']):>9} {str(level['ttft_p99_ms']):>9} "
+              f"{level['loop_lag_p99_ms']:>8} {level['loop_lag_max_ms']:>8} {level['rss_mb']:>7} "
+              f"{level['errors'] + level['rejected']:>7}")
+    if fake is not None:
+        print(f"fake Ollama: {fake.get_stats()}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"baseline_rss_mb": round(baseline_rss, 1), "levels": levels}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from config import Config
+
+_logger = logging.getLogger("klepetalnik")
+_setup_lock = threading.Lock()
+_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, event and the record's fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            data["error"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RotatingFile:
+    def __init__(self, path: str, max_bytes: int, max_age_seconds: float, backup_count: int):
+        """
+        Append-only log file that rotates when it gets too big or too old.
+
+        Rotated files are renamed to path.1, path.2, ... and the oldest one is deleted.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.backup_count = backup_count
+        self._file = None
+        self._opened_at = 0.0
+
+    def _open(self) -> None:
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def write_lines(self, lines) -> None:
+        if self._file is None:
+            self._open()
+
+        too_big = self.max_bytes and self._file.tell() >= self.max_bytes
+        too_old = self.max_age_seconds and time.time() - self._opened_at >= self.max_age_seconds
+        if (too_big or too_old) and self._file.tell() > 0:
+            self._rotate()
+
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BatchingQueueHandler(logging.Handler):
+    def __init__(self, sink: RotatingFile, batch_size: int = 200, flush_interval: float = 0.5, max_queue: int = 10000):
+        """
+        Logging handler that never touches the disk on the caller's thread.
+
+        Records go into a bounded queue (and are dropped, with a counter, if it is
+        full). A background thread formats them and writes them in batches of up to
+        batch_size records, at least every flush_interval seconds.
+        """
+        super().__init__()
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch) -> None:
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if self.dropped:
+            lines.append(json.dumps({"level": "WARNING", "event": "log_records_dropped", "count": self.dropped}))
+            self.dropped = 0
+        try:
+            self.sink.write_lines(lines)
+        except OSError as e:
+            print(f"Writing log failed: {e}")
+
+    def close(self) -> None:
+        """Flush what is queued and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        self.sink.close()
+        super().close()
+
+
+def setup_logging() -> logging.Logger:
+    """Configure the application logger once (file, level and rotation come from Config)"""
+    global _handler
+    with _setup_lock:
+        if _handler is None:
+            _handler = BatchingQueueHandler(
+                RotatingFile(
+                    Config.LOG_FILE,
+                    max_bytes=Config.LOG_MAX_BYTES,
+                    max_age_seconds=Config.LOG_ROTATE_SECONDS,
+                    backup_count=Config.LOG_BACKUPS
+                ),
+                batch_size=Config.LOG_BATCH_SIZE,
+                flush_interval=Config.LOG_FLUSH_SECONDS
+            )
+            _handler.setFormatter(JsonFormatter())
+            _logger.addHandler(_handler)
+            _logger.setLevel(Config.LOG_LEVEL)
+            _logger.propagate = False
+            atexit.register(_handler.close)
+    return _logger
+
+
+def log_event(event: str, level: int = logging.INFO, **fields) -> None:
+    """Log one structured record, e.g. log_event("rag_context", user=..., mode=..., stage="retrieval", latency_ms=12)"""
+    if _handler is None:
+        setup_logging()
+    if _logger.isEnabledFor(level):
+        _logger.log(level, event, extra={"fields": fields})
+
+
+def debug_enabled() -> bool:
+    """True when verbose records (history dumps) should be built at all"""
+    if _handler is None:
+        setup_logging()
+    return _logger.isEnabledFor(logging.DEBUG)
@@ -0,0 +1,194 @@
+import os
+import sys
+import math
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (64, 128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def rss_mb():
+    """
+    Current resident memory of this process in MB (None if it can't be measured).
+
+    Read from /proc/self/statm on Linux and with psutil elsewhere (Windows, macOS) when
+    it is installed. The last fallback is ru_maxrss, which is the peak, not the current RSS.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    except ImportError:
+        return None
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, function: Callable[[], float]):
+        """Gauge whose value is read from function when metrics are scraped"""
+        super().__init__(name, help_text)
+        self.function = function
+
+    def render(self) -> List[str]:
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        return super().render() + [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+RETRIEVAL_SECONDS = Histogram(
+    "klepetalnik_retrieval_seconds", "RAG retrieval time per message (embedding + search)", ("mode", "model")
+)
+EMBEDDING_SECONDS = Histogram(
+    "klepetalnik_embedding_seconds", "Query embedding time", ("model",)
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "klepetalnik_embedding_batch_size", "Queries per embedding batch", (), buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+PROMPT_TOKENS = Histogram(
+    "klepetalnik_prompt_tokens", "Prompt size in tokens", ("mode", "model"), buckets=TOKEN_BUCKETS
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "klepetalnik_time_to_first_token_seconds", "Time from sending the prompt to the first generated token",
+    ("mode", "model", "layout")
+)
+TOKENS_PER_SECOND = Histogram(
+    "klepetalnik_tokens_per_second", "Generation speed after the first token", ("mode", "model"), buckets=RATE_BUCKETS
+)
+RESPONSE_SECONDS = Histogram(
+    "klepetalnik_response_seconds", "Total time from receiving a message to the end of the answer", ("mode", "model")
+)
+COMPRESSION_SECONDS = Histogram(
+    "klepetalnik_compression_seconds", "History compression (summarization) time", ("model", "tier")
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "klepetalnik_queue_wait_seconds", "Time spent waiting for a free model slot", ("model", "priority")
+)
+QUEUE_REJECTED_TOTAL = Counter(
+    "klepetalnik_queue_rejected_total", "Requests rejected because the model queue was full", ("model",)
+)
+RESPONSE_CACHE_TOTAL = Counter(
+    "klepetalnik_response_cache_total", "Response cache lookups", ("mode", "result")
+)
+MESSAGES_TOTAL = Counter(
+    "klepetalnik_messages_total", "Handled messages", ("mode", "model", "status")
+)
@@ -0,0 +1,152 @@
+import time
+import logging
+from typing import Dict, List, Tuple
+import httpx
+from langchain_community.llms import Ollama
+from langchain.schema import StrOutputParser
+from langchain.docstore.document import Document
+from config import Config
+from history_compressor import SmartHistoryCompressor
+from summarizer import get_summarizer
+from context_builder import ContextAssembler, build_prompt, static_prefix
+from hybrid_retrieval import retrieval_settings
+from logger import log_event
+
+
+COMPRESSION_MODEL = "llama3.1:8b"  # Smaller model for compression
+COMPRESSION_NUM_CTX = 4096  # Batched summaries of several sessions go into one prompt
+
+_models = {}
+
+
+def get_model(settings: dict) -> Ollama:
+    """Main model for responses, one client per distinct model configuration"""
+    options = dict(
+        model=settings.get("model", Config.DEFAULT_LLAMA_MODEL),
+        temperature=settings.get("temperature", 0.3),
+        top_p=settings.get("top_p", 0.8),
+        top_k=settings.get("top_k", 50),
+        repeat_penalty=settings.get("repeat_penalty", 1.1),
+        num_ctx=settings.get("num_ctx", 2048),
+        base_url=Config.OLLAMA_URL,
+        keep_alive=Config.OLLAMA_KEEP_ALIVE,
+        # Counted from the moment the request reaches Ollama - time in the scheduler queue is not included
+        timeout=120.0
+    )
+    key = tuple(sorted(options.items()))
+    if key not in _models:
+        _models[key] = Ollama(**options)
+    return _models[key]
+
+
+def get_compression_model() -> Ollama:
+    """Separate model for compression (smaller & faster), shared by all sessions"""
+    if COMPRESSION_MODEL not in _models:
+        _models[COMPRESSION_MODEL] = Ollama(
+            model=COMPRESSION_MODEL,
+            temperature=0.1,      # Lower temperature for consistent summaries
+            top_p=0.9,
+            top_k=40,
+            repeat_penalty=1.0,
+            num_ctx=COMPRESSION_NUM_CTX,
+            base_url=Config.OLLAMA_URL,
+            keep_alive=Config.OLLAMA_KEEP_ALIVE,
+            timeout=30.0          # Shorter timeout for compression
+        )
+    return _models[COMPRESSION_MODEL]
+
+
+def preload_models(modes: Dict[str, Dict]) -> None:
+    """
+    Load the main model of every mode and the compression model into Ollama (blocking).
+
+    Every mode's static prompt prefix is evaluated once with the mode's num_ctx (a different
+    num_ctx would make Ollama reload the model), so the first student does not pay for loading
+    the model or for the system prompt.
+    """
+    requests = {}
+    for mode, settings in modes.items():
+        model = settings.get("model", Config.DEFAULT_LLAMA_MODEL)
+        num_ctx = settings.get("num_ctx", 2048)
+        requests.setdefault((model, num_ctx, static_prefix(settings)), mode)
+    requests.setdefault((COMPRESSION_MODEL, COMPRESSION_NUM_CTX, ""), "compression")
+
+    with httpx.Client(base_url=Config.OLLAMA_URL, timeout=300.0) as client:
+        for (model, num_ctx, prompt), mode in requests.items():
+            start = time.perf_counter()
+            try:
+                response = client.post("/api/generate", json={
+                    "model": model,
+                    "prompt": prompt,
+                    "stream": False,
+                    "keep_alive": Config.OLLAMA_KEEP_ALIVE,
+                    "options": {"num_ctx": num_ctx, "num_predict": 1},
+                })
+                response.raise_for_status()
+                log_event(
+                    "model_preloaded", stage="startup", mode=mode, model=model,
+                    latency_ms=round((time.perf_counter() - start) * 1000), prompt_chars=len(prompt)
+                )
+            except httpx.HTTPError as e:
+                log_event("model_preload_failed", level=logging.WARNING, stage="startup", mode=mode, model=model, error=str(e))
+
+
+class ChatPipeline:
+    def __init__(self, settings: Dict, model, compression_model, compression_scheduler=None, user_id: str = ""):
+        """
+        Per-conversation part of answering a question: retrieval, history and prompt assembly.
+
+        Used by the Chainlit handlers and by benchmark.py, so the benchmark measures the
+        same code path the students get.
+
+        Args:
+            settings: Mode settings from nastavitve.json
+            model: LLM for answers
+            compression_model: LLM for history summaries
+            compression_scheduler: ModelScheduler of the compression model (None runs summaries directly)
+            user_id: User the summaries are queued under
+        """
+        self.settings = settings
+        self.collection_name = settings.get("rag_collection_name", Config.DEFAULT_COLLECTION_NAME)
+        self.retrieval = retrieval_settings(settings)
+
+        self.history_compressor = SmartHistoryCompressor(
+            compression_model=compression_model,
+            max_raw_history=settings.get("max_raw_history", 10),
+            compression_threshold=3,
+            compression_batch_size=3,
+            scheduler=compression_scheduler,
+            user_id=user_id,
+            # LLM summaries of all sessions go through one batching summarizer
+            summarizer=get_summarizer(compression_model, compression_scheduler),
+            llm_every=settings.get("summary_llm_every", Config.SUMMARY_LLM_EVERY),
+            summary_max_chars=Config.SUMMARY_MAX_CHARS,
+            llm_timeout=Config.SUMMARY_LLM_TIMEOUT
+        )
+
+        self.prompt = build_prompt(settings)
+        self.runnable = self.prompt | model | StrOutputParser()
+
+        # Fits RAG chunks, recent turns and the summary into the model context window
+        self.context_assembler = ContextAssembler(
+            settings,
+            num_ctx=settings.get("num_ctx") or Config.DEFAULT_NUM_CTX,
+            answer_reserve=settings.get("answer_reserve", 512)
+        )
+        self.layout = self.context_assembler.layout
+
+    async def retrieve(self, rag, question: str) -> List[Document]:
+        """RAG context for the question (embedding + search run off the event loop)"""
+        return await rag.aretrieve(self.collection_name, question, k=self.retrieval["k"], retrieval=self.retrieval)
+
+    def build_inputs(self, question: str, docs: List[Document]) -> Tuple[Dict, Dict]:
+        """Prompt inputs and per-section token usage for the next answer"""
+        # Fill the token budget: system prompt, question, RAG chunks, recent turns, summary
+        return self.context_assembler.assemble(
+            question=question,
+            docs=docs,
+            history=self.history_compressor.get_message_history(),
+            # Only the summary itself - the status text of get_conversation_context() would change every
+            # turn and take budget as if it were a summary
+            summary=self.history_compressor.compressed_history
+        )
@@ -1,48 +1,672 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Qdrant
+import os
+import re
+import time
+import json
+import uuid
+import hashlib
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client import QdrantClient, models
 from langchain.docstore.document import Document
 from langchain_qdrant import QdrantVectorStore
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import PromptTemplate
 from langchain_ollama import OllamaLLM
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from config import Config
+from embedding_batcher import BatchingEmbeddings
+from embedding_backends import load_embeddings, embedding_dimension
+from chunking import split_document
+from retrieval_cache import RetrievalCache
+from sparse_index import BM25Index
+from vector_index import VectorIndex, VECTOR_BACKENDS
+from hybrid_retrieval import rrf_fuse, rerank, load_reranker, retrieval_signature, expand_parents
+from metrics import EMBEDDING_SECONDS, Gauge, rss_mb
+from logger import log_event
+
+# Process-wide registry. Embedding models are loaded once per model name and
+# RAG engines once per (qdrant_url, embedding_model, llama_model), so chat
+# sessions borrow the same objects instead of loading their own copies.
+_registry_lock = threading.RLock()  # Held by get_rag while RAG() is created
+# Embedding models are loaded under their own lock, so a cold load (seconds) does not
+# block sessions that only need an engine, reranker or cache that already exists
+_embeddings_lock = threading.Lock()
+_embeddings = {}
+_engines = {}
+_rerankers = {}
+_load_stats = {}
+
+
+def get_embeddings(embedding_model):
+    """Return the shared embedding model, loading it on first use"""
+    embeddings = _embeddings.get(embedding_model)
+    if embeddings is not None:
+        return embeddings
+    with _embeddings_lock:
+        embeddings = _embeddings.get(embedding_model)
+        if embeddings is None:
+            rss_before = rss_mb()
+            start = time.perf_counter()
+            embeddings = load_embeddings(embedding_model, Config.EMBEDDING_BACKEND)
+            load_seconds = time.perf_counter() - start
+            rss_after = rss_mb()
+            dimension = embedding_dimension(embeddings)
+
+            if Config.EMBED_BATCHING:
+                # Coalesce concurrent query embeddings from different sessions
+                embeddings = BatchingEmbeddings(
+                    embeddings,
+                    max_batch_size=Config.EMBED_BATCH_SIZE,
+                    max_wait_ms=Config.EMBED_BATCH_WAIT_MS,
+                    max_queue_size=Config.EMBED_QUEUE_SIZE
+                )
+
+            _load_stats[embedding_model] = {
+                "backend": Config.EMBEDDING_BACKEND,
+                "dimension": dimension,
+                "load_seconds": round(load_seconds, 3),
+                "rss_mb_before": round(rss_before, 1) if rss_before is not None else None,
+                "rss_mb_after": round(rss_after, 1) if rss_after is not None else None,
+            }
+            # Published last - callers that skip the lock read _load_stats right after
+            _embeddings[embedding_model] = embeddings
+            log_event(
+                "embeddings_loaded", stage="rag", model=embedding_model, backend=Config.EMBEDDING_BACKEND,
+                seconds=round(load_seconds, 3), rss_mb=_load_stats[embedding_model]["rss_mb_after"]
+            )
+        return embeddings
+
+
+def get_rag(qdrant_url, embedding_model, llama_model):
+    """Return the shared RAG engine for this combination of settings"""
+    key = (qdrant_url, embedding_model, llama_model)
+    rag = _engines.get(key)
+    if rag is None:
+        # Load the embeddings before taking the registry lock - get_embeddings uses _embeddings_lock,
+        # so other sessions can get engines that already exist while the model loads
+        get_embeddings(embedding_model)
+        with _registry_lock:
+            rag = _engines.get(key)
+            if rag is None:
+                rag = RAG(qdrant_url=qdrant_url, embedding_model=embedding_model, llama_model=llama_model)
+                _engines[key] = rag
+    return rag
+
+
+def get_reranker(model_name):
+    """Return the shared cross-encoder reranker (None if sentence-transformers is missing)"""
+    with _registry_lock:
+        if model_name not in _rerankers:
+            start = time.perf_counter()
+            reranker = load_reranker(model_name)
+            if reranker is None:
+                log_event("reranker_unavailable", stage="retrieval", model=model_name)
+            else:
+                _load_stats[model_name] = {"load_seconds": round(time.perf_counter() - start, 3)}
+            _rerankers[model_name] = reranker
+        return _rerankers[model_name]
+
+
+_retrieval_executor = None
+_retrieval_cache = None
+
+
+def get_retrieval_cache():
+    """Process-wide retrieval cache (None when disabled)"""
+    global _retrieval_cache
+    if _retrieval_cache is None and Config.RAG_CACHE:
+        with _registry_lock:
+            if _retrieval_cache is None:
+                _retrieval_cache = RetrievalCache(
+                    max_entries=Config.RAG_CACHE_SIZE,
+                    ttl_seconds=Config.RAG_CACHE_TTL,
+                    semantic=Config.RAG_SEMANTIC_CACHE,
+                    semantic_max_entries=Config.RAG_SEMANTIC_CACHE_SIZE,
+                    semantic_ttl_seconds=Config.RAG_SEMANTIC_CACHE_TTL,
+                    similarity_threshold=Config.RAG_SEMANTIC_THRESHOLD,
+                    log_every=Config.RAG_CACHE_LOG_EVERY
+                )
+    return _retrieval_cache
+
+
+def _get_retrieval_executor():
+    """Bounded thread pool for blocking retrieval (query embedding + Qdrant search)"""
+    global _retrieval_executor
+    if _retrieval_executor is None:
+        with _registry_lock:
+            if _retrieval_executor is None:
+                _retrieval_executor = ThreadPoolExecutor(
+                    max_workers=Config.RAG_RETRIEVAL_WORKERS,
+                    thread_name_prefix="rag-retrieval"
+                )
+    return _retrieval_executor
+
+
+Gauge(
+    "klepetalnik_embedding_queue_depth",
+    "Query embeddings waiting for a batch",
+    lambda: sum(e.queue_depth for e in list(_embeddings.values()) if isinstance(e, BatchingEmbeddings))
+)
+
+
+def warmup(embedding_model):
+    """Load the embedding model and run one query so the first chat does not pay for it"""
+    embeddings = get_embeddings(embedding_model)
+    start = time.perf_counter()
+    embeddings.embed_query("warmup")
+    _load_stats[embedding_model]["warmup_seconds"] = round(time.perf_counter() - start, 3)
+
+
+def registry_stats():
+    """Loaded models and engines with their load time and memory footprint"""
+    rss = rss_mb()
+    return {
+        "embedding_models": {name: dict(stats) for name, stats in _load_stats.items()},
+        "embedding_batching": {
+            name: embeddings.get_stats()
+            for name, embeddings in _embeddings.items()
+            if isinstance(embeddings, BatchingEmbeddings)
+        },
+        "engines": ["|".join(key) for key in _engines],
+        "retrieval_cache": _retrieval_cache.get_stats() if _retrieval_cache is not None else None,
+        "rss_mb": round(rss, 1) if rss is not None else None,
+    }
+
+
+# Collection versions are kept in a small JSON file next to the app. update_rag.py
+# bumps the version after rebuilding a collection and running servers notice the
+# change with a cheap stat() instead of asking Qdrant on every message.
+_versions_lock = threading.RLock()
+_versions = {"mtime": None, "data": {}}
+
+
+def _read_versions():
+    try:
+        mtime = os.stat(Config.RAG_VERSIONS_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    if mtime != _versions["mtime"]:
+        with _versions_lock:
+            try:
+                with open(Config.RAG_VERSIONS_FILE, "r", encoding="utf-8") as f:
+                    _versions["data"] = json.load(f)
+                _versions["mtime"] = mtime
+            except (OSError, ValueError):
+                # File is being replaced, use the last version we have seen
+                pass
+    return _versions["data"]
+
+
+def get_collection_version(collection_name):
+    """Current version of the collection (0 if it was never rebuilt by update_rag.py)"""
+    return _read_versions().get(collection_name, 0)
+
+
+def bump_collection_version(collection_name):
+    """Mark the collection as changed so cached handles in all processes are dropped"""
+    with _versions_lock:
+        versions = dict(_read_versions())
+        versions[collection_name] = versions.get(collection_name, 0) + 1
+
+        tmp_file = Config.RAG_VERSIONS_FILE + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(versions, f, indent=2)
+        os.replace(tmp_file, Config.RAG_VERSIONS_FILE)
+        return versions[collection_name]
+
+
+def split_text(text):
+    """Split one text into chunk Documents (module level so ingestion workers can use it)"""
+    return split_document(text, Config.CHUNKING, Config.CHUNK_MAX_CHARS)
+
+
+def sparse_index_path(collection_name):
+    """BM25 index file of a collection (alias name), written by update_rag.py"""
+    return os.path.join(Config.RAG_INDEX_DIR, f"{collection_name}.bm25.json")
+
+
+def vector_index_path(collection_name):
+    """Embedded vector index of a collection (alias name, without .json / .npy), written by update_rag.py"""
+    return os.path.join(Config.RAG_INDEX_DIR, f"{collection_name}.vectors")
+
+
+def chunk_id(text):
+    """Deterministic point id derived from the chunk content"""
+    return str(uuid.UUID(hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]))
+
+
+def document_id(doc):
+    """Point id of a chunk Document - includes the parent, so a changed parent text is uploaded again"""
+    parent = doc.metadata.get("parent_id")
+    return chunk_id(doc.page_content if parent is None else f"{parent}\n{doc.page_content}")
+
 
 class RAG:
     def __init__(self, qdrant_url, embedding_model, llama_model):
         self.qdrant_url = qdrant_url
-        #self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model, model_kwargs={'device': 'cpu'})
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model, model_kwargs={})
+        self.embedding_model = embedding_model
+        self.embeddings = get_embeddings(embedding_model)
+        self.dimension = _load_stats[embedding_model]["dimension"]
         self.llm = OllamaLLM(model=llama_model)
+        if Config.VECTOR_BACKEND not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend '{Config.VECTOR_BACKEND}', expected one of: {', '.join(VECTOR_BACKENDS)}")
+        self.backend = Config.VECTOR_BACKEND
+
+        # Long-lived Qdrant client (keeps its HTTP connections open) and
+        # per-collection vector store handles: collection_name -> (version, store, retriever)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._stores = {}
+        self._sparse = {}  # collection_name -> ((version, file mtime), BM25Index or None)
+        self._vectors = {}  # collection_name -> ((version, file mtime), VectorIndex)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    if self.qdrant_url == ":memory:":
+                        # Local in-process instance (benchmarks, tests)
+                        self._client = QdrantClient(location=":memory:")
+                    elif self.backend != "qdrant":
+                        # On-disk Qdrant without a server; with "embedded" only update_rag.py opens it
+                        self._client = QdrantClient(path=Config.QDRANT_PATH)
+                    else:
+                        self._client = QdrantClient(url=self.qdrant_url)
+        return self._client
+
+    def invalidate(self, collection_name=None):
+        """Drop cached vector store handles and results (all of them if no collection is given)"""
+        if collection_name is None:
+            self._stores.clear()
+            self._sparse.clear()
+            self._vectors.clear()
+        else:
+            self._stores.pop(collection_name, None)
+            self._sparse.pop(collection_name, None)
+            self._vectors.pop(collection_name, None)
+
+        cache = get_retrieval_cache()
+        if cache is not None:
+            cache.invalidate(collection_name)
+
+    def _store_entry(self, collection_name):
+        """Cached (version, vector store, retriever), rebuilt when the collection version changes"""
+        version = get_collection_version(collection_name)
+        cached = self._stores.get(collection_name)
+        if cached is not None and cached[0] == version:
+            return cached
+
+        # Resolve the alias and validate the collection once, not on every question
+        target = self.resolve_collection(collection_name)
+        self.check_dimension(target)
+        vector_store = QdrantVectorStore(
+            client=self.client,
+            collection_name=target,
+            embedding=self.embeddings
+        )
+        retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 3})
+        entry = (version, vector_store, retriever)
+        self._stores[collection_name] = entry
+        return entry
+
+    def get_vector_store(self, collection_name):
+        return self._store_entry(collection_name)[1]
 
     def split_text_into_chunks(self, texts):
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=250, chunk_overlap=50)
-        chunks = text_splitter.split_text(texts)
-        return chunks
+        return split_text(texts)
     
-    def dodaj(self, text_array, collection_name, force_recreate = True):
-        doc_array = []
+    def split_documents(self, text_array):
+        """Split texts into chunk Documents, keyed by their content-hash id (duplicates collapse)"""
+        documents = {}
         for txt in text_array:
-            chunks = self.split_text_into_chunks(txt)
-            doc_array.extend([Document(page_content=chunk) for chunk in chunks])
+            for doc in self.split_text_into_chunks(txt):
+                documents.setdefault(document_id(doc), doc)
+        return documents
+
+    def dodaj(self, text_array, collection_name, force_recreate = True, batch_size=64):
+        """Add texts. With force_recreate the collection is rebuilt as a new version and swapped in atomically"""
+        start = time.perf_counter()
+        documents = self.split_documents(text_array)
+
+        if force_recreate:
+            target = self.create_collection_version(collection_name)
+        else:
+            target = self.resolve_collection(collection_name)
+            self.ensure_collection(target)
+
+        self._embed_and_upsert(target, list(documents), documents, batch_size)
+
+        if force_recreate:
+            self.swap_alias(collection_name, target)
+        else:
+            self.invalidate(collection_name)
+            bump_collection_version(collection_name)
+        print("Documents added successfully!")
+        return {"added": len(documents), "skipped": 0, "deleted": 0, "seconds": round(time.perf_counter() - start, 2)}
+
+    def _embed_and_upsert(self, collection_name, ids, documents, batch_size):
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i + batch_size]
+            docs = [documents[point_id] for point_id in batch]
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in docs])
+            self.upsert(collection_name, batch, docs, vectors)
 
-        Qdrant.from_documents(
-            doc_array,
-            self.embeddings,
-            url=self.qdrant_url,
+    def ensure_collection(self, collection_name, recreate=False):
+        """Create the collection (sized for the embedding model) if it does not exist yet"""
+        exists = self.client.collection_exists(collection_name)
+        if exists and recreate:
+            self.client.delete_collection(collection_name)
+            exists = False
+
+        if not exists:
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=models.VectorParams(size=self.dimension, distance=models.Distance.COSINE)
+            )
+        else:
+            self.check_dimension(collection_name)
+
+    def check_dimension(self, collection_name):
+        """Refuse to use a collection built with an embedding model of another vector size"""
+        vectors = self.client.get_collection(collection_name).config.params.vectors
+        size = getattr(vectors, "size", None)
+        if size is not None and size != self.dimension:
+            raise ValueError(
+                f"Collection '{collection_name}' has {size}-dimensional vectors, but '{self.embedding_model}' "
+                f"({Config.EMBEDDING_BACKEND}) produces {self.dimension}. Use the embedding model the collection "
+                f"was built with or rebuild it with update_rag.py"
+            )
+
+    def upsert(self, collection_name, ids, documents, vectors):
+        """Write embedded documents in the payload layout used by the langchain Qdrant stores"""
+        self.client.upsert(
             collection_name=collection_name,
-            force_recreate=force_recreate
+            points=[
+                models.PointStruct(
+                    id=point_id,
+                    vector=vector,
+                    payload={"page_content": doc.page_content, "metadata": doc.metadata}
+                )
+                for point_id, doc, vector in zip(ids, documents, vectors)
+            ]
         )
-        print("Documents added successfully!")
+
+    def resolve_collection(self, collection_name):
+        """Concrete collection behind an alias, or the name itself when it is not an alias"""
+        for alias in self.client.get_aliases().aliases:
+            if alias.alias_name == collection_name:
+                return alias.collection_name
+        return collection_name
+
+    def _collection_versions(self, collection_name):
+        pattern = re.compile(rf"^{re.escape(collection_name)}_v(\d+)$")
+        versions = []
+        for collection in self.client.get_collections().collections:
+            match = pattern.match(collection.name)
+            if match:
+                versions.append((int(match.group(1)), collection.name))
+        return sorted(versions)
+
+    def create_collection_version(self, collection_name):
+        """Create the next versioned collection (e.g. programiranje_v42) for a blue/green rebuild"""
+        versions = self._collection_versions(collection_name)
+        target = f"{collection_name}_v{versions[-1][0] + 1 if versions else 1}"
+        self.ensure_collection(target, recreate=True)
+        return target
+
+    def swap_alias(self, collection_name, target):
+        """Atomically point the alias at target, then garbage-collect old versions"""
+        operations = []
+        if self.resolve_collection(collection_name) != collection_name:
+            operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=collection_name)))
+        elif self.client.collection_exists(collection_name):
+            # One-time migration from a plain collection to an alias with the same name
+            print(f"Replacing plain collection '{collection_name}' with an alias")
+            self.client.delete_collection(collection_name)
+        operations.append(models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=target, alias_name=collection_name)
+        ))
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+
+        # Keep the previous version(s) so servers that still hold an old handle keep working
+        for _, name in self._collection_versions(collection_name)[:-max(1, Config.RAG_KEEP_VERSIONS)]:
+            if name != target:
+                self.client.delete_collection(name)
+
+        self.invalidate(collection_name)
+        bump_collection_version(collection_name)
+
+    def collection_stats(self, collection_name):
+        """Vector count and vector size of the collection behind the alias (None when it does not exist)"""
+        target = self.resolve_collection(collection_name)
+        if not self.client.collection_exists(target):
+            return None
+        info = self.client.get_collection(target)
+        return {"collection": target, "vectors": info.points_count, "dimension": getattr(info.config.params.vectors, "size", None)}
+
+    def _existing_ids(self, collection_name):
+        ids = set()
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=1000,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            ids.update(str(point.id) for point in points)
+            if offset is None:
+                return ids
+
+    def posodobi(self, text_array, collection_name, batch_size=64):
+        """Incremental update: embed only new or changed chunks, delete removed ones, keep the rest"""
+        start = time.perf_counter()
+        documents = self.split_documents(text_array)
+
+        target = self.resolve_collection(collection_name)
+        if not self.client.collection_exists(target):
+            # First build goes through a versioned collection so later rebuilds can swap
+            return self.dodaj(text_array, collection_name, force_recreate=True, batch_size=batch_size)
+
+        existing_ids = self._existing_ids(target)
+        new_ids = [point_id for point_id in documents if point_id not in existing_ids]
+        removed_ids = [point_id for point_id in existing_ids if point_id not in documents]
+
+        # Upsert first and delete afterwards, so the collection is never missing content
+        self._embed_and_upsert(target, new_ids, documents, batch_size)
+
+        if removed_ids:
+            self.client.delete(
+                collection_name=target,
+                points_selector=models.PointIdsList(points=removed_ids)
+            )
+
+        if new_ids or removed_ids:
+            self.invalidate(collection_name)
+            bump_collection_version(collection_name)
+
+        return {
+            "added": len(new_ids),
+            "skipped": len(documents) - len(new_ids),
+            "deleted": len(removed_ids),
+            "seconds": round(time.perf_counter() - start, 2)
+        }
 
     def get_retriever(self, collection_name):
-        qDrant_vector = QdrantVectorStore.from_existing_collection(
-            collection_name=collection_name, 
-            url=self.qdrant_url,
-            embedding=self.embeddings
+        return self._store_entry(collection_name)[2]
+
+    def retrieve(self, collection_name, query, k=3, retrieval=None):
+        """Return the k most relevant documents from the collection (blocking).
+
+        retrieval: settings from hybrid_retrieval.retrieval_settings; plain dense search when None
+        """
+        try:
+            return self._retrieve(collection_name, query, k, retrieval)
+        except Exception:
+            # The cached handle may point at an old version that was garbage-collected - resolve again
+            self.invalidate(collection_name)
+            return self._retrieve(collection_name, query, k, retrieval)
+
+    def _embed_query(self, query):
+        start = time.perf_counter()
+        embedding = self.embeddings.embed_query(query)
+        EMBEDDING_SECONDS.observe(time.perf_counter() - start, model=self.embedding_model)
+        return embedding
+
+    def _retrieve(self, collection_name, query, k, retrieval=None):
+        if retrieval is not None and retrieval.get("mode") != "hybrid" and not retrieval.get("reranker") \
+                and not retrieval.get("parents"):
+            retrieval = None  # Plain dense search
+
+        cache = get_retrieval_cache()
+        if cache is None:
+            return self._search(collection_name, query, self._embed_query(query), k, retrieval)
+
+        # Results of different retrieval settings are cached separately
+        cache_k = k if retrieval is None else (k,) + retrieval_signature(retrieval)
+        version = get_collection_version(collection_name)
+        docs = cache.get_exact(collection_name, version, query, cache_k)
+        if docs is not None:
+            return docs
+
+        # Embed once and use the vector for both the similarity cache and the search
+        embedding = self._embed_query(query)
+        docs = cache.get_similar(collection_name, version, embedding, cache_k)
+        if docs is None:
+            docs = self._search(collection_name, query, embedding, k, retrieval)
+            cache.put_similar(collection_name, version, query, embedding, cache_k, docs)
+
+        cache.put_exact(collection_name, version, query, cache_k, docs)
+        return docs
+
+    def _dense_search(self, collection_name, embedding, k):
+        if self.backend == "embedded":
+            return [doc for doc, _ in self.get_vector_index(collection_name).search(embedding, k)]
+        return self.get_vector_store(collection_name).similarity_search_by_vector(embedding, k=k)
+
+    def _search(self, collection_name, query, embedding, k, retrieval=None):
+        if retrieval is None:
+            return self._dense_search(collection_name, embedding, k)
+
+        candidates = max(k, retrieval["candidates"])
+        rankings = [(self._dense_search(collection_name, embedding, candidates), retrieval["dense_weight"])]
+        if retrieval["mode"] == "hybrid":
+            index = self.get_sparse_index(collection_name)
+            if index is not None:
+                rankings.append(([doc for doc, _ in index.search(query, candidates)], retrieval["sparse_weight"]))
+        docs = rrf_fuse(rankings, retrieval["rrf_k"])
+
+        # Several chunks can come from the same parent, keep enough of them to fill k parents
+        limit = candidates if retrieval["parents"] else k
+        if retrieval["reranker"]:
+            reranker = get_reranker(retrieval["reranker"])
+            if reranker is not None:
+                docs = rerank(reranker, query, docs[:candidates], limit)
+        docs = docs[:limit]
+
+        if retrieval["parents"]:
+            return expand_parents(docs, k)
+        return docs
+
+    def get_sparse_index(self, collection_name):
+        """Loaded BM25 index of the collection, reloaded when update_rag.py writes a new one"""
+        path = sparse_index_path(collection_name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        key = (get_collection_version(collection_name), mtime)
+        cached = self._sparse.get(collection_name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        index = None
+        if mtime is None:
+            log_event("sparse_index_missing", stage="retrieval", collection=collection_name, file=path)
+        else:
+            try:
+                index = BM25Index.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                log_event("sparse_index_failed", stage="retrieval", collection=collection_name, error=str(e))
+        self._sparse[collection_name] = (key, index)
+        return index
+
+    def get_vector_index(self, collection_name):
+        """Loaded embedded vector index of the collection, reloaded when update_rag.py writes a new one"""
+        path = vector_index_path(collection_name)
+        try:
+            mtime = os.stat(f"{path}.json").st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"No embedded vector index for '{collection_name}' ({path}.json), build it with update_rag.py"
+            ) from None
+        key = (get_collection_version(collection_name), mtime)
+        cached = self._vectors.get(collection_name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        index = VectorIndex.load(path)
+        if len(index) and index.dimension != self.dimension:
+            raise ValueError(
+                f"Vector index '{path}' has {index.dimension}-dimensional vectors, but '{self.embedding_model}' "
+                f"({Config.EMBEDDING_BACKEND}) produces {self.dimension}. Rebuild it with update_rag.py"
+            )
+        self._vectors[collection_name] = (key, index)
+        return index
+
+    def _scroll_points(self, collection_name, with_vectors=False):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=1000,
+                offset=offset,
+                with_payload=True,
+                with_vectors=with_vectors
+            )
+            for point in points:
+                payload = point.payload or {}
+                yield str(point.id), Document(
+                    page_content=payload.get("page_content", ""),
+                    metadata=payload.get("metadata") or {}
+                ), point.vector
+            if offset is None:
+                return
+
+    def _scroll_documents(self, collection_name):
+        for point_id, doc, _ in self._scroll_points(collection_name):
+            yield point_id, doc
+
+    def build_sparse_index(self, collection_name):
+        """Build the BM25 index from the live collection and save it for the chat servers"""
+        start = time.perf_counter()
+        target = self.resolve_collection(collection_name)
+        index = BM25Index().build(self._scroll_documents(target), collection=target)
+        index.save(sparse_index_path(collection_name))
+        self._sparse.pop(collection_name, None)
+        return {**index.get_stats(), "seconds": round(time.perf_counter() - start, 2)}
+
+    def build_vector_index(self, collection_name):
+        """Export the live collection to the embedded vector index the chat servers search"""
+        start = time.perf_counter()
+        target = self.resolve_collection(collection_name)
+        index = VectorIndex().build(self._scroll_points(target, with_vectors=True), collection=target)
+        index.save(vector_index_path(collection_name))
+        # Results cached from the previous index must not outlive it
+        self.invalidate(collection_name)
+        bump_collection_version(collection_name)
+        return {**index.get_stats(), "seconds": round(time.perf_counter() - start, 2)}
+
+    async def aretrieve(self, collection_name, query, k=3, retrieval=None):
+        """Async retrieve - runs on a bounded thread pool so the event loop keeps serving other sessions"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_retrieval_executor(), self.retrieve, collection_name, query, k, retrieval
         )
-        retriever = qDrant_vector.as_retriever(search_type="similarity", search_kwargs={"k": 3})
-        return retriever
 
     def get_chain(self, collection_name):
         """Create and return a retrieval chain for the given collection"""
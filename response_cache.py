@@ -0,0 +1,137 @@
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+from langchain.docstore.document import Document
+from config import Config
+from retrieval_cache import normalize_query
+from hybrid_retrieval import doc_key
+
+
+def make_key(mode: str, model: str, question: str, docs: List[Document]) -> str:
+    """Cache key of an answer: mode, model, normalized question and the retrieved chunks"""
+    parts = [mode, model, normalize_query(question)] + [doc_key(doc) for doc in docs]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str = "response_cache.sqlite3", ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 5000):
+        """
+        Persistent cache of complete answers to repeated questions.
+
+        Entries expire ttl_seconds after they were written; when there are more than
+        max_entries, the least recently used ones are removed. Calls block on SQLite,
+        use asyncio.to_thread from async code.
+
+        Args:
+            path: SQLite database file
+            ttl_seconds: How long a cached answer stays valid
+            max_entries: Maximum number of cached answers
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                mode TEXT NOT NULL,
+                model TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._connection.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT answer, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._connection.commit()
+                self.misses += 1
+                return None
+
+            self._connection.execute(
+                "UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, mode: str, model: str, question: str, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, mode, model, question, answer, created, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, mode, model, question, answer, now, now)
+            )
+            self._evict(now)
+            self._connection.commit()
+
+    def _evict(self, now: float) -> None:
+        self._connection.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        count = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self, mode: Optional[str] = None) -> int:
+        """Remove all cached answers (of one mode), returns the number of removed entries"""
+        with self._lock:
+            if mode is None:
+                cursor = self._connection.execute("DELETE FROM responses")
+            else:
+                cursor = self._connection.execute("DELETE FROM responses WHERE mode = ?", (mode,))
+            self._connection.commit()
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide response cache (settings from Config.RESPONSE_CACHE_*)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                Config.RESPONSE_CACHE_FILE,
+                ttl_seconds=Config.RESPONSE_CACHE_TTL,
+                max_entries=Config.RESPONSE_CACHE_SIZE
+            )
+        return _cache
@@ -0,0 +1,161 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from logger import log_event
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!.,;: ")
+
+
+class RetrievalCache:
+    def __init__(self,
+                 max_entries: int = 512,
+                 ttl_seconds: float = 600,
+                 semantic: bool = False,
+                 semantic_max_entries: int = 256,
+                 semantic_ttl_seconds: float = 600,
+                 similarity_threshold: float = 0.95,
+                 log_every: int = 100
+                 ):
+        """
+        Two level cache of retrieval results, scoped per collection.
+
+        The exact level is an LRU keyed on the normalized query text. The optional
+        semantic level compares the query embedding with embeddings of earlier
+        queries and reuses their results when the cosine similarity is above
+        similarity_threshold. Entries of a collection are dropped when its version
+        changes (update_rag.py rebuilt it).
+
+        Args:
+            max_entries: Size of the exact level per collection
+            ttl_seconds: How long exact entries stay valid
+            semantic: Enable the similarity level
+            semantic_max_entries: Size of the similarity level per collection
+            semantic_ttl_seconds: How long similarity entries stay valid
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+            log_every: Log hit/miss counters every N lookups (0 disables)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.semantic_max_entries = semantic_max_entries
+        self.semantic_ttl_seconds = semantic_ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.log_every = log_every
+
+        self._lock = threading.Lock()
+        self._collections = {}  # collection_name -> {"version", "exact", "semantic"}
+        self._stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    def _scope(self, collection_name: str, version) -> Dict:
+        scope = self._collections.get(collection_name)
+        if scope is None or scope["version"] != version:
+            if scope is not None:
+                self._stats["invalidations"] += 1
+            scope = {"version": version, "exact": OrderedDict(), "semantic": OrderedDict()}
+            self._collections[collection_name] = scope
+        return scope
+
+    def get_exact(self, collection_name: str, version, query: str, k: int) -> Optional[List]:
+        key = (normalize_query(query), k)
+        with self._lock:
+            self._stats["lookups"] += 1
+            exact = self._scope(collection_name, version)["exact"]
+            entry = exact.get(key)
+            if entry is not None:
+                stored_at, docs = entry
+                if time.time() - stored_at <= self.ttl_seconds:
+                    exact.move_to_end(key)
+                    self._stats["exact_hits"] += 1
+                    self._maybe_log()
+                    return docs
+                del exact[key]
+        return None
+
+    def put_exact(self, collection_name: str, version, query: str, k: int, docs: List) -> None:
+        key = (normalize_query(query), k)
+        with self._lock:
+            exact = self._scope(collection_name, version)["exact"]
+            exact[key] = (time.time(), docs)
+            exact.move_to_end(key)
+            while len(exact) > self.max_entries:
+                exact.popitem(last=False)
+
+    def get_similar(self, collection_name: str, version, embedding: List[float], k: int) -> Optional[List]:
+        """Look up by query embedding - counts as a miss when nothing is found"""
+        result = None
+        if self.semantic:
+            query_vector = self._unit(embedding)
+            with self._lock:
+                semantic = self._scope(collection_name, version)["semantic"]
+                now = time.time()
+                for key in [key for key, entry in semantic.items() if now - entry[0] > self.semantic_ttl_seconds]:
+                    del semantic[key]
+
+                candidates = [(key, entry) for key, entry in semantic.items() if key[1] == k]
+                if candidates:
+                    matrix = np.stack([entry[1] for _, entry in candidates])
+                    scores = matrix @ query_vector
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        key, entry = candidates[best]
+                        semantic.move_to_end(key)
+                        result = entry[2]
+
+        with self._lock:
+            if result is not None:
+                self._stats["semantic_hits"] += 1
+            else:
+                self._stats["misses"] += 1
+            self._maybe_log()
+        return result
+
+    def put_similar(self, collection_name: str, version, query: str, embedding: List[float], k: int, docs: List) -> None:
+        if not self.semantic:
+            return
+        key = (normalize_query(query), k)
+        with self._lock:
+            semantic = self._scope(collection_name, version)["semantic"]
+            semantic[key] = (time.time(), self._unit(embedding), docs)
+            semantic.move_to_end(key)
+            while len(semantic) > self.semantic_max_entries:
+                semantic.popitem(last=False)
+
+    def invalidate(self, collection_name: Optional[str] = None) -> None:
+        with self._lock:
+            if collection_name is None:
+                self._collections.clear()
+            else:
+                self._collections.pop(collection_name, None)
+            self._stats["invalidations"] += 1
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _maybe_log(self) -> None:
+        if self.log_every and self._stats["lookups"] % self.log_every == 0:
+            log_event("retrieval_cache", stage="retrieval", **self._stats_unlocked())
+
+    def _stats_unlocked(self) -> Dict:
+        lookups = self._stats["lookups"]
+        hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+        return {
+            **self._stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0,
+            "exact_entries": sum(len(scope["exact"]) for scope in self._collections.values()),
+            "semantic_entries": sum(len(scope["semantic"]) for scope in self._collections.values()),
+        }
+
+    def get_stats(self) -> Dict:
+        """Hit/miss counters and cache sizes"""
+        with self._lock:
+            return self._stats_unlocked()
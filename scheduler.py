@@ -0,0 +1,257 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+from config import Config
+from metrics import QUEUE_WAIT_SECONDS, QUEUE_REJECTED_TOTAL
+
+INTERACTIVE = 0  # Answers a student is waiting for
+BACKGROUND = 1   # History summarization and other work nobody watches
+
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class QueueFullError(Exception):
+    """Raised when too many requests are already waiting for a model"""
+
+
+class _Waiter:
+    def __init__(self, user: str, priority: int):
+        self.user = user
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.perf_counter()
+
+
+class ModelScheduler:
+    def __init__(self,
+                 model: str,
+                 concurrency: int = 2,
+                 max_queue: int = 40,
+                 server: Optional["ModelScheduler"] = None,
+                 background_when_idle: bool = False
+                 ):
+        """
+        Admission control for one Ollama model.
+
+        At most `concurrency` generations run at once. Waiting requests are grouped per
+        user and served round-robin between users (FIFO within one user), interactive
+        answers always before background work. When `max_queue` requests of the same or
+        higher priority are already waiting, new ones are rejected with QueueFullError.
+
+        Args:
+            model: Model name (the metrics label)
+            concurrency: Generations of this model at once
+            max_queue: Waiting requests before new ones are rejected
+            server: Scheduler shared by all models of the Ollama server; slot() also takes one of its slots
+            background_when_idle: Background work only starts while no interactive request is running
+        """
+        self.model = model
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.server = server
+        self.background_when_idle = background_when_idle
+
+        self.active = 0
+        self._active = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._queues = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}  # priority -> user -> deque of waiters
+        self._service_seconds = 10.0  # Moving average of how long one request holds a slot
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(waiters) for queue in self._queues.values() for waiters in queue.values())
+
+    def _waiting_before(self, priority: int) -> int:
+        """Waiting requests of this or a higher priority - a background backlog never rejects answers"""
+        return sum(len(waiters) for p, queue in self._queues.items() if p <= priority for waiters in queue.values())
+
+    def _admits(self, priority: int) -> bool:
+        return priority == INTERACTIVE or not self.background_when_idle or not self._active[INTERACTIVE]
+
+    def _dispatch_order(self) -> List[_Waiter]:
+        """Waiters in the order they will get a slot"""
+        order = []
+        for priority in sorted(self._queues):
+            per_user = [deque(waiters) for waiters in self._queues[priority].values()]
+            while per_user:
+                for waiters in per_user:
+                    order.append(waiters.popleft())
+                per_user = [waiters for waiters in per_user if waiters]
+        return order
+
+    def position(self, waiter: _Waiter) -> int:
+        """1-based position in the queue (0 when the request is not waiting)"""
+        for index, queued in enumerate(self._dispatch_order()):
+            if queued is waiter:
+                return index + 1
+        return 0
+
+    def estimated_wait(self, position: int) -> float:
+        """Rough wait in seconds for a request at this queue position"""
+        if position <= 0:
+            return 0.0
+        return position / self.concurrency * self._service_seconds
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            if queue:
+                if not self._admits(priority):
+                    return None
+                user, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    queue.move_to_end(user)  # Next turn goes to another user
+                else:
+                    del queue[user]
+                return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        while self.active < self.concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if waiter.future.done():
+                continue
+            self.active += 1
+            self._active[waiter.priority] += 1
+            waiter.future.set_result(True)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.priority]
+        waiters = queue.get(waiter.user)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del queue[waiter.user]
+
+    async def acquire(self,
+                      user: str,
+                      priority: int = INTERACTIVE,
+                      on_wait: Optional[Callable[[int, float], Awaitable[None]]] = None,
+                      notify_every: float = 2.0
+                      ) -> None:
+        """Wait for a free slot; on_wait(position, estimated_seconds) is called while queued"""
+        start = time.perf_counter()
+        if self.active < self.concurrency and not self.waiting and self._admits(priority):
+            self.active += 1
+            self._active[priority] += 1
+            QUEUE_WAIT_SECONDS.observe(0, model=self.model, priority=_PRIORITY_NAMES[priority])
+            return
+
+        waiting = self._waiting_before(priority)
+        if waiting >= self.max_queue:
+            QUEUE_REJECTED_TOTAL.inc(model=self.model)
+            raise QueueFullError(f"{waiting} requests are already waiting for {self.model}")
+
+        waiter = _Waiter(user, priority)
+        self._queues[priority].setdefault(user, deque()).append(waiter)
+        # A free slot may be held back from waiting background work, give it to this request
+        self._dispatch()
+        try:
+            # The dispatch above may already have granted the slot - then there is no queue position to show
+            while not waiter.future.done():
+                if on_wait is not None:
+                    position = self.position(waiter)
+                    await on_wait(position, self.estimated_wait(position))
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), timeout=notify_every)
+                except asyncio.TimeoutError:
+                    continue
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted just as we gave up - pass it on
+                self.release(priority)
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            raise
+
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, model=self.model, priority=_PRIORITY_NAMES[priority])
+
+    def release(self, priority: int = INTERACTIVE, service_seconds: Optional[float] = None) -> None:
+        if service_seconds is not None:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * service_seconds
+        self.active -= 1
+        self._active[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user: str, priority: int = INTERACTIVE, on_wait=None):
+        """async with scheduler.slot(user): ... - holds one generation slot (and one server slot) for the block"""
+        await self.acquire(user, priority, on_wait)
+        if self.server is not None:
+            # Model slot first: a request waiting for its model does not block the other models
+            try:
+                await self.server.acquire(user, priority, on_wait)
+            except BaseException:
+                self.release(priority)
+                raise
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.server is not None:
+                self.server.release(priority, elapsed)
+            self.release(priority, elapsed)
+
+    def get_stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "active_background": self._active[BACKGROUND],
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "avg_service_seconds": round(self._service_seconds, 2),
+        }
+
+
+SERVER = "ollama-server"  # Name of the server-wide scheduler in stats and metrics
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_server_scheduler() -> ModelScheduler:
+    """
+    Slots of the whole Ollama server, shared by all models (Config.OLLAMA_SERVER_CONCURRENCY).
+
+    Answers and summaries use different models, so only this pool makes background
+    work wait for interactive answers: it starts while no answer is running or waiting.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(SERVER)
+        if scheduler is None:
+            scheduler = ModelScheduler(
+                SERVER,
+                concurrency=Config.OLLAMA_SERVER_CONCURRENCY,
+                max_queue=Config.SCHEDULER_MAX_QUEUE,
+                background_when_idle=True
+            )
+            _schedulers[SERVER] = scheduler
+        return scheduler
+
+
+def get_scheduler(model: str) -> ModelScheduler:
+    """Process-wide scheduler for a model (concurrency from Config.MODEL_CONCURRENCY)"""
+    server = get_server_scheduler()
+    with _schedulers_lock:
+        scheduler = _schedulers.get(model)
+        if scheduler is None:
+            scheduler = ModelScheduler(
+                model,
+                concurrency=Config.MODEL_CONCURRENCY.get(model, Config.OLLAMA_CONCURRENCY),
+                max_queue=Config.SCHEDULER_MAX_QUEUE,
+                server=server
+            )
+            _schedulers[model] = scheduler
+        return scheduler
+
+
+def scheduler_stats() -> List[Dict]:
+    return [scheduler.get_stats() for scheduler in list(_schedulers.values())]
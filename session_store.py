@@ -0,0 +1,234 @@
+import json
+import time
+import atexit
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import Config
+from logger import log_event
+
+
+def session_key(user: str, mode: str, thread_id: str) -> str:
+    """
+    Store key of one conversation.
+
+    Usernames are free text and one code is shared by the whole class, so the key also
+    holds the Chainlit thread id: it stays the same when the browser reconnects after a
+    restart, but a student who logs in with a classmate's name gets a new one.
+    """
+    return f"{user}:{mode}:{thread_id}"
+
+
+class SessionStore:
+    """Where conversation snapshots are kept between server restarts (subclass for other backends)"""
+
+    def save(self, key: str, state: Dict) -> None:
+        raise NotImplementedError
+
+    def load(self, key: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def get_stats(self) -> Dict:
+        return {}
+
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path: str = "sessions.sqlite3", flush_seconds: float = 1.0):
+        """
+        SQLite session store with a write-behind queue.
+
+        save() only records the latest snapshot per session in memory; a background
+        thread writes all pending snapshots in one transaction every flush_seconds.
+        load() sees pending snapshots, so a session evicted a moment ago restores
+        correctly before its snapshot reaches the disk.
+
+        Args:
+            path: SQLite database file
+            flush_seconds: How often pending snapshots are written
+        """
+        self.path = path
+        self.flush_seconds = flush_seconds
+
+        self._db_lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+        self._pending = {}  # key -> (state json, updated) or None for deletes
+        self._pending_lock = threading.Lock()
+        self._stats = {"saves": 0, "writes": 0, "flushes": 0, "errors": 0}
+
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="session-store", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def save(self, key: str, state: Dict) -> None:
+        # Serialize now - the compressor keeps changing the objects after this call
+        data = json.dumps(state, ensure_ascii=False)
+        with self._pending_lock:
+            self._pending[key] = (data, time.time())
+            self._stats["saves"] += 1
+
+    def load(self, key: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        with self._pending_lock:
+            pending = self._pending.get(key, False)
+        if pending is None:
+            return None  # Deleted, not written yet
+        if pending is not False:
+            data, updated = pending
+        else:
+            with self._db_lock:
+                row = self._connection.execute("SELECT state, updated FROM sessions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            data, updated = row
+
+        if max_age is not None and time.time() - updated > max_age:
+            return None
+        return json.loads(data)
+
+    def delete(self, key: str) -> None:
+        with self._pending_lock:
+            self._pending[key] = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        try:
+            with self._db_lock:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO sessions (key, state, updated) VALUES (?, ?, ?)",
+                    [(key, value[0], value[1]) for key, value in pending.items() if value is not None]
+                )
+                self._connection.executemany(
+                    "DELETE FROM sessions WHERE key = ?",
+                    [(key,) for key, value in pending.items() if value is None]
+                )
+                self._connection.commit()
+        except sqlite3.Error as e:
+            with self._pending_lock:
+                # Retry next time, unless the session has been saved again meanwhile
+                for key, value in pending.items():
+                    self._pending.setdefault(key, value)
+                self._stats["errors"] += 1
+            log_event("session_store_failed", level=logging.ERROR, stage="session", error=str(e))
+            return
+
+        with self._pending_lock:
+            self._stats["writes"] += len(pending)
+            self._stats["flushes"] += 1
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def get_stats(self) -> Dict:
+        with self._pending_lock:
+            return {**self._stats, "pending": len(self._pending)}
+
+
+class SessionManager:
+    def __init__(self, store: SessionStore, idle_seconds: float = 900, max_loaded: int = 500, restore_seconds: float = 12 * 3600):
+        """
+        Keeps conversation state of active sessions in memory and the rest on disk.
+
+        A compressor is filled from the store the first time its session is used
+        (lazy restore). Sessions idle for idle_seconds, or the least recently used ones
+        above max_loaded, are dropped from memory; their state is already in the store
+        because it is saved after every change.
+
+        Args:
+            store: Session store backend
+            idle_seconds: Unload sessions without messages for this long
+            max_loaded: Maximum number of sessions kept in memory
+            restore_seconds: Older snapshots are not restored (the next chat starts fresh)
+        """
+        self.store = store
+        self.idle_seconds = idle_seconds
+        self.max_loaded = max_loaded
+        self.restore_seconds = restore_seconds
+
+        self._loaded = OrderedDict()  # key -> (compressor, last used)
+        self._stats = {"restored": 0, "evicted": 0}
+
+    def attach(self, key: str, compressor) -> None:
+        """Save the compressor state whenever it changes"""
+        compressor.on_change = lambda: self.store.save(key, compressor.to_state())
+
+    async def activate(self, key: str, compressor) -> None:
+        """Make sure the compressor holds its session state, call before every message"""
+        loaded = self._loaded.get(key)
+        if loaded is None or loaded[0] is not compressor:
+            state = await asyncio.to_thread(self.store.load, key, self.restore_seconds)
+            if state is not None:
+                compressor.load_state(state)
+                self._stats["restored"] += 1
+                log_event(
+                    "session_restored", stage="session", session=key,
+                    exchanges=len(compressor.raw_history), summary=bool(compressor.compressed_history)
+                )
+            if loaded is not None:
+                loaded[0].unload()  # The same conversation was reopened (reconnect) - this one takes over
+
+        self._loaded[key] = (compressor, time.monotonic())
+        self._loaded.move_to_end(key)
+        self._evict()
+
+    def release(self, key: str, compressor) -> None:
+        """Chat ended - drop the state from memory (it stays in the store)"""
+        loaded = self._loaded.get(key)
+        if loaded is not None and loaded[0] is compressor:
+            del self._loaded[key]
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key, (compressor, last_used) in list(self._loaded.items()):
+            if len(self._loaded) <= self.max_loaded and now - last_used < self.idle_seconds:
+                break  # Ordered by last use, the rest is more recent
+            if compressor.unload():
+                del self._loaded[key]
+                self._stats["evicted"] += 1
+
+    def get_stats(self) -> Dict:
+        return {"loaded": len(self._loaded), **self._stats, "store": self.store.get_stats()}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager() -> Optional[SessionManager]:
+    """Process-wide session manager (None when SESSION_STORE=none)"""
+    global _manager
+    if _manager is None and Config.SESSION_STORE != "none":
+        with _manager_lock:
+            if _manager is None:
+                if Config.SESSION_STORE != "sqlite":
+                    raise ValueError(f"Unknown SESSION_STORE: {Config.SESSION_STORE}")
+                _manager = SessionManager(
+                    SQLiteSessionStore(Config.SESSION_DB, flush_seconds=Config.SESSION_FLUSH_SECONDS),
+                    idle_seconds=Config.SESSION_IDLE_SECONDS,
+                    max_loaded=Config.SESSION_MAX_LOADED,
+                    restore_seconds=Config.SESSION_RESTORE_SECONDS
+                )
+    return _manager
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import math
+import time
+import heapq
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from langchain.docstore.document import Document
+
+_WORD = re.compile(r"\w+")
+_CAMEL = re.compile(r"[A-ZČŠŽ]?[a-zčšž]+|[A-ZČŠŽ]+(?![a-zčšž])|\d+")
+_VOWELS = "aeiou"
+STEM_LENGTH = 6
+
+
+def _stem(word: str) -> str:
+    """Very light stemming for Slovene inflection: število/števila/števil -> števil"""
+    if len(word) > 4 and word[-1] in _VOWELS:
+        word = word[:-1]
+    return word[:STEM_LENGTH]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, stemmed words; C# identifiers also yield their parts (WriteLine -> writeline, write, line)"""
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.append(_stem(word.lower()))
+        parts = _CAMEL.findall(word)
+        if len(parts) > 1:
+            tokens.extend(_stem(part.lower()) for part in parts)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Okapi BM25 over the chunks of one collection.
+
+        Exact terms (C# identifiers, Slovene words like "praštevilo") are matched
+        literally, which is where dense MiniLM search is weakest. The index is built
+        by update_rag.py and saved next to the versions file; chat servers only load it.
+
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.collection = None
+        self.built_at = None
+
+        self._ids = []
+        self._documents = []
+        self._terms = []  # Per chunk: term -> frequency
+        self._lengths = []
+        self._postings = {}
+        self._idf = {}
+        self._avg_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def build(self, points: Iterable[Tuple[str, Document]], collection: Optional[str] = None) -> "BM25Index":
+        """Index (point id, Document) pairs, e.g. scrolled from the Qdrant collection"""
+        self._ids, self._documents, self._terms = [], [], []
+        for point_id, doc in points:
+            self._ids.append(str(point_id))
+            self._documents.append(doc)
+            self._terms.append(dict(Counter(tokenize(doc.page_content))))
+        self.collection = collection
+        self.built_at = time.time()
+        self._prepare()
+        return self
+
+    def _prepare(self) -> None:
+        self._lengths = [sum(terms.values()) for terms in self._terms]
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+        postings = defaultdict(list)
+        for index, terms in enumerate(self._terms):
+            for term, frequency in terms.items():
+                postings[term].append((index, frequency))
+        self._postings = dict(postings)
+
+        count = len(self._terms)
+        self._idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self._postings.items()
+        }
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Document, float]]:
+        """Top k chunks by BM25 score (chunks without any query term are not returned)"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in self._postings[term]:
+                length_norm = 1 - self.b + self.b * self._lengths[index] / self._avg_length
+                scores[index] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self._document(index), score) for index, score in best]
+
+    def _document(self, index: int) -> Document:
+        doc = self._documents[index]
+        metadata = dict(doc.metadata)
+        metadata["_id"] = self._ids[index]
+        if self.collection:
+            metadata["_collection_name"] = self.collection
+        return Document(page_content=doc.page_content, metadata=metadata)
+
+    def save(self, path: str) -> None:
+        """Write the index atomically (tmp file + rename) so a loading server never sees half a file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            "collection": self.collection,
+            "built_at": self.built_at,
+            "k1": self.k1,
+            "b": self.b,
+            "documents": [
+                {"id": point_id, "page_content": doc.page_content, "metadata": doc.metadata, "terms": terms}
+                for point_id, doc, terms in zip(self._ids, self._documents, self._terms)
+            ],
+        }
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        index.collection = data.get("collection")
+        index.built_at = data.get("built_at")
+        for entry in data["documents"]:
+            index._ids.append(entry["id"])
+            index._documents.append(Document(page_content=entry["page_content"], metadata=entry.get("metadata") or {}))
+            index._terms.append(entry["terms"])
+        index._prepare()
+        return index
+
+    def get_stats(self) -> Dict:
+        return {
+            "collection": self.collection,
+            "chunks": len(self._ids),
+            "terms": len(self._postings),
+            "avg_chunk_terms": round(self._avg_length, 1),
+        }
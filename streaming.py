@@ -0,0 +1,107 @@
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Length of the longest suffix of text that is the beginning of tag"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-length:]):
+            return length
+    return 0
+
+
+class ThinkTagParser:
+    """Splits streamed model output into thinking and answer text.
+
+    Tags may arrive split across chunks ("<th" + "ink>") or glued to other text
+    ("<think>Okay"), so the parser keeps a possible partial tag until the next chunk.
+    """
+
+    def __init__(self):
+        self.thinking = False
+        self._pending = ""
+
+    def feed(self, text: str) -> List[Tuple[bool, str]]:
+        """Return (is_thinking, text) segments that are complete so far"""
+        data = self._pending + text
+        self._pending = ""
+        segments = []
+
+        while data:
+            tag = THINK_CLOSE if self.thinking else THINK_OPEN
+            index = data.find(tag)
+            if index >= 0:
+                if index:
+                    segments.append((self.thinking, data[:index]))
+                self.thinking = not self.thinking
+                data = data[index + len(tag):]
+                continue
+
+            keep = _partial_tag_length(data, tag)
+            if len(data) > keep:
+                segments.append((self.thinking, data[:len(data) - keep]))
+            self._pending = data[len(data) - keep:]
+            break
+
+        return segments
+
+    def flush(self) -> List[Tuple[bool, str]]:
+        """End of stream - whatever looked like a partial tag is plain text after all"""
+        pending, self._pending = self._pending, ""
+        return [(self.thinking, pending)] if pending else []
+
+
+class BufferedStreamer:
+    def __init__(self,
+                 target,
+                 interval: float = 0.05,
+                 max_tokens: int = 32,
+                 on_flush: Optional[Callable[[], Awaitable[None]]] = None,
+                 clock: Callable[[], float] = time.monotonic
+                 ):
+        """
+        Collects tokens and sends them to a Chainlit message/step in larger pieces.
+
+        A flush happens when max_tokens tokens are buffered or interval seconds have
+        passed since the last flush, so a long answer costs a few dozen websocket
+        messages instead of one (or two) per token.
+
+        Args:
+            target: Object with an async stream_token(text) method (cl.Message, cl.Step)
+            interval: Maximum seconds between flushes while tokens keep arriving
+            max_tokens: Flush after this many buffered tokens
+            on_flush: Awaited after every flush (e.g. to update the step name)
+            clock: Time source, replaceable for benchmarks
+        """
+        self.target = target
+        self.interval = interval
+        self.max_tokens = max_tokens
+        self.on_flush = on_flush
+        self.clock = clock
+
+        self.tokens = 0
+        self.flushes = 0
+        self._buffer = []
+        self._last_flush = clock()
+
+    async def add(self, text: str) -> None:
+        if not text:
+            return
+        self._buffer.append(text)
+        self.tokens += 1
+        if len(self._buffer) >= self.max_tokens or self.clock() - self._last_flush >= self.interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        self._last_flush = self.clock()
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        self.flushes += 1
+        await self.target.stream_token(text)
+        if self.on_flush is not None:
+            await self.on_flush()
@@ -0,0 +1,330 @@
+import re
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from typing import Dict, List
+from config import Config
+from logger import log_event
+from scheduler import BACKGROUND
+
+STOPWORDS = {
+    # Slovene
+    "in", "je", "na", "se", "da", "za", "ki", "v", "z", "s", "so", "pa", "to", "ali", "kot", "ne", "bi", "od",
+    "do", "po", "iz", "pri", "tudi", "kaj", "kako", "če", "ko", "ta", "ti", "lahko", "sem", "si", "bo", "smo",
+    "mi", "jo", "ga", "jih", "tako", "še", "samo", "zato", "kar", "vse", "te", "tega", "tem", "ter", "o", "k",
+    # English
+    "the", "a", "an", "and", "or", "is", "are", "to", "of", "in", "on", "for", "it", "this", "that", "with",
+    "as", "be", "can", "you", "what", "how", "if", "then", "so", "we", "i", "by", "at", "not",
+}
+
+_CODE_BLOCK = re.compile(r"```[^\n]*\n(.*?)(?:```|$)", re.S)
+_INLINE_CODE = re.compile(r"`([^`\n]{2,80})`")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"\w+", re.U)
+
+
+def _words(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS and not word.isdigit()]
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+
+def _code_snippet(answer: str, max_chars: int = 100) -> str:
+    """First meaningful line of the first code block (or inline code) of an answer"""
+    for block in _CODE_BLOCK.findall(answer):
+        for line in block.splitlines():
+            line = line.strip()
+            if line and not line.startswith(("//", "#", "/*", "*", "import ", "using ")):
+                return _shorten(line, max_chars)
+    inline = _INLINE_CODE.findall(answer)
+    return _shorten(", ".join(dict.fromkeys(inline)), max_chars) if inline else ""
+
+
+def _key_sentences(question: str, answer: str, count: int, max_chars: int = 160) -> List[str]:
+    """Sentences of the answer with the most frequent content words, question words count double"""
+    prose = _CODE_BLOCK.sub(" ", answer)
+    sentences = [s.strip() for s in _SENTENCE_END.split(prose) if len(s.strip()) > 20]
+    if not sentences:
+        return []
+    frequency = Counter(_words(prose))
+    for word in set(_words(question)):
+        frequency[word] *= 2
+
+    def score(sentence):
+        words = _words(sentence)
+        return sum(frequency[word] for word in set(words)) / math.sqrt(len(words) + 1)
+
+    best = sorted(range(len(sentences)), key=lambda i: score(sentences[i]), reverse=True)[:count]
+    return [_shorten(sentences[i], max_chars) for i in sorted(best)]
+
+
+def summarize_exchange(exchange: Dict, sentences: int = 2) -> str:
+    """One summary line for a Q/A exchange: question topic, key sentences and the code it was about"""
+    line = f"- Q: {_shorten(exchange['question'], 120)}"
+    key = _key_sentences(exchange["question"], exchange["answer"], sentences)
+    if key:
+        line += f" | A: {' '.join(key)}"
+    code = _code_snippet(exchange["answer"])
+    if code:
+        line += f" | Code: {code}"
+    return line
+
+
+def extractive_summary(exchanges: List[Dict], previous: str = "", max_chars: int = 1200, sentences: int = 2) -> str:
+    """
+    Add the exchanges to a summary without an LLM (a few milliseconds of CPU).
+
+    Every exchange becomes one line; when the summary grows over max_chars the oldest
+    extractive lines are dropped first, then the oldest text of an earlier LLM summary.
+    """
+    lines = [line for line in previous.splitlines() if line.strip()]
+    lines += [summarize_exchange(exchange, sentences) for exchange in exchanges]
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > max_chars:
+        extractive = [i for i, line in enumerate(lines) if line.startswith("- Q:")]
+        del lines[extractive[0] if extractive and extractive[0] < len(lines) - 1 else 0]
+    summary = "\n".join(lines)
+    return summary if len(summary) <= max_chars else summary[-max_chars:]
+
+
+def format_exchanges(exchanges: List[Dict]) -> str:
+    conversation_text = ""
+    for i, ex in enumerate(exchanges):
+        conversation_text += f"Question {i+1}: {ex['question']}\n"
+        conversation_text += f"Answer {i+1}: {ex['answer'][:300]}{'...' if len(ex['answer']) > 300 else ''}\n\n"
+    return conversation_text
+
+
+def summary_prompt(previous: str, exchanges: List[Dict]) -> str:
+    """Prompt that asks the LLM for the summary of one conversation"""
+    conversation_text = format_exchanges(exchanges)
+    if previous:
+        return f"""
+            Previous conversation summary: {previous}
+
+            New exchanges to incorporate:
+            {conversation_text}
+
+            Create a new comprehensive summary that:
+            1. Preserves the key information from the previous summary
+            2. Incorporates the new exchanges
+            3. Maintains continuity and context
+            4. Is concise but informative (2-4 sentences)
+
+            Updated summary:
+            """
+    return f"""
+            Create a concise summary (2-4 sentences) of these exchanges:
+
+            {conversation_text}
+
+            Focus on the main topic, questions, and key information discussed.
+
+            Summary:
+            """
+
+
+def batch_prompt(requests: List["_SummaryRequest"]) -> str:
+    """Prompt that asks the LLM for the summaries of several independent conversations at once"""
+    parts = []
+    for i, request in enumerate(requests):
+        part = f"### Conversation {i+1}\n"
+        if request.previous:
+            part += f"Previous conversation summary: {request.previous}\n\n"
+        part += f"New exchanges:\n{format_exchanges(request.exchanges)}"
+        parts.append(part)
+    return (
+        "Below are several independent conversations between students and a programming tutor. "
+        "For each conversation write a concise but informative summary (2-4 sentences) that keeps the key "
+        "information of the previous summary and adds the new exchanges. Do not mix the conversations.\n\n"
+        + "\n".join(parts)
+        + f"\nAnswer with exactly {len(requests)} summaries in this format:\n"
+        + "\n".join(f"Summary {i+1}: ..." for i in range(len(requests)))
+        + "\n"
+    )
+
+
+def parse_batch(text: str, count: int) -> Dict[int, str]:
+    """Summaries by conversation index from the answer to batch_prompt (missing ones are left out)"""
+    summaries = {}
+    matches = list(re.finditer(r"^\W*Summary\s+(\d+)\W*:?\s*", text, re.M | re.I))
+    for match, following in zip(matches, matches[1:] + [None]):
+        index = int(match.group(1)) - 1
+        summary = text[match.end():following.start() if following else len(text)].strip()
+        if 0 <= index < count and summary and index not in summaries:
+            summaries[index] = summary
+    return summaries
+
+
+class _SummaryRequest:
+    def __init__(self, user: str, previous: str, exchanges: List[Dict]):
+        self.user = user
+        self.previous = previous
+        self.exchanges = exchanges
+        self.future = asyncio.get_running_loop().create_future()
+        self.size = len(previous) + len(format_exchanges(exchanges))
+
+
+class SharedSummarizer:
+    def __init__(self,
+                 model,
+                 scheduler=None,
+                 batch_size: int = 4,
+                 batch_wait: float = 0.3,
+                 max_batch_chars: int = 9000,
+                 parallel: int = 2
+                 ):
+        """
+        One LLM summarizer for all sessions of the process.
+
+        Requests are queued and sent in batches: one prompt with up to batch_size
+        conversations, so Ollama evaluates one long prompt instead of many short ones
+        and summaries take fewer background slots away from answers. A batch waits
+        batch_wait seconds for other sessions unless it is already full. Conversations
+        the model did not answer in the expected format are summarized one by one.
+
+        Args:
+            model: LLM for summaries (compression model)
+            scheduler: ModelScheduler of the model, batches run with background priority
+            batch_size: Conversations per LLM request
+            batch_wait: Seconds a request waits for others to join its batch
+            max_batch_chars: Prompt size limit of one batch (must fit the model context)
+            parallel: Batches in flight at once
+        """
+        self.model = model
+        self.scheduler = scheduler
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.max_batch_chars = max_batch_chars
+        self.parallel = max(1, parallel)
+
+        self._pending = deque()
+        self._workers = 0
+        self._loop = None
+        self._stats = {
+            "requests": 0, "batches": 0, "batched_requests": 0, "llm_calls": 0, "single_fallbacks": 0, "failures": 0,
+            "llm_seconds": 0.0, "prompt_chars": 0, "output_chars": 0
+        }
+
+    async def summarize(self, user: str, previous: str, exchanges: List[Dict]) -> str:
+        """New summary of one conversation (previous summary + new exchanges)"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Queued requests of a closed event loop can not be answered any more
+            self._loop = loop
+            self._pending.clear()
+            self._workers = 0
+
+        request = _SummaryRequest(user, previous, exchanges)
+        self._pending.append(request)
+        self._stats["requests"] += 1
+        if self._workers < min(self.parallel, math.ceil(len(self._pending) / self.batch_size)):
+            self._workers += 1
+            asyncio.create_task(self._worker())
+        try:
+            return await request.future
+        except asyncio.CancelledError:
+            # The caller gave up (compression timeout) - do not send its conversation any more
+            if request in self._pending:
+                self._pending.remove(request)
+            raise
+
+    def _take_batch(self) -> List[_SummaryRequest]:
+        batch = [self._pending.popleft()]
+        size = batch[0].size
+        while self._pending and len(batch) < self.batch_size and size + self._pending[0].size <= self.max_batch_chars:
+            size += self._pending[0].size
+            batch.append(self._pending.popleft())
+        return batch
+
+    async def _worker(self) -> None:
+        try:
+            while self._pending:
+                if len(self._pending) < self.batch_size and self.batch_wait > 0:
+                    # Give other sessions a moment to join the batch
+                    await asyncio.sleep(self.batch_wait)
+                if not self._pending:
+                    break
+                user = self._pending[0].user
+                if self.scheduler is not None:
+                    async with self.scheduler.slot(user, BACKGROUND):
+                        # More requests may have arrived while waiting for the slot
+                        batch = self._take_batch() if self._pending else []
+                        await self._run(batch)
+                else:
+                    await self._run(self._take_batch())
+        finally:
+            self._workers -= 1
+
+    async def _invoke(self, prompt: str) -> str:
+        start = time.perf_counter()
+        response = await self.model.ainvoke(prompt)
+        self._stats["llm_calls"] += 1
+        self._stats["llm_seconds"] += time.perf_counter() - start
+        self._stats["prompt_chars"] += len(prompt)
+        self._stats["output_chars"] += len(response)
+        return response.strip()
+
+    async def _run(self, batch: List[_SummaryRequest]) -> None:
+        if not batch:
+            return
+        self._stats["batches"] += 1
+        self._stats["batched_requests"] += len(batch)
+        try:
+            if len(batch) == 1:
+                summaries = {0: await self._invoke(summary_prompt(batch[0].previous, batch[0].exchanges))}
+            else:
+                summaries = parse_batch(await self._invoke(batch_prompt(batch)), len(batch))
+                for index, request in enumerate(batch):
+                    if index not in summaries:
+                        self._stats["single_fallbacks"] += 1
+                        summaries[index] = await self._invoke(summary_prompt(request.previous, request.exchanges))
+        except Exception as e:
+            self._stats["failures"] += 1
+            log_event("summary_batch_failed", level=logging.WARNING, stage="compression", batch=len(batch), error=str(e))
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        for index, request in enumerate(batch):
+            if not request.future.done():
+                request.future.set_result(summaries[index])
+
+    def get_stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats["model"] = getattr(self.model, "model", "unknown")
+        stats["pending"] = len(self._pending)
+        stats["avg_batch"] = round(stats["batched_requests"] / stats["batches"], 2) if stats["batches"] else 0
+        stats["llm_seconds"] = round(stats["llm_seconds"], 2)
+        return stats
+
+
+_summarizers = {}
+_summarizers_lock = threading.Lock()
+
+
+def get_summarizer(model, scheduler=None) -> SharedSummarizer:
+    """Process-wide summarizer for a model (batching from Config.SUMMARY_BATCH_*)"""
+    with _summarizers_lock:
+        entry = _summarizers.get(id(model))
+        if entry is None or entry[0] is not model:
+            summarizer = SharedSummarizer(
+                model,
+                scheduler=scheduler,
+                batch_size=Config.SUMMARY_BATCH_SIZE,
+                batch_wait=Config.SUMMARY_BATCH_WAIT_MS / 1000,
+                max_batch_chars=Config.SUMMARY_BATCH_MAX_CHARS
+            )
+            entry = (model, summarizer)
+            _summarizers[id(model)] = entry
+        return entry[1]
+
+
+def summarizer_stats() -> List[Dict]:
+    return [summarizer.get_stats() for _, summarizer in list(_summarizers.values())]
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The modules live in the repository root, next to klepetalnik.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep log records of the tests out of the real debugx.log
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(prefix="klepetalnik-tests-"), "debugx.log"))
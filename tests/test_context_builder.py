@@ -0,0 +1,54 @@
+import asyncio
+from langchain_core.messages import HumanMessage, AIMessage
+from context_builder import ContextAssembler
+
+SETTINGS = {"model": "no-tokenizer:1b", "prompt": "Si pomočnik pri programiranju."}
+
+
+def exchange(question, answer):
+    return [HumanMessage(content=question), AIMessage(content=answer)]
+
+
+def test_history_keeps_a_contiguous_recent_window():
+    history = (
+        exchange("Kaj je zanka?", "Ponavljanje ukazov.")
+        + exchange("Pokaži primer.", "for i in range(10): print(i)\n" * 80)
+        + exchange("Kaj pa while?", "Ponavlja, dokler velja pogoj.")
+    )
+    assembler = ContextAssembler(SETTINGS, num_ctx=400, answer_reserve=0, max_answer_tokens=2000)
+
+    inputs, usage = assembler.assemble("Zakaj to deluje?", [], history, "")
+
+    # The long middle exchange does not fit; the older short one must not be kept after the gap
+    assert [m.content for m in inputs["history"]] == ["Kaj pa while?", "Ponavlja, dokler velja pogoj."]
+    assert usage["history_dropped"] == 2
+
+
+def test_history_fits_completely():
+    history = exchange("Kaj je zanka?", "Ponavljanje ukazov.") + exchange("Kaj pa while?", "Dokler velja pogoj.")
+    assembler = ContextAssembler(SETTINGS, num_ctx=2048)
+
+    inputs, usage = assembler.assemble("Zakaj?", [], history, "")
+
+    assert len(inputs["history"]) == 4
+    assert usage["history_dropped"] == 0
+
+
+def test_pipeline_sends_no_summary_before_the_first_compression():
+    from langchain_core.language_models.fake import FakeListLLM
+    from context_builder import SUMMARY_HEADER
+    from pipeline import ChatPipeline
+
+    async def run():
+        pipeline = ChatPipeline(dict(SETTINGS, prompt_layout="prefix_cache"), FakeListLLM(responses=["ok"]), None)
+        first, first_usage = pipeline.build_inputs("Kaj je zanka?", [])
+        for i in range(4):
+            await pipeline.history_compressor.add_exchange(f"Vprašanje {i}", "Odgovor.")
+        second, second_usage = pipeline.build_inputs("Kaj je zanka?", [])
+        return first, first_usage, second, second_usage
+
+    first, first_usage, second, second_usage = asyncio.run(run())
+    # No status text ("No previous conversation.", "[Recent] ...") under the summary header
+    assert first["question"] == second["question"] == "Kaj je zanka?"
+    assert SUMMARY_HEADER not in second["question"]
+    assert first_usage["summary"] == second_usage["summary"] == 0
@@ -0,0 +1,62 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from embedding_batcher import BatchingEmbeddings
+
+
+class GatedEmbeddings(Embeddings):
+    """Embeds only after the test opens the gate, so queries can pile up behind a batch"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.gate.wait(5)
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_cancelled_query_does_not_kill_the_worker():
+    model = GatedEmbeddings()
+    batcher = BatchingEmbeddings(model, max_wait_ms=1)
+
+    async def cancel_while_waiting():
+        blocker = asyncio.create_task(batcher.aembed_query("first"))
+        await asyncio.sleep(0.05)  # The worker is now stuck in the first batch
+        cancelled = asyncio.create_task(batcher.aembed_query("stop"))
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        model.gate.set()
+        return await blocker
+
+    assert asyncio.run(cancel_while_waiting()) == [5.0]
+
+    # The worker survived and still answers; the cancelled query was never embedded
+    assert batcher._submit("after").result(timeout=5) == [5.0]
+    assert all("stop" not in batch for batch in model.batches)
+
+
+def test_unexpected_error_fails_the_batch_not_the_worker():
+    model = GatedEmbeddings()
+    model.gate.set()
+    batcher = BatchingEmbeddings(model, max_wait_ms=1)
+    original = batcher._run_batch
+
+    def broken_once(batch):
+        batcher._run_batch = original
+        raise RuntimeError("boom")
+
+    batcher._run_batch = broken_once
+    future = batcher._submit("first")
+    try:
+        future.result(timeout=5)
+        assert False, "the batch should have failed"
+    except RuntimeError:
+        pass
+    assert batcher.embed_query("second") == [6.0]
@@ -0,0 +1,46 @@
+import asyncio
+from history_compressor import SmartHistoryCompressor
+from scheduler import ModelScheduler, INTERACTIVE
+from summarizer import SharedSummarizer
+
+
+class CountingModel:
+    model = "llama3.1:8b"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        return "LLM summary"
+
+
+def test_llm_tier_falls_back_to_extractive_when_no_background_slot_comes():
+    async def run():
+        # An answer streams the whole time, so the server pool never admits background work
+        server = ModelScheduler("server", concurrency=2, background_when_idle=True)
+        await server.acquire("bor", INTERACTIVE)
+        scheduler = ModelScheduler("llama3.1:8b", concurrency=2, server=server)
+
+        model = CountingModel()
+        summarizer = SharedSummarizer(model, scheduler, batch_wait=0)
+        compressor = SmartHistoryCompressor(
+            model, max_raw_history=1, compression_threshold=1, scheduler=scheduler,
+            summarizer=summarizer, llm_every=1, llm_timeout=0.2
+        )
+        await compressor.add_exchange("Kaj je rekurzija?", "Funkcija, ki kliče samo sebe.")
+        await compressor.add_exchange("Kaj je zanka for?", "Ponavlja ukaze za vsak element.")
+        await asyncio.wait_for(compressor.wait_for_compression(), timeout=5)
+        await asyncio.sleep(0)
+        return compressor, summarizer, model
+
+    compressor, summarizer, model = asyncio.run(run())
+
+    assert compressor.compressions == 1
+    assert compressor.compression_failures == 1
+    assert compressor.tier_stats["extractive"]["runs"] == 1
+    assert "rekurzija" in compressor.compressed_history
+    assert [ex["question"] for ex in compressor.raw_history] == ["Kaj je zanka for?"]
+    # The abandoned request is not sent once a slot frees up
+    assert model.calls == 0
+    assert not summarizer._pending
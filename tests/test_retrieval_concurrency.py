@@ -0,0 +1,82 @@
+import time
+import asyncio
+from langchain.docstore.document import Document
+import rag
+from config import Config
+
+SEARCH_SECONDS = 0.3
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+class SlowVectorStore:
+    """Blocks like a Qdrant search over the network"""
+
+    def similarity_search_by_vector(self, embedding, k=3):
+        time.sleep(SEARCH_SECONDS)
+        return [Document(page_content=f"chunk {i}") for i in range(k)]
+
+
+def make_rag(monkeypatch):
+    monkeypatch.setattr(Config, "RAG_CACHE", False)
+    monkeypatch.setattr(Config, "VECTOR_BACKEND", "qdrant")
+    monkeypatch.setattr(rag, "get_embeddings", lambda model: FakeEmbeddings())
+    monkeypatch.setitem(rag._load_stats, "fake-embeddings", {"dimension": 2})
+    engine = rag.RAG(qdrant_url=":memory:", embedding_model="fake-embeddings", llama_model="fake-llm")
+    monkeypatch.setattr(engine, "get_vector_store", lambda collection_name: SlowVectorStore())
+    return engine
+
+
+async def stream_tokens(lag, stop, interval=0.01):
+    """Another session streaming its answer: records how late every token is"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag.append(loop.time() - start - interval)
+
+
+def test_aretrieve_keeps_other_sessions_streaming(monkeypatch):
+    engine = make_rag(monkeypatch)
+
+    async def run():
+        lag = []
+        stop = asyncio.Event()
+        streamer = asyncio.create_task(stream_tokens(lag, stop))
+        start = time.perf_counter()
+        results = await asyncio.gather(*[engine.aretrieve("programiranje", f"vprašanje {i}") for i in range(3)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await streamer
+        return results, elapsed, lag
+
+    results, elapsed, lag = asyncio.run(run())
+
+    assert all(len(docs) == 3 for docs in results)
+    assert elapsed >= SEARCH_SECONDS
+    # The streamer kept getting tokens out while the searches blocked their threads
+    assert len(lag) >= 10
+    assert max(lag) < SEARCH_SECONDS / 3
+
+
+def test_blocking_retrieve_would_stall_the_loop(monkeypatch):
+    """Control: the same search called directly on the event loop holds up the streamer"""
+    engine = make_rag(monkeypatch)
+
+    async def run():
+        lag = []
+        stop = asyncio.Event()
+        streamer = asyncio.create_task(stream_tokens(lag, stop))
+        await asyncio.sleep(0)
+        engine.retrieve("programiranje", "vprašanje")
+        await asyncio.sleep(0.05)
+        stop.set()
+        await streamer
+        return lag
+
+    lag = asyncio.run(run())
+
+    assert max(lag) >= SEARCH_SECONDS * 0.9
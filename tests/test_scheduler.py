@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from scheduler import ModelScheduler, QueueFullError, INTERACTIVE, BACKGROUND
+
+
+def make_schedulers(server_concurrency=2, max_queue=40):
+    server = ModelScheduler("server", concurrency=server_concurrency, max_queue=max_queue, background_when_idle=True)
+    answers = ModelScheduler("gemma3:27b", concurrency=2, max_queue=max_queue, server=server)
+    summaries = ModelScheduler("llama3.1:8b", concurrency=2, max_queue=max_queue, server=server)
+    return server, answers, summaries
+
+
+def test_summary_on_another_model_waits_for_the_answer():
+    async def run():
+        server, answers, summaries = make_schedulers()
+        events = []
+        answer_done = asyncio.Event()
+
+        async def answer():
+            async with answers.slot("ana", INTERACTIVE):
+                events.append("answer start")
+                await answer_done.wait()
+                events.append("answer end")
+
+        async def summary():
+            async with summaries.slot("ana", BACKGROUND):
+                events.append("summary start")
+
+        answering = asyncio.create_task(answer())
+        await asyncio.sleep(0.01)
+        summarizing = asyncio.create_task(summary())
+        await asyncio.sleep(0.05)
+        # A server slot is free, but an answer is running
+        assert events == ["answer start"]
+        assert server.get_stats()["waiting"] == 1
+        answer_done.set()
+        await asyncio.gather(answering, summarizing)
+        return events, server
+
+    events, server = asyncio.run(run())
+    assert events == ["answer start", "answer end", "summary start"]
+    assert server.active == 0
+
+
+def test_waiting_answer_goes_before_waiting_summary():
+    async def run():
+        server, answers, summaries = make_schedulers(server_concurrency=1)
+        order = []
+        release = asyncio.Event()
+
+        async def generate(scheduler, user, priority, name):
+            async with scheduler.slot(user, priority):
+                order.append(name)
+                await release.wait()
+
+        first = asyncio.create_task(generate(answers, "ana", INTERACTIVE, "first answer"))
+        await asyncio.sleep(0.01)
+        summary = asyncio.create_task(generate(summaries, "ana", BACKGROUND, "summary"))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(generate(answers, "bor", INTERACTIVE, "second answer"))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(first, summary, second)
+        return order
+
+    assert asyncio.run(run()) == ["first answer", "second answer", "summary"]
+
+
+def test_background_backlog_does_not_reject_answers():
+    async def run():
+        server, answers, summaries = make_schedulers(max_queue=2)
+        release = asyncio.Event()
+
+        async def generate(scheduler, user, priority):
+            async with scheduler.slot(user, priority):
+                await release.wait()
+
+        tasks = [asyncio.create_task(generate(answers, "ana", INTERACTIVE))]
+        await asyncio.sleep(0.01)
+        tasks += [asyncio.create_task(generate(summaries, f"user{i}", BACKGROUND)) for i in range(2)]
+        await asyncio.sleep(0.01)
+
+        # Two summaries wait for the server, a third one is turned away
+        with pytest.raises(QueueFullError):
+            await server.acquire("user2", BACKGROUND)
+        tasks.append(asyncio.create_task(generate(answers, "bor", INTERACTIVE)))
+        await asyncio.sleep(0.01)
+        assert server.get_stats()["active"] == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        return server, answers, summaries
+
+    server, answers, summaries = asyncio.run(run())
+    assert (server.active, answers.active, summaries.active) == (0, 0, 0)
+
+
+def test_answer_let_through_a_held_back_summary_is_not_shown_a_queue_position():
+    async def run():
+        server = ModelScheduler("server", concurrency=2, background_when_idle=True)
+        notified = []
+        release = asyncio.Event()
+
+        async def on_wait(position, seconds):
+            notified.append((position, seconds))
+
+        async def generate(priority, on_wait=None):
+            await server.acquire("ana", priority, on_wait)
+            await release.wait()
+            server.release(priority)
+
+        first = asyncio.create_task(generate(INTERACTIVE))
+        await asyncio.sleep(0.01)
+        summary = asyncio.create_task(generate(BACKGROUND))
+        await asyncio.sleep(0.01)
+        # A slot is free but held back from the summary; the answer gets it right away
+        assert server.waiting == 1
+        await asyncio.wait_for(server.acquire("bor", INTERACTIVE, on_wait), timeout=1)
+        server.release(INTERACTIVE)
+        release.set()
+        await asyncio.gather(first, summary)
+        return notified
+
+    assert asyncio.run(run()) == []
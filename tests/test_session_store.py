@@ -0,0 +1,39 @@
+import asyncio
+from history_compressor import SmartHistoryCompressor
+from session_store import SessionManager, SQLiteSessionStore, session_key
+
+
+def make_manager(tmp_path):
+    return SessionManager(SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), flush_seconds=60))
+
+
+def start_chat(manager, key):
+    """What on_chat_start and the first on_message do with a new compressor"""
+    compressor = SmartHistoryCompressor(compression_model=None, user_id="ANA")
+    manager.attach(key, compressor)
+    asyncio.run(manager.activate(key, compressor))
+    return compressor
+
+
+def test_same_name_in_another_conversation_starts_empty(tmp_path):
+    manager = make_manager(tmp_path)
+    ana = start_chat(manager, session_key("ANA", "pro1", "thread-ana"))
+    asyncio.run(ana.add_exchange("Kaj je rekurzija?", "Funkcija, ki kliče samo sebe."))
+
+    # A classmate logs in as ANA with the shared code - new Chainlit thread, nothing restored
+    classmate = start_chat(manager, session_key("ANA", "pro1", "thread-classmate"))
+    assert classmate.raw_history == []
+    assert classmate.compressed_history == ""
+    # ...and Ana's conversation stays loaded and untouched
+    assert len(ana.raw_history) == 1
+
+
+def test_reconnect_restores_the_same_conversation(tmp_path):
+    manager = make_manager(tmp_path)
+    key = session_key("ANA", "pro1", "thread-ana")
+    ana = start_chat(manager, key)
+    asyncio.run(ana.add_exchange("Kaj je rekurzija?", "Funkcija, ki kliče samo sebe."))
+    manager.release(key, ana)
+
+    restored = start_chat(manager, key)
+    assert [ex["question"] for ex in restored.raw_history] == ["Kaj je rekurzija?"]
@@ -4,11 +4,38 @@ import argparse
 from pathlib import Path
 from config import Config
 from rag import RAG
+from ingest import ingest_stream
+from chunking import chunking_stats
+
+def build_sparse_index(rag, collection_name):
+    """Rebuild the BM25 index used by modes with "retrieval": {"mode": "hybrid"}"""
+    stats = rag.build_sparse_index(collection_name)
+    print(f"BM25 index: {stats['chunks']} chunks, {stats['terms']} terms ({stats['seconds']}s)")
+
+def build_vector_index(rag, collection_name):
+    """Export the collection to the NumPy index searched with VECTOR_BACKEND=embedded"""
+    stats = rag.build_vector_index(collection_name)
+    print(f"Vector index: {stats['vectors']} vectors, {stats['vector_mb']} MB ({stats['seconds']}s)")
+
+def print_collection_change(before, after):
+    """Vector count and estimated vector index size before and after the update"""
+    def describe(stats):
+        if stats is None:
+            return "empty"
+        size_mb = stats["vectors"] * (stats["dimension"] or 0) * 4 / (1024 * 1024)
+        return f"{stats['vectors']} vectors ({size_mb:.2f} MB)"
+    print(f"Collection: {describe(before)} -> {describe(after)}")
 
 def main():
     parser = argparse.ArgumentParser(description='Update RAG collection with texts from JSON file')
     parser.add_argument('filename', help='Path to JSON file containing array of texts')
     parser.add_argument('collection_name', help='Name of the collection to update')
+    parser.add_argument('--full', action='store_true', help='Drop and rebuild the whole collection instead of updating changed chunks')
+    parser.add_argument('--stream', action='store_true', help='Stream a large .json/.jsonl file through the parallel ingestion pipeline (resumable)')
+    parser.add_argument('--workers', type=int, default=4, help='Chunking processes for --stream')
+    parser.add_argument('--batch-size', type=int, default=64, help='Chunks per embedding batch and upload for --stream')
+    parser.add_argument('--uploads', type=int, default=4, help='Parallel uploads to Qdrant for --stream')
+    parser.add_argument('--vector-index', action='store_true', help='Also export the embedded vector index (always done with VECTOR_BACKEND=embedded)')
     
     args = parser.parse_args()
     
@@ -18,6 +45,34 @@ def main():
         print(f"Error: File '{args.filename}' not found!")
         sys.exit(1)
     
+    if args.stream:
+        try:
+            rag = RAG(
+                qdrant_url=Config.QDRANT_URL,
+                embedding_model=Config.EMBEDDING_MODEL,
+                llama_model=Config.DEFAULT_LLAMA_MODEL
+            )
+            before = rag.collection_stats(args.collection_name)
+            stats = ingest_stream(
+                rag,
+                file_path,
+                args.collection_name,
+                recreate=args.full,
+                embed_batch_size=args.batch_size,
+                workers=args.workers,
+                upload_concurrency=args.uploads
+            )
+            print(f"Streamed {stats['texts']} texts / {stats['chunks']} chunks into '{args.collection_name}' "
+                  f"in {stats['seconds']}s ({stats['chunks_per_second']} chunks/s)")
+            print_collection_change(before, rag.collection_stats(args.collection_name))
+            build_sparse_index(rag, args.collection_name)
+            if args.vector_index or Config.VECTOR_BACKEND == "embedded":
+                build_vector_index(rag, args.collection_name)
+        except Exception as e:
+            print(f"Error updating RAG collection: {e}")
+            sys.exit(1)
+        return
+
     # Load JSON
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -47,10 +102,23 @@ def main():
         )
         
         print(f"Adding {len(texts)} documents to collection '{args.collection_name}'...")
+        chunks = rag.split_documents(texts)
+        chunk_stats = chunking_stats(list(chunks.values()), rag.dimension)
+        print(f"Chunking ({Config.CHUNKING}): {chunk_stats['vectors']} chunks, {chunk_stats['avg_chars']} chars on average, "
+              f"{chunk_stats['broken_code_blocks']} cut through a code block")
+        before = rag.collection_stats(args.collection_name)
         
-        rag.dodaj(text_array=texts, collection_name=args.collection_name, force_recreate = True)
-        
+        if args.full:
+            stats = rag.dodaj(text_array=texts, collection_name=args.collection_name, force_recreate = True)
+        else:
+            stats = rag.posodobi(text_array=texts, collection_name=args.collection_name)
+
+        print(f"Chunks added: {stats['added']}, skipped: {stats['skipped']}, deleted: {stats['deleted']} ({stats['seconds']}s)")
         print(f"Successfully updated collection '{args.collection_name}' with {len(texts)} documents!")
+        print_collection_change(before, rag.collection_stats(args.collection_name))
+        build_sparse_index(rag, args.collection_name)
+        if args.vector_index or Config.VECTOR_BACKEND == "embedded":
+            build_vector_index(rag, args.collection_name)
         
             
     except Exception as e:
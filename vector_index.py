@@ -0,0 +1,149 @@
+import os
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain.docstore.document import Document
+
+# qdrant: Qdrant server at QDRANT_URL
+# qdrant-local: Qdrant's embedded on-disk mode in QDRANT_PATH (no server, one process at a time)
+# embedded: chat servers search a memory-mapped NumPy matrix exported by update_rag.py
+VECTOR_BACKENDS = ("qdrant", "qdrant-local", "embedded")
+
+
+class VectorIndex:
+    def __init__(self):
+        """
+        Exact cosine search over the chunks of one collection, in-process.
+
+        Vectors are L2-normalized float32 rows of a .npy matrix that is memory-mapped
+        read-only, so several chat processes share one copy in the page cache. Ids,
+        texts and metadata live in a JSON file next to it. Like the BM25 index it is
+        built by update_rag.py from the live collection; chat servers only load it.
+        """
+        self.collection = None
+        self.built_at = None
+        self._ids = []
+        self._documents = []
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def dimension(self) -> int:
+        return self._vectors.shape[1]
+
+    def build(self, points: Iterable[Tuple[str, Document, Sequence[float]]], collection: Optional[str] = None) -> "VectorIndex":
+        """Index (point id, Document, vector) triples, e.g. scrolled from the Qdrant collection"""
+        ids, documents, vectors = [], [], []
+        for point_id, doc, vector in points:
+            ids.append(str(point_id))
+            documents.append(doc)
+            vectors.append(vector)
+        matrix = np.asarray(vectors, dtype=np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._vectors = matrix / np.where(norms == 0, 1, norms)
+        self._ids = ids
+        self._documents = documents
+        self.collection = collection
+        self.built_at = time.time()
+        return self
+
+    def search(self, embedding: Sequence[float], k: int = 3) -> List[Tuple[Document, float]]:
+        """Top k chunks by cosine similarity, best first"""
+        if not self._ids or k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self._vectors @ query
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        # Ties broken by position, which is the order of the collection
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(self._document(index), float(scores[index])) for index in top]
+
+    def _document(self, index: int) -> Document:
+        doc = self._documents[index]
+        metadata = dict(doc.metadata)
+        metadata["_id"] = self._ids[index]
+        if self.collection:
+            metadata["_collection_name"] = self.collection
+        return Document(page_content=doc.page_content, metadata=metadata)
+
+    def save(self, path: str) -> None:
+        """
+        Write the matrix to a new path.<build>.npy, then point path.json at it (tmp file + rename).
+
+        A loading server always gets a matrix and metadata of the same build; the
+        matrix of the previous build is kept for servers that still have it mapped.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        vectors_file = f"{path}.{int(self.built_at * 1000)}.npy"
+        np.save(vectors_file, np.ascontiguousarray(self._vectors, dtype=np.float32))
+
+        previous = None
+        if os.path.exists(f"{path}.json"):
+            try:
+                with open(f"{path}.json", "r", encoding="utf-8") as f:
+                    previous = json.load(f).get("vectors_file")
+            except (OSError, ValueError):
+                pass
+
+        data = {
+            "collection": self.collection,
+            "built_at": self.built_at,
+            "rows": len(self._ids),
+            "dimension": int(self._vectors.shape[1]),
+            "vectors_file": os.path.basename(vectors_file),
+            "documents": [
+                {"id": point_id, "page_content": doc.page_content, "metadata": doc.metadata}
+                for point_id, doc in zip(self._ids, self._documents)
+            ],
+        }
+        tmp_file = f"{path}.json.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_file, f"{path}.json")
+
+        # Older builds than the previous one are not mapped by anyone any more
+        keep = {os.path.basename(vectors_file), previous}
+        prefix = os.path.basename(path) + "."
+        for name in os.listdir(directory or "."):
+            if name.startswith(prefix) and name.endswith(".npy") and name not in keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass  # Still mapped (Windows), removed by a later build
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            data = json.load(f)
+        vectors = np.load(os.path.join(os.path.dirname(path), data["vectors_file"]), mmap_mode="r")
+        if vectors.shape != (data["rows"], data["dimension"]):
+            raise ValueError(f"{data['vectors_file']} has shape {vectors.shape}, expected ({data['rows']}, {data['dimension']})")
+
+        index = cls()
+        index.collection = data.get("collection")
+        index.built_at = data.get("built_at")
+        index._vectors = vectors
+        for entry in data["documents"]:
+            index._ids.append(entry["id"])
+            index._documents.append(Document(page_content=entry["page_content"], metadata=entry.get("metadata") or {}))
+        return index
+
+    def get_stats(self) -> Dict:
+        return {
+            "collection": self.collection,
+            "vectors": len(self._ids),
+            "dimension": self.dimension if self._ids else 0,
+            "vector_mb": round(self._vectors.nbytes / (1024 * 1024), 3),
+        }